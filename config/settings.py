@@ -48,11 +48,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # Первым: замеры учитывают все остальные слои (orders.instrumentation)
+    'orders.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware без перехода в поток под ASGI (orders.middleware)
+    'orders.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -147,18 +150,72 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Отдача сканов (orders.downloads): MEDIA_URL не публикуется, сканы отдает
+# представление orders:order_scan после проверки прав.
+# django — файл отдает Django (Range, ETag); nginx — X-Accel-Redirect на
+# internal-location SCAN_ACCEL_PREFIX; sendfile — X-Sendfile (Apache, lighttpd)
+SCAN_SERVE_MODE = os.getenv('SCAN_SERVE_MODE', 'django')
+SCAN_ACCEL_PREFIX = os.getenv('SCAN_ACCEL_PREFIX', '/protected-media/')
+
+# Текст сканов для поиска (orders.scan_text, manage.py extract_scan_text).
+# SCAN_OCR_BACKEND — путь к функции распознавания для сканов без текстового
+# слоя: функция принимает путь к PDF и возвращает текст. Встроенная
+# orders.scan_text.tesseract_ocr вызывает tesseract с языками SCAN_OCR_LANGUAGES.
+# Пусто — сканы без текстового слоя в поиск не попадают.
+SCAN_OCR_BACKEND = os.getenv('SCAN_OCR_BACKEND', '')
+SCAN_OCR_LANGUAGES = os.getenv('SCAN_OCR_LANGUAGES', 'rus+eng')
+
 LOGIN_REDIRECT_URL = 'orders:index'
 
 JSON_FILES_DIR = os.path.join(BASE_DIR, 'json')
 
 # Настройки кеширования
+# default — двухуровневый кеш (orders.cache.TieredCache): LRU в памяти процесса
+# перед общим кешем 'shared', который видят все процессы. Общий кеш по
+# умолчанию файловый; для Redis задайте в .env
+# CACHE_BACKEND='django.core.cache.backends.redis.RedisCache' и
+# CACHE_LOCATION='redis://127.0.0.1:6379/1'.
 CACHES = {
     'default': {
-        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
-        'LOCATION': 'orders_cache_table', # Имя таблицы для кеша
-    }
+        'BACKEND': 'orders.cache.TieredCache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'SHARED_CACHE': 'shared',
+            'LOCAL_MAX_ENTRIES': int(os.getenv('CACHE_LOCAL_MAX_ENTRIES', '1000')),
+            'LOCAL_TIMEOUT': int(os.getenv('CACHE_LOCAL_TIMEOUT', '30')),  # сек.
+            # Версии пространств имен (инвалидация кеша реестра) в памяти процесса, сек.
+            'NAMESPACE_TIMEOUT': float(os.getenv('CACHE_NAMESPACE_TIMEOUT', '1')),
+        },
+    },
+    'shared': {
+        'BACKEND': os.getenv('CACHE_BACKEND', 'django.core.cache.backends.filebased.FileBasedCache'),
+        'LOCATION': os.getenv('CACHE_LOCATION', str(BASE_DIR / 'cache')),
+        'TIMEOUT': 300,
+    },
+    # Кеш результатов фильтра реестра (orders.result_cache): id приказов страницы.
+    # Запись занимает ~1-2 КБ; при превышении MAX_ENTRIES вытесняются давно не
+    # использованные. Устаревшие записи сбрасывает версия реестра, TIMEOUT — страховка.
+    'registry': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'orders-registry',
+        'TIMEOUT': int(os.getenv('REGISTRY_CACHE_TIMEOUT', '3600')),  # сек.
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv('REGISTRY_CACHE_MAX_ENTRIES', '2000')),
+            'CULL_FREQUENCY': 4,
+        },
+    },
 }
 
+# Замеры запросов (orders.instrumentation): время БД/шаблонов/Python,
+# число и повторы запросов к БД по представлениям, профили cProfile
+INSTRUMENTATION_ENABLED = os.getenv('INSTRUMENTATION_ENABLED', 'False') == 'True'
+# Доля запросов, выполняемых под cProfile (например, 0.01 — каждый сотый)
+INSTRUMENTATION_PROFILE_RATE = float(os.getenv('INSTRUMENTATION_PROFILE_RATE', '0'))
+INSTRUMENTATION_PROFILE_KEEP = 200  # Сколько последних профилей хранить
+INSTRUMENTATION_FLUSH_INTERVAL = 10  # сек.
+INSTRUMENTATION_SLOW_MS = int(os.getenv('INSTRUMENTATION_SLOW_MS', '500'))
+INSTRUMENTATION_SERVER_TIMING = DEBUG
+
 # Настройки приложения
 ORGANIZATION_NAME = os.environ.get(
     'ORGANIZATION_NAME',
@@ -186,20 +243,35 @@ LOGGING = {
 
     # 2. Обработчики
     'handlers': {
-        'daily_file': {
-            'class': 'logging.handlers.TimedRotatingFileHandler',
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'detailed'
+        },
+        # Файл и консоль через очередь: запрос не ждет форматирования и записи
+        # на диск (orders.audit_logging)
+        'audit': {
+            '()': 'orders.audit_logging.AuditQueueHandler',
             # Базовое имя файла, который будет содержать все текущие логи.
             # Ротированные файлы будут выглядеть так: logs/orders_logs.log.2025-11-11
             'filename': BASE_DIR / 'logs/orders_logs.log',
             'when': 'midnight',  # Ротация происходит каждый день в полночь
-            'interval': 1,
-            'backupCount': 30,  # Хранить логи за 30 дней
+            'backup_count': 30,  # Хранить логи за 30 дней
+            'console': True,
+            'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+            'batch_size': 200,
+            # drop — при переполнении очереди записи INFO отбрасываются,
+            # block — ждут место в очереди до 50 мс
+            'overflow': os.getenv('LOG_QUEUE_OVERFLOW', 'drop'),
             'formatter': 'detailed',
-            'encoding': 'utf-8',
         },
-        'console': {
-            'class': 'logging.StreamHandler',
-            'formatter': 'detailed'
+        # Структурированные события (orders.audit) — в таблицу AuditEvent пачками
+        'audit_events': {
+            '()': 'orders.audit_logging.AuditQueueHandler',
+            'console': False,
+            'database': True,
+            'queue_size': int(os.getenv('LOG_QUEUE_SIZE', '10000')),
+            'batch_size': 500,
+            'overflow': os.getenv('LOG_QUEUE_OVERFLOW', 'drop'),
         },
     },
 
@@ -207,25 +279,31 @@ LOGGING = {
     'loggers': {
         # Логгер для всего приложения
         'orders_app': {
-            'handlers': ['console'] if DEBUG else ['daily_file', 'console'],
+            'handlers': ['console'] if DEBUG else ['audit'],
             'level': 'INFO',
             'propagate': False,
         },
         # Логгер для отслеживания действий пользователя
         'user_actions_logger': {
-            'handlers': ['console'] if DEBUG else ['daily_file', 'console'],
+            'handlers': ['console'] if DEBUG else ['audit'],
             'level': 'INFO',
             'propagate': False,
         },
         # Логгер для Django
         'django': {
-            'handlers': ['console'] if DEBUG else ['daily_file', 'console'],
+            'handlers': ['console'] if DEBUG else ['audit'],
             'level': 'INFO',
             'propagate': True,
          },
+        # Журнал действий в БД: пишется и при DEBUG=True
+        'audit_events': {
+            'handlers': ['audit_events'],
+            'level': 'INFO',
+            'propagate': False,
+        },
         # Используем логгер 'orders' для критических ошибок
         'orders': {
-            'handlers': ['console'] if DEBUG else ['daily_file', 'console'],
+            'handlers': ['console'] if DEBUG else ['audit'],
             'level': 'WARNING',
             'propagate': False,
         },
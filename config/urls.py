@@ -14,8 +14,6 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
-from django.conf import settings
-from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
@@ -23,4 +21,5 @@ urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('orders.urls', namespace='orders')),
     path('accounts/', include('django.contrib.auth.urls')),  # Добавляем стандартные маршруты для auth
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+# Медиафайлы не публикуются: сканы отдает orders:order_scan с проверкой прав
@@ -0,0 +1,49 @@
+"""
+Структурированный журнал действий пользователей.
+
+audit_event() не обращается к БД в потоке запроса: событие уходит в
+логгер 'audit_events', обработчик которого (orders.audit_logging) копит
+события в очереди и сохраняет их в AuditEvent пачками. Выборки по журналу —
+команда manage.py audit_events.
+"""
+import logging
+
+from orders.models import AuditEvent
+
+audit_logger = logging.getLogger('audit_events')
+
+
+def get_username(user):
+    if hasattr(user, 'is_authenticated'):
+        return user.get_username() if user.is_authenticated else ''
+    return user or ''
+
+
+def audit_event(user, action, order_id=None, **params):
+    """
+    Записывает событие. user — пользователь Django или имя пользователя,
+    action — одна из констант AuditEvent.ACTION_*, params — JSON-совместимые
+    подробности (параметры фильтра, поля экспорта и т.п.).
+    """
+    audit_logger.info(action, extra={'audit': {
+        'username': get_username(user),
+        'action': action,
+        'order_id': order_id,
+        'params': params,
+    }})
+
+
+def save_events(user, events):
+    """
+    Сохраняет пакет событий одного пользователя одним INSERT (события
+    интерфейса, которые браузер присылает пачкой). events — словари с
+    ключами action, params и, при необходимости, created_at и order_id.
+    """
+    username = get_username(user)
+    AuditEvent.objects.bulk_create(AuditEvent(username=username, **event) for event in events)
+
+
+async def asave_events(user, events):
+    """Асинхронный вариант save_events."""
+    username = get_username(user)
+    await AuditEvent.objects.abulk_create([AuditEvent(username=username, **event) for event in events])
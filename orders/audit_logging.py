@@ -0,0 +1,234 @@
+"""
+Асинхронная запись журнала действий пользователей.
+
+Представления только кладут запись (LogRecord с неотформатированными
+аргументами) в ограниченную очередь. Форматирование и запись в файл и
+консоль выполняет отдельный поток-слушатель, который забирает записи
+пачками и пишет каждую пачку в файл одним вызовом write/flush.
+Структурированные события (orders.audit) тем же способом сохраняются в
+таблицу AuditEvent — одним INSERT на пачку.
+
+Если очередь переполнена (диск не успевает за потоком событий), записи
+уровня INFO отбрасываются (overflow='drop') или ждут места не дольше
+block_timeout (overflow='block'); WARNING и выше всегда ждут block_timeout.
+Число потерянных записей попадает в журнал отдельным предупреждением.
+"""
+import logging
+import os
+import queue
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+OVERFLOW_DROP = 'drop'
+OVERFLOW_BLOCK = 'block'
+
+
+class BatchingFileHandler(TimedRotatingFileHandler):
+    """TimedRotatingFileHandler, который умеет записать пачку записей за одну операцию."""
+
+    def emit_batch(self, records):
+        self.acquire()
+        try:
+            if self.shouldRollover(records[-1]):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(''.join(self.format(record) + self.terminator for record in records))
+            self.flush()
+        except Exception:
+            self.handleError(records[-1])
+        finally:
+            self.release()
+
+
+class AuditEventHandler(logging.Handler):
+    """
+    Сохраняет структурированные события (extra={'audit': {...}}, см. orders.audit)
+    в таблицу AuditEvent: одна пачка записей — один INSERT.
+    """
+
+    def emit(self, record):
+        self.emit_batch([record])
+
+    def emit_batch(self, records):
+        # Модели импортируются здесь: обработчик создается при настройке
+        # LOGGING, до загрузки приложений Django
+        from django.db import connection
+        from orders.models import AuditEvent
+
+        events = [
+            AuditEvent(created_at=datetime.fromtimestamp(record.created, tz=timezone.utc),
+                       **record.audit)
+            for record in records if hasattr(record, 'audit')
+        ]
+        if not events:
+            return
+        try:
+            AuditEvent.objects.bulk_create(events)
+        except Exception:
+            self.handleError(records[-1])
+            # Следующая пачка откроет новое соединение
+            connection.close()
+
+
+class BatchingQueueListener(QueueListener):
+    """QueueListener, который передает обработчикам записи пачками до batch_size штук."""
+
+    def __init__(self, queue_, *handlers, batch_size=200, respect_handler_level=True):
+        super().__init__(queue_, *handlers, respect_handler_level=respect_handler_level)
+        self.batch_size = batch_size
+
+    def handle_batch(self, records):
+        for handler in self.handlers:
+            if self.respect_handler_level:
+                batch = [record for record in records if record.levelno >= handler.level]
+            else:
+                batch = records
+            if not batch:
+                continue
+            if hasattr(handler, 'emit_batch'):
+                handler.emit_batch(batch)
+            else:
+                for record in batch:
+                    handler.handle(record)
+
+    def _monitor(self):
+        q = self.queue
+        stop = False
+        while not stop:
+            # Ждем первую запись, остальные забираем без ожидания
+            batch = [self.dequeue(True)]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.dequeue(False))
+                except queue.Empty:
+                    break
+            stop = any(record is self._sentinel for record in batch)
+            records = [record for record in batch if record is not self._sentinel]
+            if records:
+                self.handle_batch(records)
+            for _ in batch:
+                q.task_done()
+
+    def enqueue_sentinel(self):
+        # Очередь может быть заполнена: при остановке ждем места
+        self.queue.put(self._sentinel)
+
+
+class AuditQueueHandler(QueueHandler):
+    """
+    Обработчик для LOGGING (через '()'): очередь и поток-слушатель с
+    обработчиками файла (ротация в полночь), консоли и таблицы AuditEvent.
+
+    Поток запускается при первой записи в каждом процессе, поэтому
+    обработчик корректно работает и в воркерах Gunicorn после fork.
+    """
+
+    def __init__(self, filename=None, when='midnight', backup_count=30, encoding='utf-8',
+                 console=True, database=False, queue_size=10000, batch_size=200,
+                 overflow=OVERFLOW_DROP, block_timeout=0.05):
+        super().__init__(queue.Queue(queue_size))
+        if overflow not in (OVERFLOW_DROP, OVERFLOW_BLOCK):
+            raise ValueError(f'Неизвестная политика переполнения очереди журнала: {overflow}')
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+
+        self.targets = []
+        if filename:
+            self.targets.append(BatchingFileHandler(
+                filename, when=when, backupCount=backup_count, encoding=encoding, delay=True))
+        if console:
+            self.targets.append(logging.StreamHandler())
+        if database:
+            self.targets.append(AuditEventHandler())
+
+        self.listener = None
+        self._listener_pid = None
+        self._start_lock = threading.Lock()
+        self._dropped = 0
+        self._dropped_lock = threading.Lock()
+
+    def setFormatter(self, fmt):
+        # Формат задается в LOGGING для этого обработчика, а применяют его целевые
+        super().setFormatter(fmt)
+        for target in self.targets:
+            target.setFormatter(fmt)
+
+    def _ensure_listener(self):
+        if self._listener_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._listener_pid == os.getpid():
+                return
+            if self._listener_pid is not None:
+                # Процесс получен fork-ом: поток слушателя остался в родителе,
+                # а очередь могла скопироваться с захваченными блокировками
+                self.queue = queue.Queue(self.queue_size)
+            self.listener = BatchingQueueListener(
+                self.queue, *self.targets, batch_size=self.batch_size)
+            self.listener.start()
+            self._listener_pid = os.getpid()
+
+    def prepare(self, record):
+        # В отличие от QueueHandler.prepare запись не форматируется здесь:
+        # сообщение с аргументами соберет поток слушателя
+        return record
+
+    def enqueue(self, record):
+        blocking = self.overflow == OVERFLOW_BLOCK or record.levelno >= logging.WARNING
+        try:
+            if blocking:
+                self.queue.put(record, timeout=self.block_timeout)
+            else:
+                self.queue.put_nowait(record)
+        except queue.Full:
+            with self._dropped_lock:
+                self._dropped += 1
+            return
+
+        if self._dropped:
+            with self._dropped_lock:
+                dropped, self._dropped = self._dropped, 0
+            if dropped:
+                warning = logging.LogRecord(
+                    record.name, logging.WARNING, __file__, 0,
+                    'Очередь журнала переполнена: потеряно записей: %d', (dropped,), None)
+                try:
+                    self.queue.put_nowait(warning)
+                except queue.Full:
+                    with self._dropped_lock:
+                        self._dropped += dropped
+
+    def handle(self, record):
+        # Очередь потокобезопасна: блокировка обработчика, которую берет
+        # Handler.handle, только выстраивала бы потоки запросов друг за другом
+        rv = self.filter(record)
+        if isinstance(rv, logging.LogRecord):
+            record = rv
+        if rv:
+            self.emit(record)
+        return rv
+
+    def emit(self, record):
+        try:
+            self._ensure_listener()
+            self.enqueue(self.prepare(record))
+        except Exception:
+            self.handleError(record)
+
+    def flush(self):
+        """Дожидается записи всего, что уже поставлено в очередь."""
+        if self.listener is not None and self._listener_pid == os.getpid():
+            self.queue.join()
+
+    def close(self):
+        if self.listener is not None and self._listener_pid == os.getpid():
+            self.listener.stop()
+            self.listener = None
+            self._listener_pid = None
+        for target in self.targets:
+            target.close()
+        super().close()
@@ -0,0 +1,124 @@
+"""
+Вспомогательные функции для команд-бенчмарков (manage.py benchmark_*).
+
+Здесь собраны генератор синтетических приказов (и их сканов) и замер
+времени, чтобы все бенчмарки считали одинаково и их результаты можно было
+сравнивать.
+"""
+import math
+import random
+import re
+import statistics
+import time
+from datetime import date, timedelta
+
+from orders.models import Order
+
+# Номер вида "001-к": числовая часть и буквенный суффикс
+DOC_NUMBER_RE = re.compile(r'^(\d+)-')
+
+TITLE_SUBJECTS = [
+    'О проведении', 'Об утверждении', 'О назначении', 'О предоставлении',
+    'Об организации', 'О внесении изменений в', 'О создании', 'О премировании',
+    'О направлении в командировку', 'Об изменении штатного расписания',
+]
+TITLE_OBJECTS = [
+    'плана работы на год', 'положения о подразделении', 'ответственного лица',
+    'ежегодного отпуска сотрудника', 'инвентаризации имущества',
+    'учебных сборов', 'комиссии по охране труда', 'графика дежурств',
+    'мероприятий по гражданской обороне', 'порядка документооборота',
+]
+SIGNERS = ['Иванов И.И.', 'Петров П.П.', 'Сидоров С.С.', 'Кузнецова А.В.']
+EXECUTORS = ['Отдел кадров', 'Бухгалтерия', 'Юридический отдел', 'Канцелярия']
+
+
+def number_offsets():
+    """
+    Наибольший номер документа в каждом (году, виде) реестра: synthetic_orders
+    продолжает нумерацию после него и не нарушает уникальность (вид, номер, год).
+    """
+    offsets = {}
+    rows = Order.objects.values_list('issue_year', 'doc_type', 'document_number')
+    for year, doc_type, number in rows.iterator(chunk_size=10000):
+        match = DOC_NUMBER_RE.match(number)
+        if match:
+            key = (year, doc_type)
+            offsets[key] = max(offsets.get(key, 0), int(match.group(1)))
+    return offsets
+
+
+def synthetic_orders(count, start_year=2000, years=25, seed=None, offsets=None):
+    """
+    Генерирует count несохраненных объектов Order с правдоподобными данными.
+
+    Номера нумеруются заново в каждом году и виде документа, как в реальном
+    реестре ("001-к" приказы, "001-р" распоряжения); offsets (см.
+    number_offsets) — номера, после которых продолжать нумерацию.
+    """
+    rnd = random.Random(seed)
+    counters = dict(offsets or {})
+    first_day = date(start_year, 1, 1)
+    for _ in range(count):
+        issue_date = first_day + timedelta(days=rnd.randrange(years * 365))
+        doc_type = Order.DOC_TYPE_ORDER if rnd.random() < 0.7 else Order.DOC_TYPE_DECREE
+        key = (issue_date.year, doc_type)
+        counters[key] = counters.get(key, 0) + 1
+        suffix = 'к' if doc_type == Order.DOC_TYPE_ORDER else 'р'
+        yield Order(
+            doc_type=doc_type,
+            document_number=f'{counters[key]:03d}-{suffix}',
+            issue_date=issue_date,
+            document_title=f'{rnd.choice(TITLE_SUBJECTS)} {rnd.choice(TITLE_OBJECTS)}',
+            signed_by=rnd.choice(SIGNERS),
+            responsible_executor=rnd.choice(EXECUTORS),
+            note='',
+        )
+
+
+def percentile(values, percent):
+    """Перцентиль по методу ближайшего ранга."""
+    ordered = sorted(values)
+    index = max(math.ceil(percent * len(ordered) / 100) - 1, 0)
+    return ordered[min(index, len(ordered) - 1)]
+
+
+def measure(func, repeat=10, warmup=1):
+    """Запускает func repeat раз и возвращает статистику времени в мс."""
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'p95': percentile(timings, 95),
+        'p99': percentile(timings, 99),
+        'max': max(timings),
+    }
+
+
+def synthetic_pdf(text):
+    """Минимальный корректный одностраничный PDF с текстом (латиница/цифры)."""
+    content = f'BT /F1 14 Tf 72 760 Td ({text}) Tj ET'.encode('latin-1', 'replace')
+    objects = [
+        b'<< /Type /Catalog /Pages 2 0 R >>',
+        b'<< /Type /Pages /Kids [3 0 R] /Count 1 >>',
+        b'<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] '
+        b'/Contents 4 0 R /Resources << /Font << /F1 5 0 R >> >> >>',
+        b'<< /Length %d >>\nstream\n%s\nendstream' % (len(content), content),
+        b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>',
+    ]
+    output = bytearray(b'%PDF-1.4\n')
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b'%d 0 obj\n%s\nendobj\n' % (number, body)
+    xref = len(output)
+    output += b'xref\n0 %d\n0000000000 65535 f \n' % (len(objects) + 1)
+    for offset in offsets:
+        output += b'%010d 00000 n \n' % offset
+    output += b'trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (len(objects) + 1, xref)
+    return bytes(output)
@@ -0,0 +1,292 @@
+"""
+Двухуровневый кеш: ограниченный LRU в памяти процесса перед общим кешем.
+
+Общий уровень — любой кеш из CACHES (файловый по умолчанию или Redis),
+его видят все процессы Gunicorn. Локальный уровень отвечает без обращения
+к общему, поэтому записи в нем живут недолго (LOCAL_TIMEOUT): изменения,
+сделанные другим процессом, видны не позже чем через это время.
+
+В памяти процесса хранятся только записи с явно переданной версией
+(version= — версия пространства имен): их не удаляют, а делают
+недействительными увеличением версии. Ключи без версии (сессии, счетчики
+лимитов и все, что удаляется delete() или меняется incr()) читаются и
+пишутся только в общем кеше, иначе другие процессы еще LOCAL_TIMEOUT
+секунд видели бы удаленное или старое значение.
+
+Для инвалидации целых групп ключей служат версии пространств имен
+(namespace_version/bump_namespace): номер версии хранится в общем кеше и
+входит в ключ, поэтому после увеличения версии старые записи во всех
+процессах перестают находиться и вытесняются по LRU/TTL. Процесс держит
+прочитанную версию в памяти NAMESPACE_TIMEOUT секунд, чтобы не обращаться
+к общему кешу на каждый запрос: в процессе, увеличившем версию, она
+меняется сразу, в остальных — не позже чем через это время.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+# Префикс ключей версий пространств имен в общем кеше
+NAMESPACE_KEY_PREFIX = 'namespace-version'
+
+
+class TieredCache(BaseCache):
+    """
+    Бэкенд кеша Django.
+
+    OPTIONS:
+        SHARED_CACHE — алиас общего кеша в CACHES (по умолчанию 'shared');
+        LOCAL_MAX_ENTRIES — сколько записей держать в памяти процесса (1000);
+        LOCAL_TIMEOUT — сколько секунд запись живет в памяти процесса (30);
+        NAMESPACE_TIMEOUT — сколько секунд версия пространства имен живет в
+        памяти процесса (1).
+    """
+
+    def __init__(self, location, params):
+        options = params.get('OPTIONS', {})
+        self._shared_alias = options.get('SHARED_CACHE', 'shared')
+        self._local_max_entries = int(options.get('LOCAL_MAX_ENTRIES', 1000))
+        self._local_timeout = float(options.get('LOCAL_TIMEOUT', 30))
+        self._namespace_timeout = float(options.get('NAMESPACE_TIMEOUT', 1))
+        # Остальные параметры (TIMEOUT, KEY_PREFIX, VERSION) обрабатывает BaseCache
+        params = {**params, 'OPTIONS': {}}
+        super().__init__(params)
+
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0}
+
+    @property
+    def shared(self):
+        return caches[self._shared_alias]
+
+    # --- Локальный уровень ---
+
+    def _local_get(self, key):
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            if entry[1] <= time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return entry
+
+    def _local_set(self, key, value, timeout):
+        # Запись в памяти не переживает запись в общем кеше
+        ttl = self._local_timeout if timeout is None else min(timeout, self._local_timeout)
+        if ttl <= 0:
+            self._local_delete(key)
+            return
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + ttl)
+            self._local.move_to_end(key)
+            while len(self._local) > self._local_max_entries:
+                self._local.popitem(last=False)
+
+    def _local_delete(self, key):
+        with self._lock:
+            return self._local.pop(key, None) is not None
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    # --- API кеша Django ---
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, self._timeout(timeout), version=self._version(version))
+        if added and version is not None:
+            self._local_set(self.make_and_validate_key(key, version), value, self._timeout(timeout))
+        return added
+
+    def get(self, key, default=None, version=None):
+        if version is None:
+            return self._shared_get(key, default)
+        local_key = self.make_and_validate_key(key, version)
+        entry = self._local_get(local_key)
+        if entry is not None:
+            self._count('local_hits')
+            return entry[0]
+
+        sentinel = object()
+        value = self._shared_get(key, sentinel, version)
+        if value is sentinel:
+            return default
+        self._local_set(local_key, value, self._local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        self.shared.set(key, value, timeout, version=self._version(version))
+        if version is not None:
+            self._local_set(self.make_and_validate_key(key, version), value, timeout)
+
+    def _shared_get(self, key, default, version=None):
+        sentinel = object()
+        value = self.shared.get(key, sentinel, version=self._version(version))
+        if value is sentinel:
+            self._count('misses')
+            return default
+        self._count('shared_hits')
+        return value
+
+    # Асинхронные варианты: попадание в локальный уровень обслуживается
+    # без перехода в поток, к общему кешу — его собственными a-методами
+
+    async def aget(self, key, default=None, version=None):
+        if version is not None:
+            local_key = self.make_and_validate_key(key, version)
+            entry = self._local_get(local_key)
+            if entry is not None:
+                self._count('local_hits')
+                return entry[0]
+
+        sentinel = object()
+        value = await self.shared.aget(key, sentinel, version=self._version(version))
+        if value is sentinel:
+            self._count('misses')
+            return default
+        self._count('shared_hits')
+        if version is not None:
+            self._local_set(local_key, value, self._local_timeout)
+        return value
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        await self.shared.aset(key, value, timeout, version=self._version(version))
+        if version is not None:
+            self._local_set(self.make_and_validate_key(key, version), value, timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, self._timeout(timeout), version=self._version(version))
+
+    def delete(self, key, version=None):
+        # Копии в памяти других процессов здесь не удалить; для ключей с
+        # версией это не нужно: их сбрасывает bump_namespace
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.delete(key, version=self._version(version))
+
+    def has_key(self, key, version=None):
+        if version is not None and self._local_get(self.make_and_validate_key(key, version)) is not None:
+            return True
+        return self.shared.has_key(key, version=self._version(version))
+
+    def incr(self, key, delta=1, version=None):
+        self._local_delete(self.make_and_validate_key(key, version))
+        return self.shared.incr(key, delta, version=self._version(version))
+
+    def clear(self):
+        self.clear_local()
+        self.shared.clear()
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def _timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def _version(self, version):
+        return self.version if version is None else version
+
+    # --- Версии пространств имен и статистика ---
+
+    @staticmethod
+    def _namespace_key(namespace):
+        # Ключи записей в памяти процесса начинаются с префикса и версии
+        # (make_key), поэтому с ними ключ версии не совпадет
+        return f'{NAMESPACE_KEY_PREFIX}:{namespace}'
+
+    def namespace_version(self, namespace):
+        """Текущая версия пространства имен: из памяти процесса или из общего кеша."""
+        key = self._namespace_key(namespace)
+        entry = self._local_get(key)
+        if entry is not None:
+            return entry[0]
+        version = self.shared.get(key)
+        if version is None:
+            self.shared.add(key, 1, timeout=None)
+            version = self.shared.get(key, 1)
+        self._local_set(key, version, self._namespace_timeout)
+        return version
+
+    async def anamespace_version(self, namespace):
+        key = self._namespace_key(namespace)
+        entry = self._local_get(key)
+        if entry is not None:
+            return entry[0]
+        version = await self.shared.aget(key)
+        if version is None:
+            await self.shared.aadd(key, 1, timeout=None)
+            version = await self.shared.aget(key, 1)
+        self._local_set(key, version, self._namespace_timeout)
+        return version
+
+    def bump_namespace(self, namespace):
+        """Делает недействительными все ключи пространства имен во всех процессах."""
+        key = self._namespace_key(namespace)
+        try:
+            version = self.shared.incr(key)
+        except ValueError:
+            # Ключа еще нет (или его вытеснили): начинаем с версии 2, чтобы
+            # не совпасть с версией 1 по умолчанию
+            version = 2
+            self.shared.set(key, version, timeout=None)
+        # Этот процесс видит новую версию сразу
+        self._local_set(key, version, self._namespace_timeout)
+        return version
+
+    def clear_local(self):
+        with self._lock:
+            self._local.clear()
+
+    def stats(self):
+        """Счетчики попаданий и промахов этого процесса."""
+        with self._lock:
+            stats = dict(self._stats, local_entries=len(self._local))
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = dict.fromkeys(self._stats, 0)
+
+
+def namespace_version(namespace, cache_alias='default'):
+    """
+    Версия пространства имен для параметра version= при работе с кешем.
+    С другими бэкендами (например, locmem в тестах) версия хранится в них же.
+    """
+    cache = caches[cache_alias]
+    if isinstance(cache, TieredCache):
+        return cache.namespace_version(namespace)
+    key = f'{NAMESPACE_KEY_PREFIX}:{namespace}'
+    cache.add(key, 1, timeout=None)
+    return cache.get(key, 1)
+
+
+async def anamespace_version(namespace, cache_alias='default'):
+    """Асинхронный вариант namespace_version для асинхронных представлений."""
+    cache = caches[cache_alias]
+    if isinstance(cache, TieredCache):
+        return await cache.anamespace_version(namespace)
+    key = f'{NAMESPACE_KEY_PREFIX}:{namespace}'
+    await cache.aadd(key, 1, timeout=None)
+    return await cache.aget(key, 1)
+
+
+def bump_namespace(namespace, cache_alias='default'):
+    """Инвалидирует все ключи пространства имен."""
+    cache = caches[cache_alias]
+    if isinstance(cache, TieredCache):
+        return cache.bump_namespace(namespace)
+    key = f'{NAMESPACE_KEY_PREFIX}:{namespace}'
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, timeout=None)
+        return 2
@@ -0,0 +1,200 @@
+"""
+Отдача защищенных файлов (сканов приказов).
+
+Файлы из MEDIA_ROOT не публикуются по MEDIA_URL: представление проверяет
+права, пишет журнал и передает саму передачу файла фронт-серверу
+(SCAN_SERVE_MODE):
+    'nginx'    — заголовок X-Accel-Redirect на internal-location
+                 SCAN_ACCEL_PREFIX (см. README, настройка Nginx);
+    'sendfile' — заголовок X-Sendfile с путем к файлу (Apache mod_xsendfile,
+                 lighttpd);
+    'django'   — файл отдает Django (FileResponse) с поддержкой Range,
+                 ETag/If-None-Match и If-Range: докачка и повторное открытие
+                 без передачи файла целиком.
+
+Blob-ы хранилища сканов названы по SHA-256 содержимого, поэтому он же
+служит сильным ETag без чтения файла.
+
+Под ASGI Django собирает синхронный потоковый ответ в память целиком, прежде
+чем отправить, поэтому потоковые ответы (файлы, экспорт) получают там
+асинхронный итератор (response_stream): части читаются по одной в потоке
+sync_to_async.
+"""
+import os
+import re
+from urllib.parse import quote
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from django.http import FileResponse, HttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_etags, quote_etag
+
+from orders.scan_store import is_blob_name
+
+SERVE_DJANGO = 'django'
+SERVE_NGINX = 'nginx'
+SERVE_SENDFILE = 'sendfile'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+STREAM_BLOCK_SIZE = 256 * 1024
+
+
+class RangeFile:
+    """Файл, из которого читается только length байт начиная с start."""
+
+    def __init__(self, file, start, length):
+        self.file = file
+        self.file.seek(start)
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+async def aiter_in_thread(iterator):
+    """
+    Асинхронный итератор поверх синхронного: каждая часть читается в потоке
+    sync_to_async. Потоки thread_sensitive одного запроса — один поток, поэтому
+    курсор БД в iterator остается на своем соединении.
+    """
+    next_part = sync_to_async(next)
+    done = object()
+    try:
+        while (part := await next_part(iterator, done)) is not done:
+            yield part
+    finally:
+        close = getattr(iterator, 'close', None)
+        if close is not None:
+            await sync_to_async(close)()
+
+
+def response_stream(request, iterator):
+    """Содержимое потокового ответа: под ASGI — асинхронный итератор, под WSGI — iterator."""
+    if isinstance(request, ASGIRequest):
+        return aiter_in_thread(iter(iterator))
+    return iterator
+
+
+def file_etag(name, stat):
+    """ETag: хеш содержимого для blob-а, иначе время изменения и размер."""
+    if is_blob_name(name):
+        return quote_etag(os.path.splitext(os.path.basename(name))[0])
+    return quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+
+
+def parse_range(header, size):
+    """
+    Диапазон из заголовка Range: (начало, конец включительно), None — отдать
+    файл целиком (нет заголовка, несколько диапазонов или другие единицы),
+    False — диапазон не пересекается с файлом (ответ 416).
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # bytes=-N — последние N байт
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def is_range_start(request):
+    """Запрос читает файл с начала (а не докачивает или листает PDF по частям)."""
+    header = request.headers.get('Range', '')
+    match = RANGE_RE.match(header.strip())
+    return match is None or match.group(1) == '0'
+
+
+def protected_file_response(request, name, filename, content_type='application/pdf',
+                            cache_control='private, no-cache'):
+    """
+    Ответ с файлом name (путь относительно MEDIA_ROOT) способом SCAN_SERVE_MODE.
+    Права и журнал проверяет вызывающее представление. По умолчанию браузер
+    хранит файл, но перед показом сверяет ETag (ответ 304 без тела).
+    """
+    path = os.path.join(settings.MEDIA_ROOT, name)
+    disposition = f"inline; filename*=UTF-8''{quote(os.path.basename(filename))}"
+
+    if settings.SCAN_SERVE_MODE == SERVE_NGINX:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.SCAN_ACCEL_PREFIX + quote(name)
+        response['Content-Disposition'] = disposition
+        response['Cache-Control'] = cache_control
+        return response
+    if settings.SCAN_SERVE_MODE == SERVE_SENDFILE:
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = os.path.abspath(path)
+        response['Content-Disposition'] = disposition
+        response['Cache-Control'] = cache_control
+        return response
+
+    stat = os.stat(path)
+    etag = file_etag(name, stat)
+    headers = {
+        'ETag': etag,
+        'Last-Modified': http_date(stat.st_mtime),
+        'Accept-Ranges': 'bytes',
+        'Cache-Control': cache_control,
+    }
+
+    not_modified = get_conditional_response(
+        request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        _set_headers(not_modified, headers)
+        return not_modified
+
+    byte_range = parse_range(request.headers.get('Range'), stat.st_size)
+    if_range = request.headers.get('If-Range')
+    if byte_range and if_range and etag not in parse_etags(if_range):
+        # Файл изменился с прошлой частичной загрузки — отдаем целиком
+        byte_range = None
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{stat.st_size}'
+        _set_headers(response, headers)
+        return response
+
+    file = open(path, 'rb')
+    if byte_range is None:
+        # Файл целиком: WSGI-сервер может отдать его через sendfile
+        response = FileResponse(file, content_type=content_type)
+    else:
+        start, end = byte_range
+        length = end - start + 1
+        response = FileResponse(RangeFile(file, start, length), content_type=content_type,
+                                status=206)
+        response['Content-Length'] = str(length)
+        response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+    response.block_size = STREAM_BLOCK_SIZE
+    if isinstance(request, ASGIRequest):
+        # Заголовки (Content-Length) и закрытие файла FileResponse уже настроил
+        response.streaming_content = response_stream(request, response.streaming_content)
+    response['Content-Disposition'] = disposition
+    _set_headers(response, headers)
+    return response
+
+
+def _set_headers(response, headers):
+    for header, value in headers.items():
+        response[header] = value
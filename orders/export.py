@@ -0,0 +1,378 @@
+"""
+Экспорт реестра приказов в XLSX, CSV и Parquet.
+
+Строки выбираются из БД порциями через серверный курсор
+(QuerySet.iterator(chunk_size=...)) и сразу превращаются в байты файла,
+поэтому расход памяти не зависит от числа выгружаемых приказов.
+"""
+import csv
+import io
+import re
+import zipfile
+from xml.sax.saxutils import escape
+
+from django.db.models import Case, CharField, F, Func, Value, When
+from django.db.models.functions import Coalesce
+
+from orders.models import Order
+
+EXPORT_FIELD_MAP = {
+    'doc_type': 'Вид документа',
+    'document_number': 'Номер документа',
+    'issue_date': 'Дата издания',
+    'document_title': 'Наименование документа',
+    'signed_by': 'Подписант',
+    'responsible_executor': 'Ответственный исполнитель',
+    'transferred_to_execution': 'Передан на исполнение',
+    'transferred_for_storage': 'Передан на хранение',
+    'heraldic_blank_number': 'Номер геральдического бланка',
+    'note': 'Примечание'
+}
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_CONTENT_TYPE = 'text/csv; charset=utf-8'
+PARQUET_CONTENT_TYPE = 'application/vnd.apache.parquet'
+
+# Размер порции строк, которую серверный курсор отдает за один FETCH
+EXPORT_CHUNK_SIZE = 2000
+
+DOC_TYPE_CHOICES = dict(Order.DOC_TYPE_CHOICES)
+
+# Формат даты для PostgreSQL to_char (соответствует '%d.%m.%Y')
+EXPORT_DATE_FORMAT = 'DD.MM.YYYY'
+
+
+def get_export_columns(selected_fields):
+    """Возвращает (заголовки, имена полей) в порядке EXPORT_FIELD_MAP."""
+    headers = []
+    field_names = []
+    for field_name, field_label in EXPORT_FIELD_MAP.items():
+        if field_name in selected_fields:
+            headers.append(field_label)
+            field_names.append(field_name)
+    return headers, field_names
+
+
+def export_expressions(field_names):
+    """
+    Выражения колонок экспорта, которые форматируют значения в самой БД:
+    дата — через to_char, вид документа — через CASE с русскими названиями,
+    NULL — пустой строкой. Ключи — имена аннотаций в порядке field_names.
+    """
+    expressions = {}
+    for name in field_names:
+        if name == 'issue_date':
+            value = Func(F(name), Value(EXPORT_DATE_FORMAT), function='to_char',
+                         output_field=CharField())
+        elif name == 'doc_type':
+            value = Case(
+                *[When(doc_type=code, then=Value(label)) for code, label in DOC_TYPE_CHOICES.items()],
+                default=F(name), output_field=CharField())
+        else:
+            value = F(name)
+        expressions[f'export_{name}'] = Coalesce(value, Value(''), output_field=CharField())
+    return expressions
+
+
+def iter_export_rows(queryset, field_names, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Отдает готовые к записи строки экспорта (кортежи строк), читая БД порциями.
+    Форматирование выполняет БД, в Python ячейки не обрабатываются.
+    """
+    expressions = export_expressions(field_names)
+    return (queryset
+            .annotate(**expressions)
+            .values_list(*expressions)
+            .iterator(chunk_size=chunk_size))
+
+
+# --- Потоковая запись XLSX ---
+# XLSX — это zip-архив с XML-частями. zipfile умеет писать в поток без
+# seek() (с дескрипторами данных после каждого файла), поэтому лист можно
+# отдавать клиенту по мере формирования, не собирая книгу в памяти.
+
+_XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Приказы" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '<Relationship Id="rId2" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+        'Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/styles.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/></cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+_SHEET_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+_SHEET_FOOTER = '</sheetData></worksheet>'
+
+# Управляющие символы, недопустимые в XML 1.0
+_ILLEGAL_XML_CHARS_RE = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+
+class _ChunkSink(io.RawIOBase):
+    """Неперематываемый приемник, из которого забираются записанные байты."""
+
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def pop(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def _xlsx_cell(value, style):
+    text = _ILLEGAL_XML_CHARS_RE.sub('', str(value))
+    if not text:
+        return '<c/>'
+    return (f'<c t="inlineStr"{style}><is><t xml:space="preserve">'
+            f'{escape(text)}</t></is></c>')
+
+
+def _xlsx_row(number, values, style=''):
+    cells = ''.join(_xlsx_cell(value, style) for value in values)
+    return f'<row r="{number}">{cells}</row>'
+
+
+def stream_xlsx(headers, rows, flush_every=500):
+    """
+    Генератор байтов XLSX-файла с одним листом.
+
+    Строки записываются как inline-строки (без общей таблицы строк), поэтому
+    в памяти одновременно находится только текущая порция сжатых данных.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, content in _XLSX_STATIC_PARTS.items():
+            archive.writestr(name, content)
+        yield sink.pop()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w', force_zip64=True) as sheet:
+            sheet.write(_SHEET_HEADER.encode())
+            sheet.write(_xlsx_row(1, headers, style=' s="1"').encode())
+            for number, row in enumerate(rows, start=2):
+                sheet.write(_xlsx_row(number, row).encode())
+                if number % flush_every == 0:
+                    data = sink.pop()
+                    if data:
+                        yield data
+            sheet.write(_SHEET_FOOTER.encode())
+
+    yield sink.pop()
+
+
+# --- Форматы экспорта ---
+
+class ExportWriter:
+    """
+    Базовый класс формата экспорта.
+
+    Итерирование по объекту отдает байты файла по частям; после окончания
+    в row_count лежит число выгруженных приказов.
+    """
+    extension = None
+    content_type = None
+
+    def __init__(self, queryset, field_names, chunk_size=EXPORT_CHUNK_SIZE):
+        self.queryset = queryset
+        self.field_names = field_names
+        self.headers = [EXPORT_FIELD_MAP[name] for name in field_names]
+        self.chunk_size = chunk_size
+        self.row_count = 0
+
+    @classmethod
+    def is_available(cls):
+        return True
+
+    def iter_rows(self):
+        for row in iter_export_rows(self.queryset, self.field_names, self.chunk_size):
+            self.row_count += 1
+            yield row
+
+    def __iter__(self):
+        raise NotImplementedError
+
+
+class XlsxExportWriter(ExportWriter):
+    extension = 'xlsx'
+    content_type = XLSX_CONTENT_TYPE
+
+    def __iter__(self):
+        return stream_xlsx(self.headers, self.iter_rows())
+
+
+class _Echo:
+    """Псевдо-файл для csv.writer: write() возвращает строку, а не пишет ее."""
+
+    def write(self, value):
+        return value
+
+
+class CsvExportWriter(ExportWriter):
+    """
+    CSV без промежуточной модели данных: строки серверного курсора сразу
+    уходят в csv.writer. Разделитель ';' и BOM — чтобы файл корректно
+    открывался в русской локали Excel.
+    """
+    extension = 'csv'
+    content_type = CSV_CONTENT_TYPE
+
+    def __iter__(self):
+        writer = csv.writer(_Echo(), delimiter=';')
+        buffer = ['\ufeff', writer.writerow(self.headers)]
+        for row in self.iter_rows():
+            buffer.append(writer.writerow(row))
+            if len(buffer) >= self.chunk_size:
+                yield ''.join(buffer).encode('utf-8')
+                buffer = []
+        yield ''.join(buffer).encode('utf-8')
+
+
+class ParquetExportWriter(ExportWriter):
+    """
+    Колоночный Parquet для аналитики (pandas/pyarrow — необязательная
+    зависимость). Каждая порция серверного курсора становится группой строк:
+    даты записываются как date32, вид документа — в словарную
+    (категориальную) колонку с русскими названиями. Имена колонок — имена
+    полей модели.
+    """
+    extension = 'parquet'
+    content_type = PARQUET_CONTENT_TYPE
+
+    @classmethod
+    def is_available(cls):
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def schema(self, pa):
+        """Явная схема: иначе пустая в одной порции колонка получит тип null."""
+        columns = []
+        for name in self.field_names:
+            if name == 'doc_type':
+                column_type = pa.dictionary(pa.int8(), pa.string())
+            elif name == 'issue_date':
+                column_type = pa.date32()
+            else:
+                column_type = pa.string()
+            columns.append(pa.field(name, column_type))
+        return pa.schema(columns)
+
+    def iter_frames(self):
+        import pandas as pd
+
+        rows = self.queryset.values_list(*self.field_names).iterator(chunk_size=self.chunk_size)
+        chunk = []
+        for row in rows:
+            chunk.append(row)
+            if len(chunk) >= self.chunk_size:
+                yield self._to_frame(pd, chunk)
+                chunk = []
+        if chunk or not self.row_count:
+            yield self._to_frame(pd, chunk)
+
+    def _to_frame(self, pd, chunk):
+        frame = pd.DataFrame.from_records(chunk, columns=self.field_names)
+        self.row_count += len(frame)
+        # issue_date остается колонкой datetime.date (и None), как его отдает
+        # драйвер БД: pyarrow кладет такие значения в date32 без приведения
+        # datetime64[ns], которое схема date32 отвергла бы как небезопасное
+        if 'doc_type' in frame:
+            frame['doc_type'] = pd.Categorical(
+                frame['doc_type'].map(DOC_TYPE_CHOICES),
+                categories=list(DOC_TYPE_CHOICES.values()))
+        return frame
+
+    def __iter__(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self.schema(pa)
+        sink = _ChunkSink()
+        with pq.ParquetWriter(sink, schema, compression='snappy') as writer:
+            for frame in self.iter_frames():
+                writer.write_table(pa.Table.from_pandas(frame, schema=schema, preserve_index=False))
+                data = sink.pop()
+                if data:
+                    yield data
+        yield sink.pop()
+
+
+EXPORT_WRITERS = {
+    writer.extension: writer
+    for writer in (XlsxExportWriter, CsvExportWriter, ParquetExportWriter)
+}
+DEFAULT_EXPORT_FORMAT = XlsxExportWriter.extension
+
+
+def get_export_writer(export_format):
+    """Класс формата экспорта или None, если формат неизвестен или недоступен."""
+    writer = EXPORT_WRITERS.get(export_format or DEFAULT_EXPORT_FORMAT)
+    if writer is None or not writer.is_available():
+        return None
+    return writer
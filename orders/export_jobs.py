@@ -0,0 +1,166 @@
+"""
+Фоновые задачи экспорта.
+
+Запрос пользователя только ставит задачу в очередь (таблица ExportJob) и
+сразу получает ответ; файл формирует отдельный процесс
+manage.py run_export_worker, поэтому тяжелые выгрузки не занимают
+WSGI-воркеры. Одинаковые незавершенные задачи одного пользователя не
+дублируются. Файлы завершенных задач хранятся ограниченное время и удаляются
+воркером вместе с задачами (delete_expired_jobs).
+"""
+import hashlib
+import json
+import logging
+import os
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from orders.export import DEFAULT_EXPORT_FORMAT, EXPORT_WRITERS, get_export_columns
+from orders.filters import filter_orders
+from orders.models import ExportJob
+
+error_logger = logging.getLogger('orders')
+
+EXPORT_JOBS_DIR = 'exports'
+
+
+def job_fingerprint(params, fields, export_format, user_id=None):
+    """
+    Отпечаток задачи: одинаковые фильтры, поля и формат одного пользователя
+    дают одинаковый отпечаток. Задача доступна только автору, поэтому
+    задачи разных пользователей не объединяются.
+    """
+    payload = json.dumps(
+        {'params': params, 'fields': sorted(fields), 'format': export_format, 'user': user_id},
+        sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def submit_export_job(params, fields, export_format=DEFAULT_EXPORT_FORMAT, user=None):
+    """
+    Ставит задачу в очередь или возвращает уже существующую незавершенную
+    задачу этого пользователя с теми же параметрами. Возвращает (задача, создана_ли).
+    """
+    created_by = user if user is not None and user.is_authenticated else None
+    fingerprint = job_fingerprint(
+        params, fields, export_format, created_by.pk if created_by else None)
+    in_flight = ExportJob.objects.filter(
+        fingerprint=fingerprint, created_by=created_by,
+        status__in=ExportJob.IN_FLIGHT_STATUSES)
+
+    job = in_flight.first()
+    if job is not None:
+        return job, False
+
+    try:
+        with transaction.atomic():
+            job = ExportJob.objects.create(
+                params=params,
+                fields=fields,
+                export_format=export_format,
+                fingerprint=fingerprint,
+                created_by=created_by,
+            )
+    except IntegrityError:
+        # Такую же задачу параллельно поставил другой запрос
+        return in_flight.get(), False
+    return job, True
+
+
+def delete_expired_jobs(max_age):
+    """
+    Удаляет завершенные задачи старше max_age (timedelta) вместе с файлами,
+    а также недописанные файлы (*.part) и файлы без задачи. Возвращает
+    число удаленных задач.
+    """
+    expired = ExportJob.objects.filter(
+        status__in=[ExportJob.STATUS_DONE, ExportJob.STATUS_FAILED],
+        finished_at__lt=timezone.now() - max_age)
+    deleted = 0
+    for job in expired.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        deleted += 1
+
+    # Файлы, оставшиеся от удаленных задач или прерванного воркера
+    jobs_dir = os.path.join(settings.MEDIA_ROOT, EXPORT_JOBS_DIR)
+    if os.path.isdir(jobs_dir):
+        known = {os.path.basename(name) for name in ExportJob.objects.exclude(
+            file='').exclude(file__isnull=True).values_list('file', flat=True)}
+        threshold = (timezone.now() - max_age).timestamp()
+        for entry in os.scandir(jobs_dir):
+            if (entry.is_file() and entry.name not in known
+                    and entry.stat().st_mtime < threshold):
+                os.remove(entry.path)
+    return deleted
+
+
+def requeue_stale_jobs(max_age):
+    """
+    Возвращает в очередь задачи, которые "выполняются" дольше max_age
+    (timedelta): их воркер, скорее всего, был остановлен посреди работы.
+    """
+    return ExportJob.objects.filter(
+        status=ExportJob.STATUS_RUNNING,
+        started_at__lt=timezone.now() - max_age,
+    ).update(status=ExportJob.STATUS_PENDING, started_at=None)
+
+
+def claim_next_job():
+    """
+    Забирает самую старую задачу из очереди. SKIP LOCKED позволяет запускать
+    несколько воркеров: каждую задачу получит только один из них.
+    """
+    with transaction.atomic():
+        job = (ExportJob.objects
+               .select_for_update(skip_locked=True)
+               .filter(status=ExportJob.STATUS_PENDING)
+               .order_by('created_at')
+               .first())
+        if job is None:
+            return None
+        job.status = ExportJob.STATUS_RUNNING
+        job.started_at = timezone.now()
+        job.save(update_fields=['status', 'started_at'])
+    return job
+
+
+def run_export_job(job):
+    """Формирует файл задачи в MEDIA_ROOT/exports/ и обновляет ее статус."""
+    writer_class = EXPORT_WRITERS[job.export_format]
+    relative_path = os.path.join(
+        EXPORT_JOBS_DIR, f'orders_export_{job.pk}.{writer_class.extension}')
+    full_path = os.path.join(settings.MEDIA_ROOT, relative_path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+
+    # Пишем во временный файл, чтобы по ссылке не отдать недописанный
+    temp_path = f'{full_path}.part'
+
+    try:
+        queryset = filter_orders(job.params, getattr(job.created_by, 'username', ''))
+        _, field_names = get_export_columns(job.fields)
+        writer = writer_class(queryset, field_names)
+
+        with open(temp_path, 'wb') as output:
+            for chunk in writer:
+                output.write(chunk)
+        os.replace(temp_path, full_path)
+
+        job.file.name = relative_path
+        job.row_count = writer.row_count
+        job.status = ExportJob.STATUS_DONE
+    except Exception as e:
+        error_logger.error(
+            "КРИТИЧЕСКАЯ ОШИБКА: при выполнении задачи экспорта #%s: %s", job.pk, e,
+            exc_info=True)
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        job.status = ExportJob.STATUS_FAILED
+        job.error = str(e)
+
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'row_count', 'status', 'error', 'finished_at'])
+    return job
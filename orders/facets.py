@@ -0,0 +1,122 @@
+"""
+Счетчики реестра (фасеты): число приказов по годам и видам документа.
+
+Хранятся в таблице OrderFacet и обновляются инкрементально при каждой
+записи приказа, поэтому панель фильтров получает их без агрегации по
+всему реестру. Прочитанные счетчики кешируются; кеш инвалидируется
+версией пространства имен сразу после фиксации транзакции с изменением.
+"""
+import logging
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count
+
+from orders.cache import anamespace_version, bump_namespace, namespace_version
+from orders.models import Order, OrderFacet
+
+error_logger = logging.getLogger('orders')
+
+FACETS_CACHE_KEY = 'registry_facets'
+FACETS_NAMESPACE = 'registry-facets'
+
+
+def facet_key(issue_date, doc_type):
+    """Ключ счетчика (год, вид); год 0 — приказ без даты."""
+    return (issue_date.year if issue_date else 0, doc_type)
+
+
+def adjust_facets(deltas):
+    """
+    Применяет изменения счетчиков: deltas — словарь {(год, вид): +n/-n}.
+    Увеличения уходят одним executemany с INSERT ... ON CONFLICT. Уменьшение
+    не опускает счетчик ниже нуля; если уменьшать нечего, счетчики разошлись
+    с реестром (например, после изменения приказов в обход ORM): это
+    пишется в журнал ошибок, исправляет manage.py rebuild_facets.
+    """
+    increments = [(year, doc_type, delta, delta)
+                  for (year, doc_type), delta in deltas.items() if delta > 0]
+    decrements = [(delta, year, doc_type, -delta)
+                  for (year, doc_type), delta in deltas.items() if delta < 0]
+    if not increments and not decrements:
+        return
+    table = connection.ops.quote_name(OrderFacet._meta.db_table)
+    with connection.cursor() as cursor:
+        if increments:
+            cursor.executemany(
+                f'INSERT INTO {table} (issue_year, doc_type, count) VALUES (%s, %s, %s) '
+                f'ON CONFLICT (issue_year, doc_type) '
+                f'DO UPDATE SET count = {table}.count + %s',
+                increments)
+        for delta, year, doc_type, amount in decrements:
+            cursor.execute(
+                f'UPDATE {table} SET count = count + %s '
+                f'WHERE issue_year = %s AND doc_type = %s AND count >= %s',
+                [delta, year, doc_type, amount])
+            if cursor.rowcount:
+                continue
+            cursor.execute(
+                f'UPDATE {table} SET count = 0 WHERE issue_year = %s AND doc_type = %s',
+                [year, doc_type])
+            error_logger.warning(
+                "Счетчик реестра (%s, %s) меньше уменьшения на %s и обнулен: счетчики "
+                "расходятся с реестром, выполните manage.py rebuild_facets.",
+                year, doc_type, amount)
+    transaction.on_commit(invalidate_facets)
+
+
+def rebuild_facets():
+    """Полный пересчет счетчиков по реестру (для первоначального заполнения и сверки)."""
+    with transaction.atomic():
+        OrderFacet.objects.all().delete()
+        OrderFacet.objects.bulk_create(
+            OrderFacet(issue_year=row['issue_year'], doc_type=row['doc_type'], count=row['count'])
+            for row in Order.objects.values('issue_year', 'doc_type').annotate(count=Count('id'))
+        )
+        transaction.on_commit(invalidate_facets)
+
+
+def invalidate_facets():
+    bump_namespace(FACETS_NAMESPACE)
+
+
+def get_facets():
+    """
+    Счетчики для панели фильтров:
+    {'years': [(год, число), ...] по возрастанию, 'doc_types': {вид: число}, 'total': число}.
+    """
+    version = namespace_version(FACETS_NAMESPACE)
+    facets = cache.get(FACETS_CACHE_KEY, version=version)
+    if facets is None:
+        facets = _collect_facets(_facet_rows())
+        cache.set(FACETS_CACHE_KEY, facets, timeout=None, version=version)
+    return facets
+
+
+async def aget_facets():
+    """Асинхронный вариант get_facets."""
+    version = await anamespace_version(FACETS_NAMESPACE)
+    facets = await cache.aget(FACETS_CACHE_KEY, version=version)
+    if facets is None:
+        rows = [row async for row in _facet_rows()]
+        facets = _collect_facets(rows)
+        await cache.aset(FACETS_CACHE_KEY, facets, timeout=None, version=version)
+    return facets
+
+
+def _facet_rows():
+    return OrderFacet.objects.filter(count__gt=0).values_list('issue_year', 'doc_type', 'count')
+
+
+def _collect_facets(rows):
+    years = Counter()
+    doc_types = Counter()
+    for year, doc_type, count in rows:
+        years[year] += count
+        doc_types[doc_type] += count
+    return {
+        'years': sorted((year, count) for year, count in years.items() if year),
+        'doc_types': dict(doc_types),
+        'total': sum(doc_types.values()),
+    }
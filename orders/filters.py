@@ -0,0 +1,114 @@
+"""
+Фильтрация и поиск по реестру приказов.
+
+Логика вынесена из представлений, чтобы одни и те же параметры фильтра
+давали одинаковый результат и в реестре, и в экспорте (в том числе в
+фоновых задачах экспорта, где нет HTTP-запроса).
+"""
+import logging
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Coalesce, Upper
+from django.db.models.lookups import Exact
+
+from orders.models import Order, ScanText, SEARCH_CONFIG
+
+action_logger = logging.getLogger('user_actions_logger')
+
+# GET-параметры, которые влияют на выборку (year и doc_type — имена из формы экспорта)
+FILTER_PARAMS = ('search', 'filter_year', 'year', 'filter_doc_num', 'filter_doc_type', 'doc_type')
+
+# Полный номер документа вида "001-к", "25-р": точное совпадение без учета регистра (b-tree)
+DOC_NUM_COMPLETE_RE = re.compile(r'^\d+-[^\W\d_]+$')
+# Префикс номера вида "001-": поиск по началу строки (индекс varchar_pattern_ops)
+DOC_NUM_PREFIX_RE = re.compile(r'^\d+-$')
+
+# Вес совпадения в тексте скана относительно совпадения в названии
+SCAN_TEXT_RANK_WEIGHT = 0.5
+
+
+def document_number_q(value):
+    """
+    Условие фильтра по номеру документа.
+
+    Полный номер сравнивается без учета регистра, как и подстрока:
+    UPPER(document_number) = UPPER(значение) по функциональному b-tree
+    индексу order_doc_number_upper. Префикс из цифр и дефиса обслуживается
+    индексом *_like с varchar_pattern_ops (Django создает его для CharField
+    с db_index). Все остальное — поиск подстроки без учета регистра через
+    триграммный GIN-индекс по тому же выражению UPPER(document_number).
+    """
+    value = value.strip()
+    if DOC_NUM_COMPLETE_RE.match(value):
+        return Q(Exact(Upper('document_number'), value.upper()))
+    if DOC_NUM_PREFIX_RE.match(value):
+        return Q(document_number__startswith=value)
+    return Q(document_number__icontains=value)
+
+
+def get_filter_params(query_dict):
+    """Оставляет из GET-параметров только непустые параметры фильтра."""
+    return {
+        name: query_dict.get(name)
+        for name in FILTER_PARAMS
+        if query_dict.get(name)
+    }
+
+
+def filter_orders(params, username=''):
+    """
+    Возвращает отфильтрованный и отсортированный queryset приказов.
+
+    params — QueryDict из запроса или обычный словарь с теми же ключами.
+    """
+    queryset = Order.objects.all()
+    # Лишние пробелы не меняют поисковый запрос (и ключ кеша результатов)
+    search = ' '.join((params.get("search") or '').split())
+    year = params.get('filter_year') or params.get('year')
+    filter_doc_num = params.get("filter_doc_num")
+    doc_type = params.get("filter_doc_type") or params.get("doc_type")
+
+    search_query_param = params.get('q')
+
+    if search_query_param:
+        # --- ЛОГИРОВАНИЕ: Поиск/Фильтрация ---
+        action_logger.info(
+            "Пользователь '%s' выполнил поиск по запросу: '%s'. ", username, search_query_param)
+
+    if year:
+        try:
+            year_int = int(year)
+            queryset = queryset.filter(issue_date__year=year_int)
+        except (ValueError, TypeError):
+            action_logger.warning(
+                "Неверный формат года '%s' в фильтре от пользователя '%s'.", year, username)
+
+    if search:
+        # Поиск идет по хранимым search_vector названия и текста скана
+        # (ScanText): каждое условие search_vector @@ query обслуживается своим
+        # GIN-индексом, найденные id объединяются (UNION), ранжируются только
+        # найденные строки. Ранг — сумма рангов названия и текста; double
+        # precision, чтобы курсор пагинации сравнивался с ним точно.
+        query = SearchQuery(search, search_type='websearch', config=SEARCH_CONFIG)
+        found_ids = Order.objects.filter(search_vector=query).values('pk').union(
+            ScanText.objects.filter(search_vector=query).values('order_id'))
+        queryset = queryset.filter(pk__in=found_ids).annotate(
+            rank=Cast(
+                SearchRank(F('search_vector'), query)
+                + Coalesce(SearchRank(F('scan_text__search_vector'), query), 0.0)
+                * SCAN_TEXT_RANK_WEIGHT,
+                FloatField())
+        ).filter(rank__gte=0.01).order_by('-rank', '-issue_date')
+
+    if filter_doc_num:
+        queryset = queryset.filter(document_number_q(filter_doc_num))
+
+    if doc_type:
+        queryset = queryset.filter(doc_type=doc_type)
+
+    if not search:
+        queryset = queryset.order_by('-id')
+
+    return queryset
@@ -0,0 +1,386 @@
+"""
+Инструментирование запросов: где тратится время каждого представления.
+
+InstrumentationMiddleware (первым в MIDDLEWARE, чтобы учитывались и
+сессии, и пользователь) для каждого запроса замеряет:
+    - время ответа целиком и его части: запросы к БД, отрисовку шаблона
+      (замеряется render() TemplateResponse в обычный для Django момент)
+      и остальное время Python;
+    - число запросов к БД и повторяющиеся запросы (одинаковые SQL и
+      параметры в одном запросе — обычно признак N+1 или лишнего чтения).
+
+Потоковые ответы (экспорт) замеряются до начала передачи тела.
+
+Показатели копятся в памяти процесса по (представление, метод) и раз в
+INSTRUMENTATION_FLUSH_INTERVAL секунд добавляются к таблице RequestStat
+одним INSERT ... ON CONFLICT. Запись выполняет отдельный поток процесса,
+поэтому запросы пользователей ее не ждут. Доля запросов INSTRUMENTATION_PROFILE_RATE
+выполняется под cProfile, профили сохраняются в RequestProfile.
+
+Посмотреть показатели: manage.py request_stats или /instrumentation/
+(только для суперпользователей).
+"""
+import atexit
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import DatabaseError, close_old_connections, connection
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+
+from orders.models import RequestProfile, RequestStat
+
+error_logger = logging.getLogger('orders')
+
+# Сколько строк pstats (по накопленному времени) сохранять в профиле
+PROFILE_LINES = 40
+# Длина примера повторного запроса в RequestStat
+DUPLICATE_SQL_LENGTH = 2000
+
+# Показатели запроса, который сейчас обрабатывается
+current_metrics = ContextVar('request_metrics', default=None)
+
+STAT_FIELDS = [
+    'requests', 'errors', 'slow', 'total_time', 'db_time', 'template_time', 'python_time',
+    'queries', 'duplicate_queries', 'requests_with_duplicates',
+]
+
+
+class RequestMetrics:
+    """Показатели одного запроса; __call__ учитывает выполнение запроса к БД."""
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.template_db_time = 0.0
+        self.template_time = 0.0
+        self.in_template = False
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            self.queries += 1
+            self.db_time += elapsed
+            if self.in_template:
+                self.template_db_time += elapsed
+            self.statements[(sql, repr(params))] += 1
+
+    def duplicates(self):
+        """(число повторных выполнений, самый частый повторный SQL)."""
+        repeated = [(count, sql) for (sql, _), count in self.statements.items() if count > 1]
+        if not repeated:
+            return 0, ''
+        return sum(count - 1 for count, _ in repeated), max(repeated)[1]
+
+
+class StatBuffer:
+    """
+    Показатели процесса, еще не добавленные к таблице RequestStat.
+
+    Поток записи запускается при первом добавлении в каждом процессе (как
+    поток журнала в orders.audit_logging), поэтому работает и в воркерах
+    Gunicorn после fork. Остаток сохраняется при завершении процесса.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self._stats = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._thread_pid = None
+        self._stop = threading.Event()
+
+    def add(self, view, method, values, max_time, duplicate_sql):
+        self._ensure_thread()
+        with self._lock:
+            stat = self._stats.get((view, method))
+            if stat is None:
+                stat = self._stats[(view, method)] = dict.fromkeys(STAT_FIELDS, 0)
+                stat.update(max_time=0.0, duplicate_sql='')
+            for field, value in values.items():
+                stat[field] += value
+            stat['max_time'] = max(stat['max_time'], max_time)
+            if duplicate_sql:
+                stat['duplicate_sql'] = duplicate_sql
+
+    def _ensure_thread(self):
+        if self._thread_pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._thread_pid == os.getpid():
+                return
+            if self._thread_pid is None:
+                atexit.register(self.stop)
+            else:
+                # Процесс получен fork-ом: показатели родителя сохранит родитель
+                self._stats = {}
+                self._lock = threading.Lock()
+                self._flush_lock = threading.Lock()
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name='request-stats', daemon=True)
+            self._thread.start()
+            self._thread_pid = os.getpid()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+        connection.close()
+
+    def stop(self):
+        """Останавливает поток записи и сохраняет остаток показателей."""
+        if self._thread_pid == os.getpid():
+            self._stop.set()
+            # После остановки потока flush() не пропустит запись из-за его блокировки
+            self._thread.join(timeout=10)
+            self.flush()
+
+    def flush(self):
+        """Добавляет накопленное к RequestStat; один поток процесса за раз."""
+        if not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            with self._lock:
+                stats, self._stats = self._stats, {}
+            if stats:
+                # Соединение потока живет, как соединение запроса: не дольше
+                # CONN_MAX_AGE и не после ошибки
+                close_old_connections()
+                save_stats(stats)
+        finally:
+            self._flush_lock.release()
+
+
+def save_stats(stats):
+    """stats — {(представление, метод): {поле: значение}}; один executemany с ON CONFLICT."""
+    table = connection.ops.quote_name(RequestStat._meta.db_table)
+    columns = ['view', 'method', *STAT_FIELDS, 'max_time', 'duplicate_sql', 'updated_at']
+    updates = [f'{field} = {table}.{field} + EXCLUDED.{field}' for field in STAT_FIELDS]
+    updates += [
+        f'max_time = GREATEST({table}.max_time, EXCLUDED.max_time)',
+        f"duplicate_sql = COALESCE(NULLIF(EXCLUDED.duplicate_sql, ''), {table}.duplicate_sql)",
+        'updated_at = EXCLUDED.updated_at',
+    ]
+    now = timezone.now()
+    rows = [
+        (view, method, *(stat[field] for field in STAT_FIELDS), stat['max_time'],
+         stat['duplicate_sql'], now)
+        for (view, method), stat in stats.items()
+    ]
+    try:
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {table} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(['%s'] * len(columns))}) "
+                f"ON CONFLICT (view, method) DO UPDATE SET {', '.join(updates)}",
+                rows)
+    except DatabaseError:
+        error_logger.exception('Не удалось сохранить показатели запросов (%d представлений)', len(rows))
+
+
+def save_profile(profile, request, view, response, total_time, queries):
+    stream = io.StringIO()
+    pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(PROFILE_LINES)
+    try:
+        RequestProfile.objects.create(
+            view=view, method=request.method, path=request.get_full_path()[:2000],
+            status_code=response.status_code, total_time=total_time, queries=queries,
+            stats=stream.getvalue())
+        # Хранятся только последние INSTRUMENTATION_PROFILE_KEEP профилей
+        stale = RequestProfile.objects.order_by('-created_at').values_list(
+            'pk', flat=True)[settings.INSTRUMENTATION_PROFILE_KEEP:]
+        RequestProfile.objects.filter(pk__in=list(stale)).delete()
+    except DatabaseError:
+        error_logger.exception('Не удалось сохранить профиль запроса %s', request.path)
+
+
+def collect_stats(order_by='-total_time', view=''):
+    """
+    Накопленные показатели для вывода (команда request_stats, /instrumentation/):
+    список словарей с суммами и средними на запрос.
+    """
+    stats = RequestStat.objects.order_by(order_by)
+    if view:
+        stats = stats.filter(view__icontains=view)
+    rows = []
+    for stat in stats:
+        requests = stat.requests or 1
+        rows.append({
+            'view': stat.view,
+            'method': stat.method,
+            'requests': stat.requests,
+            'errors': stat.errors,
+            'slow': stat.slow,
+            'total_time': stat.total_time,
+            'avg_time': stat.total_time / requests,
+            'avg_db_time': stat.db_time / requests,
+            'avg_template_time': stat.template_time / requests,
+            'avg_python_time': stat.python_time / requests,
+            'max_time': stat.max_time,
+            'avg_queries': stat.queries / requests,
+            'duplicate_queries': stat.duplicate_queries,
+            'requests_with_duplicates': stat.requests_with_duplicates,
+            'duplicate_sql': stat.duplicate_sql,
+            'updated_at': stat.updated_at,
+        })
+    return rows
+
+
+def get_view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return '<не найдено>'
+    return match.view_name or match._func_path
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    """
+    Обертка выполнения запросов, постоянно установленная на соединения.
+    Показатели текущего запроса берутся из contextvar: под ASGI запросы к БД
+    выполняются в потоке sync_to_async, куда контекст копируется вместе с ним.
+    """
+    metrics = current_metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    return metrics(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(connection, **kwargs):
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+class InstrumentationMiddleware:
+    """
+    Промежуточный слой замеров (синхронный и асинхронный). Настройки (settings.py):
+        INSTRUMENTATION_ENABLED — включить замеры;
+        INSTRUMENTATION_PROFILE_RATE — доля запросов под cProfile (0 — не профилировать);
+        INSTRUMENTATION_FLUSH_INTERVAL — как часто сохранять показатели процесса, сек.;
+        INSTRUMENTATION_SLOW_MS — с какого времени ответа запрос считается медленным;
+        INSTRUMENTATION_SERVER_TIMING — добавлять заголовок Server-Timing (видно в DevTools).
+
+    Под ASGI cProfile не включается: профиль потока цикла событий смешал бы
+    разные запросы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.INSTRUMENTATION_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        self.profile_rate = settings.INSTRUMENTATION_PROFILE_RATE
+        self.slow_ms = settings.INSTRUMENTATION_SLOW_MS
+        self.server_timing = settings.INSTRUMENTATION_SERVER_TIMING
+        self.buffer = StatBuffer(settings.INSTRUMENTATION_FLUSH_INTERVAL)
+        connection_created.connect(install_execute_wrapper, dispatch_uid='orders.instrumentation')
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+
+        # Соединение могло открыться до подключения сигнала
+        install_execute_wrapper(connection)
+        metrics = RequestMetrics()
+        request._instrumentation = metrics
+        token = current_metrics.set(metrics)
+        profile = cProfile.Profile() if random.random() < self.profile_rate else None
+
+        started = time.perf_counter()
+        if profile is not None:
+            profile.enable()
+        try:
+            response = self.get_response(request)
+        finally:
+            if profile is not None:
+                profile.disable()
+            current_metrics.reset(token)
+        total_time = (time.perf_counter() - started) * 1000
+
+        view = self.record(request, response, metrics, total_time)
+        # Запись в БД — вне замера и вне обертки запросов
+        if profile is not None:
+            save_profile(profile, request, view, response, total_time, metrics.queries)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        request._instrumentation = metrics
+        token = current_metrics.set(metrics)
+
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_metrics.reset(token)
+        total_time = (time.perf_counter() - started) * 1000
+
+        self.record(request, response, metrics, total_time)
+        return response
+
+    def record(self, request, response, metrics, total_time):
+        """Добавляет показатели запроса к буферу процесса; возвращает имя представления."""
+        view = get_view_name(request)
+        template_time = metrics.template_time - metrics.template_db_time
+        duplicates, duplicate_sql = metrics.duplicates()
+        python_time = max(total_time - metrics.db_time - template_time, 0.0)
+        self.buffer.add(view, request.method, {
+            'requests': 1,
+            'errors': int(response.status_code >= 500),
+            'slow': int(total_time >= self.slow_ms),
+            'total_time': total_time,
+            'db_time': metrics.db_time,
+            'template_time': template_time,
+            'python_time': python_time,
+            'queries': metrics.queries,
+            'duplicate_queries': duplicates,
+            'requests_with_duplicates': int(duplicates > 0),
+        }, total_time, duplicate_sql[:DUPLICATE_SQL_LENGTH])
+
+        if self.server_timing:
+            response['Server-Timing'] = (
+                f'db;dur={metrics.db_time:.1f};desc="{metrics.queries} queries", '
+                f'tpl;dur={template_time:.1f}, app;dur={python_time:.1f}, total;dur={total_time:.1f}')
+        return view
+
+    def process_template_response(self, request, response):
+        # Django отрисует ответ после всех process_template_response; здесь
+        # render() только оборачивается замером, чтобы не отрисовать ответ
+        # раньше времени (до обработчиков других слоев).
+        # Под ASGI Django вызывает render() в потоке sync_to_async
+        metrics = getattr(request, '_instrumentation', None)
+        if metrics is None:
+            return response
+
+        def timed_render():
+            # Обертка снимается до отрисовки: ответ кешируется (pickle) без нее
+            del response.render
+            metrics.in_template = True
+            started = time.perf_counter()
+            try:
+                return response.render()
+            finally:
+                metrics.template_time += (time.perf_counter() - started) * 1000
+                metrics.in_template = False
+
+        response.render = timed_render
+        return response
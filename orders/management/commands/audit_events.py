@@ -0,0 +1,92 @@
+import json
+from datetime import datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from orders.models import AuditEvent
+
+
+class Command(BaseCommand):
+    help = ('Выборка из журнала действий (AuditEvent) за период: по пользователю, '
+            'приказу и виду действия. Например, кто скачивал или просматривал приказ.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', type=str, default='',
+                            help='Начало периода: ГГГГ-ММ-ДД или ГГГГ-ММ-ДДTЧЧ:ММ (по умолчанию 30 дней назад)')
+        parser.add_argument('--until', type=str, default='',
+                            help='Конец периода (дата включительно), по умолчанию — сейчас')
+        parser.add_argument('--user', type=str, default='',
+                            help='Имя пользователя')
+        parser.add_argument('--order', type=int, default=None,
+                            help='ID приказа')
+        parser.add_argument('--action', action='append', default=[],
+                            choices=[value for value, _ in AuditEvent.ACTION_CHOICES],
+                            help='Вид действия (можно указать несколько раз)')
+        parser.add_argument('--limit', type=int, default=100,
+                            help='Сколько последних событий вывести (0 — все)')
+        parser.add_argument('--count', action='store_true',
+                            help='Только посчитать события')
+        parser.add_argument('--jsonl', action='store_true',
+                            help='Вывод в формате JSON Lines (по событию в строке)')
+
+    def handle(self, *args, **options):
+        since = self._parse_moment(options['since']) if options['since'] else (
+            timezone.now() - timedelta(days=30))
+        until = self._parse_moment(options['until'], end_of_day=True) if options['until'] else None
+
+        # Условие на время есть всегда: его обслуживают индексы (пользователь, время),
+        # (приказ, время) или BRIN-индекс по времени
+        events = AuditEvent.objects.filter(created_at__gte=since)
+        if until:
+            events = events.filter(created_at__lt=until)
+        if options['user']:
+            events = events.filter(username=options['user'])
+        if options['order'] is not None:
+            events = events.filter(order_id=options['order'])
+        if options['action']:
+            events = events.filter(action__in=options['action'])
+
+        if options['count']:
+            self.stdout.write(str(events.count()))
+            return
+
+        events = events.order_by('-created_at')
+        if options['limit']:
+            events = events[:options['limit']]
+
+        rows = events.values_list('created_at', 'username', 'action', 'order_id', 'params')
+        for created_at, username, action, order_id, params in rows.iterator(chunk_size=2000):
+            created_at = timezone.localtime(created_at)
+            if options['jsonl']:
+                self.stdout.write(json.dumps({
+                    'time': created_at, 'user': username, 'action': action,
+                    'order_id': order_id, 'params': params,
+                }, cls=DjangoJSONEncoder, ensure_ascii=False))
+            else:
+                self.stdout.write(
+                    f"{created_at:%d.%m.%Y %H:%M:%S}  {username or 'Anonymous':<20} {action:<16} "
+                    f"{order_id if order_id is not None else '':>8}  "
+                    f"{json.dumps(params, cls=DjangoJSONEncoder, ensure_ascii=False)}")
+
+    @staticmethod
+    def _parse_moment(value, end_of_day=False):
+        try:
+            day = parse_date(value)
+        except ValueError:
+            day = None
+        if day is not None:
+            # Дата окончания включается в период целиком
+            moment = datetime.combine(day + timedelta(days=1) if end_of_day else day, time.min)
+        else:
+            try:
+                moment = parse_datetime(value)
+            except ValueError:
+                moment = None
+            if moment is None:
+                raise CommandError(f'Не удалось разобрать дату: {value}')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
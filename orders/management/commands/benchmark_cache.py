@@ -0,0 +1,96 @@
+import logging
+import os
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from orders.benchmarks import measure
+from orders.cache import TieredCache
+from orders.views import IndexView
+
+DB_CACHE_TABLE = 'orders_benchmark_cache'
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк времени ответа главной страницы реестра при разных '
+            'настройках кеша: таблица БД, файловый кеш, двухуровневый кеш.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=50,
+                            help='Количество запросов на каждую конфигурацию')
+        parser.add_argument('--redis', type=str, default='',
+                            help='URL Redis (redis://...), чтобы добавить конфигурации с Redis')
+
+    def handle(self, *args, **options):
+        # Логи просмотра реестра пишутся на каждый запрос и только добавляют шум
+        logging.disable(logging.INFO)
+        view = IndexView.as_view()
+        factory = RequestFactory()
+
+        def request_index():
+            request = factory.get('/')
+            request.user = AnonymousUser()
+            response = view(request)
+            response.render()
+
+        with tempfile.TemporaryDirectory() as cache_dir:
+            self.stdout.write(
+                f"{'Конфигурация':<28} {'median, мс':>11} {'p95, мс':>9} {'запросов к БД':>14}  попадания")
+            for label, config in self._configs(cache_dir, options['redis']):
+                with override_settings(CACHES=config):
+                    if config['default']['BACKEND'].endswith('DatabaseCache'):
+                        call_command('createcachetable', DB_CACHE_TABLE, verbosity=0)
+
+                    cache = caches['default']
+                    cache.clear()
+                    stats = measure(request_index, repeat=options['repeat'])
+                    with CaptureQueriesContext(connection) as queries:
+                        request_index()
+
+                    hits = ''
+                    if isinstance(cache, TieredCache):
+                        counters = cache.stats()
+                        hits = (f"память {counters['local_hits']}, общий {counters['shared_hits']}, "
+                                f"промахи {counters['misses']}")
+                    self.stdout.write(
+                        f"{label:<28} {stats['median']:>11.2f} {stats['p95']:>9.2f} "
+                        f"{len(queries):>14}  {hits}")
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {DB_CACHE_TABLE}')
+
+    @staticmethod
+    def _tiered(shared):
+        return {
+            'default': {
+                'BACKEND': 'orders.cache.TieredCache',
+                'OPTIONS': {'SHARED_CACHE': 'shared'},
+            },
+            'shared': shared,
+        }
+
+    def _configs(self, cache_dir, redis_url):
+        database = {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': DB_CACHE_TABLE,
+        }
+        filebased = {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.path.join(cache_dir, 'file'),
+        }
+        yield 'Таблица БД (прежняя)', {'default': database}
+        yield 'Файловый кеш', {'default': filebased}
+        yield 'Память + файловый кеш', self._tiered(filebased)
+        if redis_url:
+            redis = {
+                'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                'LOCATION': redis_url,
+            }
+            yield 'Redis', {'default': redis}
+            yield 'Память + Redis', self._tiered(redis)
@@ -0,0 +1,72 @@
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Q
+
+from orders.benchmarks import measure, synthetic_orders
+from orders.filters import document_number_q
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк фильтра по номеру документа: прежний icontains без индексов '
+            'против b-tree fast path и триграммного индекса на синтетической таблице.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=500000,
+                            help='Количество синтетических приказов (по умолчанию 500000)')
+        parser.add_argument('--repeat', type=int, default=20,
+                            help='Количество замеров на каждый сценарий')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Размер пакета при заполнении таблицы')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Все синтетические данные создаются в транзакции и откатываются в конце
+        with transaction.atomic():
+            self._populate(options['rows'], options['batch_size'], options['seed'])
+
+            cases = [
+                ('Полный номер, прежний icontains', Q(document_number__icontains='042-к'), False),
+                ('Полный номер, fast path (b-tree)', document_number_q('042-к'), True),
+                ('Префикс, прежний icontains', Q(document_number__icontains='042-'), False),
+                ('Префикс, fast path (b-tree)', document_number_q('042-'), True),
+                ('Подстрока, без индексов', document_number_q('142'), False),
+                ('Подстрока, pg_trgm', document_number_q('142'), True),
+            ]
+
+            self.stdout.write(f"{'Сценарий':<36} {'строк':>7} {'median, мс':>11} {'p95, мс':>9}  план")
+            for label, condition, use_indexes in cases:
+                queryset = Order.objects.filter(condition)
+                with connection.cursor() as cursor:
+                    self._set_indexes(cursor, use_indexes)
+                    stats = measure(queryset.count, repeat=options['repeat'])
+                    plan = queryset.explain().splitlines()
+                    self._set_indexes(cursor, True)
+
+                scan = next((line.strip(' ->') for line in plan if 'Scan' in line), plan[0])
+                self.stdout.write(
+                    f"{label:<36} {queryset.count():>7} {stats['median']:>11.2f} "
+                    f"{stats['p95']:>9.2f}  {scan.split('  (')[0]}")
+
+            transaction.set_rollback(True)
+
+    def _populate(self, rows, batch_size, seed):
+        self.stdout.write(f'Создание {rows} синтетических приказов...')
+        batch = []
+        for order in synthetic_orders(rows, seed=seed):
+            batch.append(order)
+            if len(batch) >= batch_size:
+                Order.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Order.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE orders_order')
+
+    @staticmethod
+    def _set_indexes(cursor, enabled):
+        # Отключение индексных планов имитирует таблицу без подходящих индексов
+        value = 'on' if enabled else 'off'
+        cursor.execute(f'SET LOCAL enable_indexscan = {value}')
+        cursor.execute(f'SET LOCAL enable_bitmapscan = {value}')
+        cursor.execute(f'SET LOCAL enable_indexonlyscan = {value}')
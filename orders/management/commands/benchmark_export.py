@@ -0,0 +1,118 @@
+import time
+import tracemalloc
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from orders.benchmarks import synthetic_orders
+from orders.export import (DOC_TYPE_CHOICES, EXPORT_CHUNK_SIZE, EXPORT_FIELD_MAP, EXPORT_WRITERS,
+                           get_export_columns, iter_export_rows)
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк форматов экспорта: скорость (строк/с), размер файла и пиковая '
+            'память XLSX, CSV и Parquet, а также стоимость форматирования строки '
+            'в Python и в БД на синтетической таблице.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=200000,
+                            help='Количество синтетических приказов (по умолчанию 200000)')
+        parser.add_argument('--batch-size', type=int, default=10000,
+                            help='Размер пакета при заполнении таблицы')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        # Все синтетические данные создаются в транзакции и откатываются в конце
+        with transaction.atomic():
+            self._populate(options['rows'], options['batch_size'], options['seed'])
+            _, field_names = get_export_columns(list(EXPORT_FIELD_MAP))
+
+            self.stdout.write(
+                f"{'Формат':<10} {'строк':>8} {'время, с':>9} {'строк/с':>9} "
+                f"{'файл, МБ':>9} {'пик памяти, МБ':>15}")
+            for export_format, writer_class in EXPORT_WRITERS.items():
+                if not writer_class.is_available():
+                    self.stdout.write(f'{export_format:<10} недоступен (не установлен pyarrow)')
+                    continue
+                writer = writer_class(Order.objects.order_by('-id'), field_names)
+                self._report(export_format, writer)
+
+            self.stdout.write('')
+            self._report_formatting(Order.objects.order_by('-id'), field_names)
+
+            transaction.set_rollback(True)
+
+    def _report_formatting(self, queryset, field_names):
+        """Время на строку: чтение без форматирования, прежний цикл по ячейкам и форматирование в БД."""
+        cases = [
+            ('Чтение без форматирования',
+             lambda: queryset.values_list(*field_names).iterator(chunk_size=EXPORT_CHUNK_SIZE)),
+            ('Цикл по ячейкам в Python', lambda: self._legacy_rows(queryset, field_names)),
+            ('Форматирование в БД', lambda: iter_export_rows(queryset, field_names)),
+        ]
+        self.stdout.write(f"{'Форматирование':<28} {'строк':>8} {'мкс/строка':>11}")
+        for label, make_rows in cases:
+            started = time.perf_counter()
+            count = sum(1 for _ in make_rows())
+            elapsed = time.perf_counter() - started
+            per_row = elapsed / count * 1e6 if count else 0
+            self.stdout.write(f'{label:<28} {count:>8} {per_row:>11.2f}')
+
+    @staticmethod
+    def _legacy_rows(queryset, field_names):
+        # Прежняя реализация: проверки типа, strftime и поиск по словарю для каждой ячейки
+        doc_type_index = field_names.index('doc_type') if 'doc_type' in field_names else None
+        rows = queryset.values_list(*field_names).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        for order_tuple in rows:
+            row = list(order_tuple)
+            for i, value in enumerate(row):
+                if isinstance(value, date):
+                    row[i] = value.strftime('%d.%m.%Y')
+                elif i == doc_type_index and value:
+                    row[i] = DOC_TYPE_CHOICES.get(value, value)
+                elif value is None:
+                    row[i] = ''
+            yield row
+
+    def _report(self, label, writer):
+        arrow_pool = self._arrow_pool()
+        arrow_before = arrow_pool.max_memory() if arrow_pool else 0
+
+        tracemalloc.start()
+        started = time.perf_counter()
+        size = sum(len(chunk) for chunk in writer)
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Буферы pyarrow выделяются вне интерпретатора и не видны tracemalloc
+        if arrow_pool:
+            peak += max(arrow_pool.max_memory() - arrow_before, 0)
+
+        rate = writer.row_count / elapsed if elapsed else 0
+        self.stdout.write(
+            f'{label:<10} {writer.row_count:>8} {elapsed:>9.2f} {rate:>9.0f} '
+            f'{size / 2 ** 20:>9.2f} {peak / 2 ** 20:>15.2f}')
+
+    @staticmethod
+    def _arrow_pool():
+        try:
+            import pyarrow
+        except ImportError:
+            return None
+        return pyarrow.default_memory_pool()
+
+    def _populate(self, rows, batch_size, seed):
+        self.stdout.write(f'Создание {rows} синтетических приказов...')
+        batch = []
+        for order in synthetic_orders(rows, seed=seed):
+            batch.append(order)
+            if len(batch) >= batch_size:
+                Order.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Order.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE orders_order')
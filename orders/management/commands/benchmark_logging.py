@@ -0,0 +1,93 @@
+import logging
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import date
+from logging.handlers import TimedRotatingFileHandler
+
+from django.core.management.base import BaseCommand
+
+from orders.audit_logging import OVERFLOW_BLOCK, OVERFLOW_DROP, AuditQueueHandler
+from orders.benchmarks import percentile
+
+FORMAT = '{levelname} {asctime} {name} {message}'
+
+
+class Command(BaseCommand):
+    help = ('Бенчмарк журнала действий: задержка вызова логгера в потоках запросов '
+            'при синхронной записи в файл и через очередь (orders.audit_logging).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8,
+                            help='Число потоков, одновременно пишущих в журнал')
+        parser.add_argument('--messages', type=int, default=5000,
+                            help='Сообщений на поток')
+
+    def handle(self, *args, **options):
+        # Типичная тяжелая запись: cleaned_data формы приказа
+        cleaned_data = {
+            'doc_type': 'order', 'document_number': '125-к', 'issue_date': date(2024, 5, 17),
+            'document_title': 'Об утверждении положения о подразделении ' * 3,
+            'signed_by': 'Иванов И.И.', 'responsible_executor': 'Отдел кадров',
+            'note': 'Примечание ' * 20, 'is_active': True,
+        }
+
+        self.stdout.write('При переполнении очереди в режиме drop часть записей теряется '
+                          '(об этом в журнал пишется предупреждение).')
+        self.stdout.write(
+            f"{'Обработчик':<24} {'median, мкс':>12} {'p99, мкс':>10} {'max, мс':>9} "
+            f"{'всего, с':>9} {'записано':>9}")
+        with tempfile.TemporaryDirectory() as log_dir:
+            sync_path = os.path.join(log_dir, 'sync.log')
+            drop_path = os.path.join(log_dir, 'drop.log')
+            block_path = os.path.join(log_dir, 'block.log')
+            cases = [
+                ('Синхронный файл', sync_path,
+                 TimedRotatingFileHandler(sync_path, when='midnight', encoding='utf-8')),
+                ('Очередь (drop)', drop_path,
+                 AuditQueueHandler(drop_path, console=False, overflow=OVERFLOW_DROP)),
+                ('Очередь (block)', block_path,
+                 AuditQueueHandler(block_path, console=False, overflow=OVERFLOW_BLOCK)),
+            ]
+            for label, path, handler in cases:
+                handler.setFormatter(logging.Formatter(FORMAT, style='{'))
+                self._report(label, path, handler, cleaned_data, options)
+
+    def _report(self, label, path, handler, cleaned_data, options):
+        logger = logging.getLogger(f'benchmark_logging.{id(handler)}')
+        logger.propagate = False
+        logger.setLevel(logging.INFO)
+        logger.addHandler(handler)
+
+        timings = [[] for _ in range(options['threads'])]
+
+        def worker(index):
+            own = timings[index]
+            for number in range(options['messages']):
+                started = time.perf_counter()
+                logger.info(
+                    "УСПЕХ: Приказ №%s (ID: %s) успешно создан пользователем '%s'. Данные: %s",
+                    cleaned_data['document_number'], number, 'admin', cleaned_data)
+                own.append((time.perf_counter() - started) * 1e6)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        # Время дозаписи очереди в общее время не входит: его не ждет ни один запрос
+        handler.flush()
+        logger.removeHandler(handler)
+        handler.close()
+
+        with open(path, encoding='utf-8') as f:
+            written = sum(1 for _ in f)
+        values = [value for own in timings for value in own]
+        self.stdout.write(
+            f'{label:<24} {statistics.median(values):>12.1f} {percentile(values, 99):>10.1f} '
+            f'{max(values) / 1000:>9.2f} {elapsed:>9.2f} {written:>9}')
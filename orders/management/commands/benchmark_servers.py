@@ -0,0 +1,162 @@
+import asyncio
+import os
+import shutil
+import signal
+import socket
+import statistics
+import subprocess
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.benchmarks import percentile
+
+# Команды запуска серверов: {workers} и {port} подставляются из параметров
+SERVERS = {
+    'gunicorn': ['gunicorn', 'config.wsgi:application', '--workers', '{workers}',
+                 '--worker-class', 'sync', '--bind', '127.0.0.1:{port}', '--backlog', '2048'],
+    'uvicorn': ['uvicorn', 'config.asgi:application', '--workers', '{workers}',
+                '--host', '127.0.0.1', '--port', '{port}', '--backlog', '2048',
+                '--no-access-log'],
+}
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочное сравнение серверов: gunicorn с синхронными воркерами (WSGI) и '
+            'uvicorn (ASGI, асинхронные представления реестра). Для каждого числа '
+            'одновременных соединений выводит пропускную способность, перцентили '
+            'времени ответа и число ошибок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--server', action='append', choices=SERVERS, default=[],
+                            help='Какие серверы сравнивать (по умолчанию оба)')
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Число процессов-воркеров каждого сервера')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[10, 50, 200],
+                            help='Числа одновременных соединений')
+        parser.add_argument('--duration', type=float, default=10.0,
+                            help='Длительность каждого замера, сек.')
+        parser.add_argument('--timeout', type=float, default=10.0,
+                            help='Время ожидания ответа, после которого запрос считается ошибкой, сек.')
+        parser.add_argument('--path', action='append', default=[],
+                            help="Адреса, которые запрашиваются по очереди (по умолчанию '/')")
+        parser.add_argument('--port', type=int, default=8765)
+
+    def handle(self, *args, **options):
+        paths = options['path'] or ['/']
+        self.stdout.write(
+            f"{'Сервер':<10} {'соединений':>10} {'запросов/с':>11} {'median, мс':>11} "
+            f"{'p95, мс':>9} {'p99, мс':>9} {'ошибок':>7}")
+        for name in options['server'] or list(SERVERS):
+            if shutil.which(SERVERS[name][0]) is None:
+                raise CommandError(f'{name} не установлен: pip install {name}')
+            process = self._start(name, options)
+            try:
+                for concurrency in options['concurrency']:
+                    result = asyncio.run(self._load(
+                        options['port'], paths, concurrency, options['duration'], options['timeout']))
+                    self._report(name, concurrency, result, options['duration'])
+            finally:
+                self._stop(process)
+
+    # --- Сервер ---
+
+    def _start(self, name, options):
+        command = [part.format(workers=options['workers'], port=options['port'])
+                   for part in SERVERS[name]]
+        # Вывод сервера — во временный файл: непрочитанный канал заполнился бы и остановил сервер
+        log = tempfile.TemporaryFile()
+        process = subprocess.Popen(
+            command, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+            start_new_session=True)
+        deadline = time.monotonic() + 30
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                log.seek(0)
+                raise CommandError(
+                    f'{name} завершился при запуске:\n{log.read().decode(errors="replace")}')
+            try:
+                socket.create_connection(('127.0.0.1', options['port']), timeout=1).close()
+                break
+            except OSError:
+                time.sleep(0.2)
+        else:
+            self._stop(process)
+            raise CommandError(f'{name} не начал принимать соединения за 30 секунд')
+
+        # Первые запросы воркеров (импорт шаблонов, соединение с БД) в замер не входят
+        for _ in range(options['workers'] * 2):
+            asyncio.run(self._load(options['port'], ['/'], 1, 0.0, options['timeout']))
+        return process
+
+    @staticmethod
+    def _stop(process):
+        try:
+            os.killpg(process.pid, signal.SIGTERM)
+            process.wait(timeout=30)
+        except ProcessLookupError:
+            pass
+        except subprocess.TimeoutExpired:
+            os.killpg(process.pid, signal.SIGKILL)
+            process.wait()
+
+    # --- Нагрузка ---
+
+    async def _load(self, port, paths, concurrency, duration, timeout):
+        """
+        concurrency клиентов в цикле отправляют GET по очереди адресов paths;
+        каждый запрос — новое соединение (синхронные воркеры gunicorn не держат
+        keep-alive). Возвращает (время ответов, мс; число ошибок).
+        """
+        timings = []
+        errors = 0
+        deadline = time.monotonic() + duration
+
+        async def client(index):
+            nonlocal errors
+            number = index
+            while True:
+                path = paths[number % len(paths)]
+                number += 1
+                started = time.perf_counter()
+                try:
+                    status = await asyncio.wait_for(self._request(port, path), timeout)
+                except (OSError, asyncio.TimeoutError, ValueError, IndexError):
+                    status = None
+                if status == 200:
+                    timings.append((time.perf_counter() - started) * 1000)
+                else:
+                    errors += 1
+                if time.monotonic() >= deadline:
+                    return
+
+        await asyncio.gather(*(client(index) for index in range(concurrency)))
+        return timings, errors
+
+    @staticmethod
+    async def _request(port, path):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        try:
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n'.encode())
+            await writer.drain()
+            status_line = await reader.readline()
+            # Тело дочитывается до закрытия соединения сервером
+            while await reader.read(65536):
+                pass
+            return int(status_line.split()[1])
+        finally:
+            writer.close()
+
+    def _report(self, name, concurrency, result, duration):
+        timings, errors = result
+        if timings:
+            self.stdout.write(
+                f'{name:<10} {concurrency:>10} {len(timings) / duration:>11.1f} '
+                f'{statistics.median(timings):>11.1f} {percentile(timings, 95):>9.1f} '
+                f'{percentile(timings, 99):>9.1f} {errors:>7}')
+        else:
+            self.stdout.write(f'{name:<10} {concurrency:>10} {"нет успешных ответов":>31} {errors:>7}')
+        self.stdout.flush()
@@ -0,0 +1,284 @@
+import json
+import logging
+import os
+import platform
+import subprocess
+import tempfile
+import tracemalloc
+from datetime import datetime
+from io import StringIO
+
+import django
+import openpyxl
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from orders.benchmarks import TITLE_OBJECTS, measure, number_offsets, synthetic_orders
+from orders.export import EXPORT_FIELD_MAP
+from orders.management.commands.load_orders import DOC_TYPE_MAP, EXCEL_TO_MODEL_MAP
+from orders.filters import filter_orders
+from orders.models import Order
+from orders.pagination import KeysetPaginator
+from orders.views import IndexView
+
+# Кеши изолированы от рабочих: данные бенчмарка живут в откатываемой
+# транзакции, и версии пространств имен в общем кеше для них не меняются
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'orders.cache.TieredCache',
+        'OPTIONS': {'SHARED_CACHE': 'shared'},
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-shared',
+    },
+    'registry': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'benchmark-registry',
+    },
+}
+
+SCENARIOS = [
+    'index', 'index_filter', 'index_doc_num', 'index_search', 'index_next_page',
+    'detail', 'export_csv', 'export_xlsx', 'load_orders',
+]
+# Тяжелые сценарии замеряются --heavy-repeat раз
+HEAVY_SCENARIOS = {'export_csv', 'export_xlsx', 'load_orders'}
+
+DEFAULT_OUTPUT_DIR = 'benchmark-results'
+
+
+class QueryCounter:
+    """Обертка выполнения запросов (connection.execute_wrapper), считающая запросы."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = ('Набор бенчмарков горячих точек реестра (главная страница с фильтрами и '
+            'поиском, карточка приказа, экспорт, импорт load_orders) на синтетических '
+            'данных: перцентили времени ответа, число запросов к БД, пиковая память. '
+            'Результат сохраняется в JSON для сравнения между коммитами.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=50000,
+                            help='Сколько синтетических приказов добавить на время замеров '
+                                 '(0 — замерять на имеющихся данных)')
+        parser.add_argument('--repeat', type=int, default=30,
+                            help='Замеров на сценарий')
+        parser.add_argument('--heavy-repeat', type=int, default=3,
+                            help='Замеров на тяжелый сценарий (экспорт, импорт)')
+        parser.add_argument('--load-rows', type=int, default=2000,
+                            help='Строк в Excel-файле сценария load_orders')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS, default=[],
+                            help='Запустить только указанные сценарии (можно несколько раз)')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', type=str, default='',
+                            help=f'Файл результатов (по умолчанию {DEFAULT_OUTPUT_DIR}/<коммит>-<время>.json)')
+        parser.add_argument('--compare', type=str, default='',
+                            help='JSON с прошлыми результатами: вывести изменения')
+        parser.add_argument('--threshold', type=float, default=20.0,
+                            help='Рост медианы или p95 в процентах, который считается регрессией')
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as f:
+                    previous = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'Не удалось прочитать {options["compare"]}: {e}')
+
+        # Журнал действий на каждый запрос только добавляет шум (и писал бы в БД вне транзакции)
+        logging.disable(logging.INFO)
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES,
+                                   ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']), \
+                    tempfile.TemporaryDirectory(prefix='benchmark_suite_') as work_dir, \
+                    transaction.atomic():
+                self.work_dir = work_dir
+                results = self._run(options)
+                transaction.set_rollback(True)
+        finally:
+            logging.disable(logging.NOTSET)
+
+        output = options['output'] or os.path.join(
+            DEFAULT_OUTPUT_DIR, f"{results['meta']['commit'] or 'nocommit'}-"
+                                f"{datetime.now():%Y%m%d-%H%M%S}.json")
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        self.stdout.write(self.style.SUCCESS(f'Результаты сохранены в {output}'))
+
+        if previous:
+            self._compare(previous, results, options['threshold'])
+
+    # --- Замеры ---
+
+    def _run(self, options):
+        if options['orders']:
+            self._populate(options['orders'], options['seed'])
+
+        user, _ = get_user_model().objects.get_or_create(username='benchmark_suite')
+        client = Client()
+        client.force_login(user)
+
+        scenarios = self._scenarios(client, options)
+        results = {
+            'meta': self._meta(options),
+            'scenarios': {},
+        }
+        self.stdout.write(
+            f"{'Сценарий':<16} {'замеров':>7} {'median, мс':>11} {'p95, мс':>9} {'p99, мс':>9} "
+            f"{'запросов':>9} {'пик памяти, МБ':>15}")
+        for name in options['scenario'] or SCENARIOS:
+            func = scenarios[name]
+            repeat = options['heavy_repeat'] if name in HEAVY_SCENARIOS else options['repeat']
+            stats = measure(func, repeat=repeat)
+
+            # Тестовый клиент очищает connection.queries в начале каждого запроса,
+            # поэтому запросы считаются оберткой выполнения
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                func()
+
+            tracemalloc.start()
+            func()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+            stats.update(repeat=repeat, queries=queries.count, peak_memory_mb=peak / 2 ** 20)
+            results['scenarios'][name] = stats
+            self.stdout.write(
+                f"{name:<16} {repeat:>7} {stats['median']:>11.2f} {stats['p95']:>9.2f} "
+                f"{stats['p99']:>9.2f} {stats['queries']:>9} {stats['peak_memory_mb']:>15.2f}")
+        return results
+
+    def _scenarios(self, client, options):
+        index_url = reverse('orders:index')
+        order = Order.objects.order_by('-id').first()
+        if order is None:
+            raise CommandError('В реестре нет приказов: задайте --orders больше нуля.')
+        year = order.issue_year or ''
+
+        def get(url, data=None):
+            def request():
+                response = client.get(url, data)
+                if response.status_code != 200:
+                    raise CommandError(f'{url}: ответ {response.status_code}')
+                # Потоковые ответы (экспорт) дочитываются до конца
+                if response.streaming:
+                    for _ in response.streaming_content:
+                        pass
+            return request
+
+        next_cursor = KeysetPaginator(filter_orders({}), IndexView.paginate_by).page().next_cursor
+        all_fields = list(EXPORT_FIELD_MAP)
+
+        return {
+            'index': get(index_url),
+            'index_filter': get(index_url, {'filter_year': year, 'filter_doc_type': order.doc_type}),
+            'index_doc_num': get(index_url, {'filter_doc_num': order.document_number}),
+            'index_search': get(index_url, {'search': TITLE_OBJECTS[1].split()[0]}),
+            'index_next_page': get(index_url, {'cursor': next_cursor or ''}),
+            'detail': get(reverse('orders:detail_order', args=[order.pk])),
+            'export_csv': get(reverse('orders:export_to_excel'), {'fields': all_fields, 'format': 'csv'}),
+            'export_xlsx': get(reverse('orders:export_to_excel'),
+                               {'fields': all_fields, 'format': 'xlsx', 'filter_year': year}),
+            'load_orders': self._load_orders_scenario(options),
+        }
+
+    def _load_orders_scenario(self, options):
+        """Импорт Excel-файла с новыми приказами; каждый замер откатывается."""
+        excel_path = os.path.join(self.work_dir, 'orders.xlsx')
+        pdf_dir = os.path.join(self.work_dir, 'scans')
+        os.makedirs(pdf_dir)
+
+        doc_type_names = {value: name for name, value in DOC_TYPE_MAP.items()}
+        workbook = openpyxl.Workbook(write_only=True)
+        sheet = workbook.create_sheet()
+        sheet.append(list(EXCEL_TO_MODEL_MAP))
+        for order in synthetic_orders(options['load_rows'], seed=options['seed'] + 1,
+                                      offsets=number_offsets()):
+            values = {field: getattr(order, field) for field in EXCEL_TO_MODEL_MAP.values()}
+            values['doc_type'] = doc_type_names[order.doc_type]
+            sheet.append([values[field] for field in EXCEL_TO_MODEL_MAP.values()])
+        workbook.save(excel_path)
+
+        def run():
+            with transaction.atomic():
+                call_command('load_orders', excel_path, pdf_dir, '--restart',
+                             stdout=StringIO(), stderr=StringIO())
+                transaction.set_rollback(True)
+        return run
+
+    def _populate(self, count, seed, batch_size=10000):
+        self.stdout.write(f'Создание {count} синтетических приказов...')
+        batch = []
+        for order in synthetic_orders(count, seed=seed, offsets=number_offsets()):
+            batch.append(order)
+            if len(batch) >= batch_size:
+                Order.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Order.objects.bulk_create(batch)
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE orders_order')
+
+    def _meta(self, options):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            commit = ''
+        return {
+            'commit': commit,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'orders': Order.objects.count(),
+            'synthetic_orders': options['orders'],
+            'seed': options['seed'],
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+        }
+
+    # --- Сравнение ---
+
+    def _compare(self, previous, current, threshold):
+        old_meta = previous.get('meta', {})
+        self.stdout.write('')
+        self.stdout.write(
+            f"Сравнение с {old_meta.get('commit') or '?'} от {old_meta.get('created_at') or '?'} "
+            f"(приказов: {old_meta.get('orders', '?')} -> {current['meta']['orders']})")
+        self.stdout.write(
+            f"{'Сценарий':<16} {'median, мс':>20} {'p95, мс':>20} {'запросов':>10}")
+        regressions = []
+        for name, stats in current['scenarios'].items():
+            old = previous.get('scenarios', {}).get(name)
+            if not old:
+                self.stdout.write(f'{name:<16} нет в прошлых результатах')
+                continue
+            cells = []
+            for key in ('median', 'p95'):
+                change = (stats[key] - old[key]) / old[key] * 100 if old[key] else 0.0
+                cells.append(f'{old[key]:.1f}->{stats[key]:.1f} ({change:+.0f}%)')
+                if change > threshold:
+                    regressions.append(f'{name} {key} {change:+.0f}%')
+            queries = f"{old.get('queries', '?')}->{stats['queries']}"
+            self.stdout.write(f'{name:<16} {cells[0]:>20} {cells[1]:>20} {queries:>10}')
+
+        if regressions:
+            self.stdout.write(self.style.ERROR('Регрессии: ' + ', '.join(regressions)))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'Регрессий больше {threshold:.0f}% нет.'))
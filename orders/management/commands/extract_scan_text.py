@@ -0,0 +1,95 @@
+import os
+import time
+from concurrent.futures import as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.result_cache import invalidate_registry
+from orders.scan_text import (
+    ScanTextError, extract_text, extraction_pool, is_available, pending_scans, queue_scan_texts,
+    save_text,
+)
+
+
+class Command(BaseCommand):
+    help = ('Извлекает текст сканов приказов для поиска по содержимому: текстовый слой PDF, '
+            'для сканов без него — распознавание SCAN_OCR_BACKEND. Ставит в очередь приказы '
+            'с новыми сканами (в том числе после load_orders) и обрабатывает очередь в пуле '
+            'процессов.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                            help='Число процессов (по умолчанию — число ядер)')
+        parser.add_argument('--batch-size', type=int, default=200,
+                            help='Сколько приказов из очереди обрабатывается за проход')
+        parser.add_argument('--force', action='store_true',
+                            help='Извлечь заново текст всех сканов')
+        parser.add_argument('--retry-failed', action='store_true',
+                            help='Повторить сканы, текст которых не удалось извлечь')
+        parser.add_argument('--watch', action='store_true',
+                            help='Не завершаться: обрабатывать сканы, поставленные в очередь '
+                                 'при сохранении приказов')
+        parser.add_argument('--poll-interval', type=float, default=5.0,
+                            help='Пауза между проверками пустой очереди в режиме --watch, сек.')
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError('Нет средства извлечения текста PDF: установите PyMuPDF '
+                               '(pip install pymupdf) или poppler-utils (pdftotext).')
+
+        queued = queue_scan_texts(force=options['force'], retry_failed=options['retry_failed'])
+        self.stdout.write(f'Поставлено в очередь: {queued}.')
+
+        done = failed = 0
+        started = time.perf_counter()
+        workers = max(options['workers'], 1)
+        pool = extraction_pool(workers)
+        try:
+            while True:
+                scans = pending_scans(options['batch_size'])
+                if not scans:
+                    if not options['watch']:
+                        break
+                    # load_orders сохраняет приказы без сигналов: их новые сканы
+                    # находит только повторная проверка
+                    queued = queue_scan_texts()
+                    if queued:
+                        self.stdout.write(f'Поставлено в очередь: {queued}.')
+                    else:
+                        time.sleep(options['poll_interval'])
+                    continue
+
+                futures = {pool.submit(extract_text, scan): scan for scan in scans}
+                pool_broken = False
+                for future in as_completed(futures):
+                    scan = futures[future]
+                    try:
+                        text, method = future.result()
+                    except BrokenProcessPool:
+                        # Процесс пула завершился аварийно (например, разбор PDF
+                        # исчерпал память): сканы, которые были в пуле, отмечаются
+                        # ошибкой (--retry-failed повторит их), пул создается заново
+                        pool_broken = True
+                        failed += save_text(scan, scans[scan],
+                                            error='Процесс извлечения текста завершился аварийно')
+                        self.stderr.write(f'Процесс извлечения текста {scan} завершился аварийно.')
+                    except Exception as e:
+                        error = str(e) if isinstance(e, ScanTextError) else (
+                            f'Не удалось извлечь текст {scan}: {e!r}')
+                        failed += save_text(scan, scans[scan], error=error)
+                        self.stderr.write(error)
+                    else:
+                        done += save_text(scan, scans[scan], text=text, method=method)
+                if pool_broken:
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = extraction_pool(workers)
+                # Найденные по тексту приказы не должны отдаваться из кеша старых результатов
+                invalidate_registry()
+                self.stdout.write(f'  извлечено: {done}, ошибок: {failed}')
+        finally:
+            pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Извлечен текст сканов приказов: {done}, не удалось: {failed} '
+            f'за {time.perf_counter() - started:.1f} с.'))
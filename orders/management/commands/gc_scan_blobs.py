@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from orders.models import Order
+from orders.scan_store import SCAN_BLOBS_DIR, collect_garbage
+
+
+class Command(BaseCommand):
+    help = ('Удаляет из хранилища сканов (MEDIA_ROOT/scan_blobs/) файлы, '
+            'на которые не ссылается ни один приказ.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-age', type=float, default=24,
+                            help='Не трогать файлы моложе указанного числа часов (по умолчанию 24): '
+                                 'их может использовать незавершенный импорт')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только показать, сколько файлов будет удалено')
+
+    def handle(self, *args, **options):
+        referenced = set(
+            Order.objects
+            .filter(scan__startswith=f'{SCAN_BLOBS_DIR}/')
+            .values_list('scan', flat=True)
+        )
+        removed, freed = collect_garbage(
+            referenced, min_age=options['min_age'] * 3600, dry_run=options['dry_run'])
+
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action} файлов: {removed} ({freed / 2 ** 20:.1f} МБ). '
+            f'Используется приказами: {len(referenced)}.'))
@@ -0,0 +1,74 @@
+import os
+import random
+import tempfile
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from orders.benchmarks import number_offsets, synthetic_orders, synthetic_pdf
+from orders.facets import rebuild_facets
+from orders.models import Order
+from orders.result_cache import invalidate_registry
+from orders.scan_store import store_scan
+
+
+class Command(BaseCommand):
+    help = ('Создает в реестре N синтетических приказов (правдоподобные названия, '
+            'даты за несколько лет, оба вида документов, при желании — сканы) '
+            'для нагрузочного тестирования и бенчмарков.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int, help='Количество приказов')
+        parser.add_argument('--start-year', type=int, default=2000)
+        parser.add_argument('--years', type=int, default=25,
+                            help='На сколько лет распределить даты издания')
+        parser.add_argument('--scans', type=float, default=0.0,
+                            help='Доля приказов со сканом, от 0 до 1 (по умолчанию 0)')
+        parser.add_argument('--batch-size', type=int, default=5000,
+                            help='Сколько приказов записывать одной транзакцией')
+        parser.add_argument('--seed', type=int, default=None,
+                            help='Зерно генератора для воспроизводимых данных')
+
+    def handle(self, *args, **options):
+        rnd = random.Random(options['seed'])
+        # Нумерация продолжается после уже существующих номеров
+        orders = synthetic_orders(
+            options['count'], start_year=options['start_year'], years=options['years'],
+            seed=options['seed'], offsets=number_offsets())
+
+        created = with_scans = 0
+        batch = []
+        with tempfile.TemporaryDirectory() as scan_dir:
+            for order in orders:
+                if options['scans'] and rnd.random() < options['scans']:
+                    order.scan.name = self._make_scan(order, scan_dir)
+                    with_scans += 1
+                batch.append(order)
+                if len(batch) >= options['batch_size']:
+                    created += self._save(batch)
+                    batch = []
+            if batch:
+                created += self._save(batch)
+
+        # bulk_create не отправляет сигналы: счетчики и кеш реестра обновляются явно
+        rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано {created} синтетических приказов, из них со сканом: {with_scans}.'))
+
+    def _save(self, batch):
+        with transaction.atomic():
+            Order.objects.bulk_create(batch)
+            invalidate_registry()
+        self.stdout.write(f'  записано {len(batch)} приказов')
+        return len(batch)
+
+    @staticmethod
+    def _make_scan(order, scan_dir):
+        # Содержимое уникально для приказа, поэтому каждый скан — отдельный blob
+        path = os.path.join(scan_dir, 'scan.pdf')
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf(
+                f'{order.doc_type} {order.document_number} {order.issue_date:%d.%m.%Y}'))
+        name, _ = store_scan(path)
+        os.remove(path)
+        return name
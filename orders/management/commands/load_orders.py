@@ -1,29 +1,17 @@
 import os
-import shutil
-from datetime import datetime
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 
+import openpyxl
 import pandas as pd
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.db import transaction
-from django.conf import settings
-from django.db.models import Q
 
-# Предполагаем, что orders.models.py доступен в PYTHONPATH
-try:
-    from orders.models import Order, order_scan_upload_to
-except ImportError:
-    # Запасной вариант, если orders.models не импортируется
-    class TempOrder:
-        DOC_TYPE_ORDER = 'order'
-        DOC_TYPE_DECREE = 'decree'
-
-
-    Order = TempOrder
-
-
-    def order_scan_upload_to(instance, filename):
-        # Если импорт не сработал, используем временный упрощенный путь
-        return os.path.join('orders_scan', str(getattr(instance, 'issue_date', datetime.now()).year), filename)
+from orders.facets import adjust_facets
+from orders.models import ImportCheckpoint, Order
+from orders.result_cache import invalidate_registry
+from orders.scan_store import STORED_EXISTING, file_sha256, locate_scan, store_scan
 
 # Маппинг для преобразования текста из Excel в ключи модели
 DOC_TYPE_MAP = {
@@ -46,17 +34,39 @@ EXCEL_TO_MODEL_MAP = {
 }
 
 
+def is_blank_row(values):
+    """
+    Пустая строка листа. Оба способа чтения пропускают такие строки, поэтому
+    номер строки в контрольной точке означает одно и то же для openpyxl и pandas.
+    """
+    return all(value is None or (isinstance(value, str) and not value.strip()) for value in values)
+
+
 class Command(BaseCommand):
     help = 'Загружает данные о приказах из Excel-файла и прикрепляет сканы.'
 
     def add_arguments(self, parser):
         parser.add_argument('excel_path', type=str, help='Путь к Excel-файлу')
         parser.add_argument('pdf_dir', type=str, help='Путь к директории с PDF-файлами сканов')
+        parser.add_argument('--batch-size', type=int, default=500,
+                            help='Сколько строк фиксировать в БД одной транзакцией (по умолчанию 500)')
+        parser.add_argument('--restart', action='store_true',
+                            help='Начать импорт с первой строки, игнорируя контрольную точку')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='Сколько сканов копировать параллельно (по умолчанию 4)')
+        parser.add_argument('--reader', choices=['openpyxl', 'pandas'], default='openpyxl',
+                            help='Чтение Excel: openpyxl — построчно без загрузки файла в память '
+                                 '(по умолчанию), pandas — целиком через DataFrame')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Только сравнить файл с базой и показать, сколько приказов будет '
+                                 'создано и изменено, ничего не записывая')
 
-    @transaction.atomic
     def handle(self, *args, **kwargs):
+        self.verbosity = kwargs['verbosity']
+        self.dry_run = kwargs['dry_run']
         excel_path = kwargs['excel_path']
         pdf_dir = kwargs['pdf_dir']
+        batch_size = kwargs['batch_size']
 
         if not os.path.exists(excel_path):
             self.stderr.write(
@@ -68,183 +78,363 @@ class Command(BaseCommand):
                 self.style.ERROR(f'Директория со сканами не найдена: {pdf_dir}'))
             return
 
-        # Чтение данных из Excel
+        if batch_size < 1 or kwargs['workers'] < 1:
+            self.stderr.write(
+                self.style.ERROR('Размер пакета и число потоков должны быть положительными числами.'))
+            return
+
+        # Чтение данных из Excel: строки идут генератором прямо в пакетную запись
+        read_rows = self._read_openpyxl if kwargs['reader'] == 'openpyxl' else self._read_pandas
         try:
-            df = pd.read_excel(excel_path)
-            # Приводим названия столбцов к нижнему регистру и удаляем пробелы
-            df.columns = [col.strip() for col in df.columns]
-            orders_data = df.to_dict('records')
+            total_rows, orders_data = read_rows(excel_path)
         except Exception as e:
             self.stderr.write(
                 self.style.ERROR(f'Ошибка при чтении Excel: {e}'))
             return
 
+        if total_rows is not None:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'В файле {total_rows} записей.'))
+        total_label = f' из {total_rows}' if total_rows is not None else ''
+
+        # Контрольная точка привязана к содержимому файла: измененный файл
+        # импортируется с начала. Проверка без записи всегда идет с начала файла.
+        if self.dry_run:
+            checkpoint = ImportCheckpoint(last_row=0)
+        else:
+            checkpoint, _ = ImportCheckpoint.objects.get_or_create(
+                file_hash=file_sha256(excel_path),
+                defaults={'file_name': os.path.basename(excel_path)})
+        if kwargs['restart']:
+            checkpoint.last_row = 0
+        elif checkpoint.last_row:
+            self.stdout.write(self.style.NOTICE(
+                f'Найдена контрольная точка: строки 1–{checkpoint.last_row} уже загружены, '
+                f'импорт продолжится со строки {checkpoint.last_row + 1}.'))
+
+        self.created_count = 0
+        self.updated_count = 0
+        self.unchanged_count = 0
+        # Сколько строк изменило каждое поле
+        self.changed_fields = Counter()
+        self.file_errors = 0
+        # Сколько сканов сохранено каждым способом (см. orders.scan_store)
+        self.stored_scans = Counter()
+
+        # Один проход по директории вместо проверки нескольких имен на каждую строку
+        self.scan_index = self._build_scan_index(pdf_dir)
+        self.stdout.write(f'В директории сканов найдено {len(self.scan_index)} PDF-файлов.')
+
+        # Номера строк данных считаются с 1 (без строки заголовков)
+        rows = islice(enumerate(orders_data, start=1), checkpoint.last_row, None)
+        with ThreadPoolExecutor(max_workers=kwargs['workers']) as self.executor:
+            for chunk in self._chunked(rows, batch_size):
+                first_row, last_row = chunk[0][0], chunk[-1][0]
+                try:
+                    # Пакет и контрольная точка фиксируются одной транзакцией
+                    with transaction.atomic():
+                        self._import_chunk([row for _, row in chunk])
+                        if not self.dry_run:
+                            checkpoint.last_row = last_row
+                            checkpoint.save(update_fields=['last_row', 'updated_at'])
+                except Exception as e:
+                    # Контрольная точка предыдущих пакетов уже зафиксирована; ненулевой
+                    # код выхода нужен, чтобы cron и CI не сочли импорт успешным
+                    raise CommandError(
+                        f'Ошибка при загрузке строк {first_row}–{last_row}: {str(e).strip()}. '
+                        f'Изменения этого пакета отменены; повторный запуск продолжит '
+                        f'импорт со строки {first_row}.') from e
+                self.stdout.write(
+                    f'{"Проверены" if self.dry_run else "Загружены"} строки {first_row}–{last_row}{total_label}. '
+                    f'Сканы: уже в хранилище {self.stored_scans[STORED_EXISTING]}, '
+                    f'добавлено {sum(self.stored_scans.values()) - self.stored_scans[STORED_EXISTING]}, '
+                    f'ошибок {self.file_errors}.')
+
+        changed_fields = ', '.join(
+            f'{field}: {count}' for field, count in self.changed_fields.most_common())
+
+        if self.dry_run:
+            self.stdout.write(self.style.WARNING('Режим проверки (--dry-run): изменения не записаны.'))
+            self.stdout.write(f'Будет создано новых приказов: {self.created_count}.')
+            self.stdout.write(f'Будет изменено приказов: {self.updated_count}'
+                              + (f' (поля — {changed_fields}).' if changed_fields else '.'))
+            self.stdout.write(f'Без изменений: {self.unchanged_count}.')
+            return
+
+        # Импорт завершен: следующий запуск с тем же файлом начнется с начала
+        checkpoint.delete()
+
         self.stdout.write(
             self.style.SUCCESS(
-                f'Загружено {len(orders_data)} записей из файла.'))
-
+                f'Успешно создано {self.created_count} новых приказов.'))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Успешно обновлено {self.updated_count} существующих приказов'
+                + (f' (поля — {changed_fields}).' if changed_fields else '.')))
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Без изменений: {self.unchanged_count} приказов.'))
+
+        if self.file_errors > 0:
+            self.stderr.write(self.style.ERROR(f"Обнаружено {self.file_errors} ошибок при копировании файлов."))
+
+    @staticmethod
+    def _read_openpyxl(path):
+        """
+        Построчное чтение в режиме read_only: в памяти находится только
+        текущая строка листа. Возвращает (примерное число строк, генератор словарей).
+        """
+        workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+        sheet = workbook.active
+        rows = sheet.iter_rows(values_only=True)
+        header = next(rows, ())
+        # Удаляем пробелы в названиях столбцов
+        columns = [str(col).strip() if col is not None else None for col in header]
+        total_rows = sheet.max_row - 1 if sheet.max_row else None
+
+        def generate():
+            try:
+                for values in rows:
+                    if is_blank_row(values):
+                        continue
+                    yield {col: value for col, value in zip(columns, values) if col}
+            finally:
+                workbook.close()
+
+        return total_rows, generate()
+
+    @staticmethod
+    def _read_pandas(path):
+        """
+        Чтение всего листа через pandas; пустые ячейки (NaN) становятся None,
+        пустые строки пропускаются, как и при чтении openpyxl.
+        """
+        df = pd.read_excel(path)
+        # Удаляем пробелы в названиях столбцов
+        df.columns = [str(col).strip() for col in df.columns]
+        df = df.astype(object).where(df.notna(), None)
+        columns = list(df.columns)
+        records = [values for values in df.itertuples(index=False, name=None)
+                   if not is_blank_row(values)]
+        return len(records), (dict(zip(columns, values)) for values in records)
+
+    @staticmethod
+    def _build_scan_index(pdf_dir):
+        """Индекс PDF-файлов директории: имя в нижнем регистре -> полный путь."""
+        with os.scandir(pdf_dir) as entries:
+            return {
+                entry.name.lower(): entry.path
+                for entry in entries
+                if entry.is_file() and entry.name.lower().endswith('.pdf')
+            }
+
+    @staticmethod
+    def _chunked(iterable, size):
+        iterator = iter(iterable)
+        while chunk := list(islice(iterator, size)):
+            yield chunk
+
+    def _import_chunk(self, rows):
+        """Создает и обновляет приказы одного пакета строк одним upsert-запросом."""
+        prepared = [self._prepare_row(row) for row in rows]
+        prepared = [item for item in prepared if item is not None]
+
+        self._store_scans(prepared)
+
+        # 4. Строки с одинаковым ключом (вид, номер, год) — один приказ:
+        # действует последняя из них
+        incoming = {self._natural_key(defaults): defaults for _, defaults, _ in prepared}
+
+        # Для сравнения из БД читаются только приказы с номерами из текущего пакета
         existing_orders = {
-            order.document_number: order
-            for order in Order.objects.all()
+            (order.doc_type, order.document_number, order.issue_year): order
+            for order in Order.objects.filter(
+                document_number__in={document_number for _, document_number, _ in incoming})
         }
 
-        orders_to_create = []
-        orders_to_update = []
-        file_errors = 0
+        orders_to_upsert = []
+        update_fields = set()
+        facet_deltas = Counter()
+        for key, defaults in incoming.items():
+            order_obj = existing_orders.get(key)
+            if order_obj is None:
+                self.created_count += 1
+                doc_type, _, issue_year = key
+                facet_deltas[(issue_year, doc_type)] += 1
+                orders_to_upsert.append(Order(**defaults))
+                continue
 
-        for row in orders_data:
-            defaults = {}
-            document_number = None
-            doc_type_name = None
+            # Обновляются только приказы и поля, значение которых действительно изменилось
+            changed = {
+                field for field, value in defaults.items()
+                if field not in ('doc_type', 'document_number')
+                and self._field_value(order_obj, field) != value
+            }
+            if not changed:
+                self.unchanged_count += 1
+                continue
 
-            # 1. Сбор и преобразование данных из строки Excel
-            for excel_col, model_field in EXCEL_TO_MODEL_MAP.items():
-                value = row.get(excel_col)
+            self.updated_count += 1
+            self.changed_fields.update(changed)
+            update_fields |= changed
+            orders_to_upsert.append(Order(**defaults))
 
-                # 1.1 Преобразование типа документа
-                if excel_col == 'Вид документа':
-                    doc_type_name = str(value).strip() if value else 'Приказ'
-                    defaults[model_field] = DOC_TYPE_MAP.get(doc_type_name, Order.DOC_TYPE_ORDER)
-                    continue
+        if self.dry_run or not orders_to_upsert:
+            return
 
-                # 1.2 Обработка номера документа
-                if model_field == 'document_number':
-                    document_number = str(value).strip() if value else None
-                    if document_number:
-                        defaults[model_field] = document_number
-                        continue
+        # 5. Один INSERT ... ON CONFLICT (вид, номер, год) DO UPDATE на пакет:
+        # новые приказы вставляются, у существующих перезаписываются только
+        # столбцы, изменившиеся хотя бы в одной строке пакета
+        if update_fields:
+            Order.objects.bulk_create(
+                orders_to_upsert,
+                update_conflicts=True,
+                unique_fields=Order.NATURAL_KEY_FIELDS,
+                update_fields=sorted(update_fields),
+            )
+        else:
+            Order.objects.bulk_create(orders_to_upsert)
+
+        # bulk_create не отправляет сигналы: счетчики реестра обновляются здесь же,
+        # в транзакции пакета. Вид и год входят в ключ upsert-а, поэтому меняются
+        # только счетчики новых приказов
+        adjust_facets(facet_deltas)
+        invalidate_registry()
+
+    @staticmethod
+    def _natural_key(defaults):
+        """Ключ (вид, номер, год) в том виде, в котором его хранит Order.issue_year."""
+        issue_date = defaults.get('issue_date')
+        return (defaults['doc_type'], defaults['document_number'],
+                issue_date.year if issue_date else 0)
+
+    @staticmethod
+    def _field_value(order, field_name):
+        """Текущее значение поля в том виде, в котором его формирует _prepare_row."""
+        value = getattr(order, field_name)
+        if field_name == 'scan':
+            return value.name or None
+        return value
+
+    def _store_scans(self, prepared):
+        """
+        Сохраняет сканы пакета в хранилище (orders.scan_store) пулом потоков
+        и ждет завершения. Если сохранить скан не удалось, ссылка на скан у
+        приказа не сохраняется.
+        """
+        # Несколько строк могут ссылаться на один и тот же исходный файл
+        futures = {
+            source_path: self.executor.submit(self._place_scan, source_path)
+            for _, _, source_path in prepared
+            if source_path
+        }
 
-                # 1.3 Сохранение остальных полей
-                if value is not None:
-                    if isinstance(value, str):
-                        defaults[model_field] = value.strip()
-                    else:
-                        defaults[model_field] = value
-
-                # Обеспечиваем, что None будет для пустых строк
-                if value is None or (isinstance(value, str) and not value.strip()):
-                    if model_field == 'issue_date':
-                        defaults[model_field] = None
-                    else:
-                        defaults[model_field] = ''  # Для CharField
-
-            if not document_number:
-                self.stderr.write(
-                    self.style.WARNING(f"Пропущена строка без номера документа: {row.get('Наименование документа')}"))
+        stored = {}
+        for source_path, future in futures.items():
+            try:
+                stored[source_path], method = future.result()
+            except Exception as e:
+                self.file_errors += 1
+                self.stderr.write(self.style.ERROR(
+                    f"  Ошибка копирования файла {source_path}: {e}"))
                 continue
 
-            # --- КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Преобразование issue_date в datetime.date ---
-            raw_issue_date = defaults.get('issue_date')
+            self.stored_scans[method] += 1
+            if self.verbosity > 1 and method != STORED_EXISTING:
+                self.stdout.write(self.style.NOTICE(
+                    f"  Скан {os.path.basename(source_path)} сохранен ({method}): {stored[source_path]}"))
+
+        for _, defaults, source_path in prepared:
+            defaults['scan'] = stored.get(source_path)
+
+    def _place_scan(self, source_path):
+        if not self.dry_run:
+            return store_scan(source_path)
+        # При проверке файл только хешируется, чтобы сравнить ссылку на скан
+        name, exists = locate_scan(source_path)
+        return name, STORED_EXISTING if exists else None
+
+    def _prepare_row(self, row):
+        """
+        Преобразует строку Excel в значения полей приказа и находит скан.
+        Возвращает (номер документа, значения полей, путь к исходному скану или None)
+        или None, если строку надо пропустить.
+        """
+        defaults = {}
+        document_number = None
+        doc_type_name = None
+
+        # 1. Сбор и преобразование данных из строки Excel
+        for excel_col, model_field in EXCEL_TO_MODEL_MAP.items():
+            value = row.get(excel_col)
+
+            # 1.1 Преобразование типа документа
+            if excel_col == 'Вид документа':
+                doc_type_name = str(value).strip() if value else 'Приказ'
+                defaults[model_field] = DOC_TYPE_MAP.get(doc_type_name, Order.DOC_TYPE_ORDER)
+                continue
 
-            if raw_issue_date:
-                try:
-                    # pd.to_datetime надежно парсит большинство форматов Excel/строк в Pandas Timestamp
-                    # errors='coerce' превратит невалидные даты в NaT
-                    parsed_date = pd.to_datetime(raw_issue_date, errors='coerce')
-
-                    if pd.notna(parsed_date):
-                        # Преобразуем Timestamp в стандартный Python date
-                        defaults['issue_date'] = parsed_date.date()
-                    else:
-                        # Если парсинг не удался
-                        self.stderr.write(self.style.WARNING(
-                            f"  Не удалось распознать дату '{raw_issue_date}' для документа №{document_number}. Устанавливается NULL."))
-                        defaults['issue_date'] = None
-                except Exception as e:
-                    self.stderr.write(self.style.ERROR(
-                        f"  Критическая ошибка парсинга даты {raw_issue_date}: {e}. Устанавливается NULL."))
+            # 1.2 Обработка номера документа
+            if model_field == 'document_number':
+                document_number = str(value).strip() if value else None
+                if document_number:
+                    defaults[model_field] = document_number
+                    continue
+
+            # 1.3 Сохранение остальных полей
+            if value is not None:
+                if isinstance(value, str):
+                    defaults[model_field] = value.strip()
+                elif model_field == 'issue_date':
+                    defaults[model_field] = value
+                else:
+                    # Число из Excel в текстовом поле сравнивается с БД как строка
+                    defaults[model_field] = str(value)
+
+            # Обеспечиваем, что None будет для пустых строк
+            if value is None or (isinstance(value, str) and not value.strip()):
+                if model_field == 'issue_date':
+                    defaults[model_field] = None
+                else:
+                    defaults[model_field] = ''  # Для CharField
+
+        if not document_number:
+            self.stderr.write(
+                self.style.WARNING(f"Пропущена строка без номера документа: {row.get('Наименование документа')}"))
+            return None
+
+        # --- КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Преобразование issue_date в datetime.date ---
+        raw_issue_date = defaults.get('issue_date')
+
+        if raw_issue_date:
+            try:
+                # pd.to_datetime надежно парсит большинство форматов Excel/строк в Pandas Timestamp
+                # errors='coerce' превратит невалидные даты в NaT
+                parsed_date = pd.to_datetime(raw_issue_date, errors='coerce')
+
+                if pd.notna(parsed_date):
+                    # Преобразуем Timestamp в стандартный Python date
+                    defaults['issue_date'] = parsed_date.date()
+                else:
+                    # Если парсинг не удался
+                    self.stderr.write(self.style.WARNING(
+                        f"  Не удалось распознать дату '{raw_issue_date}' для документа №{document_number}. Устанавливается NULL."))
                     defaults['issue_date'] = None
-            else:
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(
+                    f"  Критическая ошибка парсинга даты {raw_issue_date}: {e}. Устанавливается NULL."))
                 defaults['issue_date'] = None
-            # --- КОНЕЦ ИСПРАВЛЕНИЯ ---
-
-            # 2. Логика поиска PDF-файла (и создание temp_order)
-
-            base_file_name = f"{doc_type_name} {document_number}"
-
-            possible_names = [
-                f"{base_file_name}.pdf",
-                f"{base_file_name}.PDF",
-                f"{doc_type_name.lower()} {document_number}.pdf",
-                f"{doc_type_name.lower()} {document_number}.PDF",
-            ]
-
-            pdf_source_path = None
-            for name in possible_names:
-                full_path = os.path.join(pdf_dir, name)
-                if os.path.exists(full_path) and os.path.isfile(full_path):
-                    pdf_source_path = full_path
-                    break
-
-            # 3. Обработка скана
-            if pdf_source_path:
-
-                # 3.1 Создаем временный объект для генерации пути
-                # issue_date теперь гарантированно datetime.date или None
-                temp_order = Order(
-                    issue_date=defaults.get('issue_date'),
-                    document_number=document_number,
-                    doc_type=defaults.get('doc_type', Order.DOC_TYPE_ORDER)
-                )
-
-                # 3.2 Генерируем целевой путь к файлу в MEDIA_ROOT
-                target_filename = order_scan_upload_to(temp_order, os.path.basename(pdf_source_path))
-                target_full_path = os.path.join(settings.MEDIA_ROOT, target_filename)
+        else:
+            defaults['issue_date'] = None
+        # --- КОНЕЦ ИСПРАВЛЕНИЯ ---
 
-                # 3.3 Создаем целевую директорию (включая год/месяц)
-                os.makedirs(os.path.dirname(target_full_path), exist_ok=True)
+        # 2. Поиск PDF-файла по индексу директории (без учета регистра имени)
+        pdf_source_path = self.scan_index.get(f"{doc_type_name} {document_number}.pdf".lower())
 
-                try:
-                    # 3.4 Копируем файл из исходной папки в целевую
-                    shutil.copyfile(pdf_source_path, target_full_path)
-
-                    # 3.5 Устанавливаем относительный путь
-                    defaults['scan'] = target_filename
-                    self.stdout.write(
-                        self.style.NOTICE(f"  Файл для {document_number} найден и скопирован: {target_filename}"))
-
-                except Exception as e:
-                    file_errors += 1
-                    self.stderr.write(self.style.ERROR(f"  Ошибка копирования файла {pdf_source_path}: {e}"))
-                    defaults['scan'] = None
-            else:
-                self.stderr.write(self.style.WARNING(f"  Скан для документа №{document_number} не найден."))
-                defaults['scan'] = None
-
-            # 4. Сортировка по созданию или обновлению
-            if document_number in existing_orders:
-                order_obj = existing_orders[document_number]
-
-                for key, value in defaults.items():
-                    setattr(order_obj, key, value)
-
-                orders_to_update.append(order_obj)
-            else:
-                orders_to_create.append(Order(**defaults))
-
-        # 5. Выполнение bulk-операций
-        if orders_to_create:
-            Order.objects.bulk_create(orders_to_create)
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Успешно создано {len(orders_to_create)} новых приказов.'))
-
-        if orders_to_update:
-            fields_to_update = list(EXCEL_TO_MODEL_MAP.values())
-
-            if 'scan' not in fields_to_update:
-                fields_to_update.append('scan')
-
-            if 'document_number' in fields_to_update:
-                fields_to_update.remove('document_number')
-
-            Order.objects.bulk_update(
-                orders_to_update,
-                fields_to_update
-            )
-            self.stdout.write(
-                self.style.SUCCESS(
-                    f'Успешно обновлено {len(orders_to_update)} существующих приказов.'))
+        # 3. Сам скан сохраняется в хранилище пулом потоков для всего пакета
+        if not pdf_source_path:
+            self.stderr.write(self.style.WARNING(f"  Скан для документа №{document_number} не найден."))
+        defaults['scan'] = None
 
-        if file_errors > 0:
-            self.stderr.write(self.style.ERROR(f"Обнаружено {file_errors} ошибок при копировании файлов."))
\ No newline at end of file
+        return document_number, defaults, pdf_source_path
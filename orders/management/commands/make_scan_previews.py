@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from orders.models import Order
+from orders.scan_previews import PreviewError, ensure_preview, is_available
+
+
+class Command(BaseCommand):
+    help = ('Создает превью первой страницы для сканов приказов, у которых его еще нет '
+            '(иначе превью создается при первом открытии карточки приказа). '
+            'Можно запускать по расписанию после импорта.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true',
+                            help='Пересоздать превью для всех сканов')
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError('Нет средства отрисовки PDF: установите PyMuPDF '
+                               '(pip install pymupdf) или poppler-utils (pdftoppm).')
+
+        # Один blob может быть у нескольких приказов: превью создается один раз
+        scans = (
+            Order.objects.exclude(Q(scan='') | Q(scan__isnull=True))
+            .values_list('scan', flat=True).distinct().iterator(chunk_size=2000)
+        )
+        total = failed = 0
+        for scan in scans:
+            total += 1
+            try:
+                ensure_preview(scan, force=options['force'])
+            except PreviewError as e:
+                failed += 1
+                self.stderr.write(str(e))
+            if total % 500 == 0:
+                self.stdout.write(f'  обработано сканов: {total}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Сканов: {total}, превью не удалось создать: {failed}.'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from orders.facets import rebuild_facets
+from orders.models import OrderFacet
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики реестра (число приказов по годам и видам) '
+            'по таблице приказов. Нужна после изменения приказов в обход ORM.')
+
+    def handle(self, *args, **options):
+        rebuild_facets()
+        self.stdout.write(self.style.SUCCESS(
+            f'Счетчики реестра пересчитаны: {OrderFacet.objects.count()} записей.'))
@@ -0,0 +1,82 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from orders.instrumentation import collect_stats
+from orders.models import RequestProfile, RequestStat
+
+SORT_FIELDS = {
+    'total': '-total_time',
+    'requests': '-requests',
+    'max': '-max_time',
+    'db': '-db_time',
+    'queries': '-queries',
+    'duplicates': '-duplicate_queries',
+}
+
+
+class Command(BaseCommand):
+    help = ('Показатели запросов по представлениям (orders.instrumentation): среднее время '
+            'ответа с разбивкой на БД, шаблоны и Python, запросы к БД и их повторы, '
+            'сохраненные профили cProfile.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sort', choices=SORT_FIELDS, default='total',
+                            help='Сортировка (по умолчанию total — суммарное время)')
+        parser.add_argument('--view', type=str, default='',
+                            help='Только представления, имя которых содержит строку')
+        parser.add_argument('--duplicates', action='store_true',
+                            help='Показать пример повторяющегося запроса к БД для каждого представления')
+        parser.add_argument('--profiles', action='store_true',
+                            help='Список последних профилей cProfile')
+        parser.add_argument('--profile', type=int, default=None,
+                            help='Вывести профиль с указанным ID')
+        parser.add_argument('--reset', action='store_true',
+                            help='Удалить накопленные показатели и профили')
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            RequestStat.objects.all().delete()
+            RequestProfile.objects.all().delete()
+            self.stdout.write(self.style.SUCCESS('Показатели и профили удалены.'))
+            return
+        if options['profile'] is not None:
+            self._print_profile(options['profile'])
+            return
+        if options['profiles']:
+            self._print_profiles()
+            return
+
+        rows = collect_stats(SORT_FIELDS[options['sort']], options['view'])
+        if not rows:
+            self.stdout.write('Показателей пока нет (замеры включает INSTRUMENTATION_ENABLED=True, '
+                              'процессы сохраняют их раз в INSTRUMENTATION_FLUSH_INTERVAL секунд).')
+            return
+        self.stdout.write(
+            f"{'Представление':<40} {'запросов':>9} {'ср., мс':>8} {'БД':>7} {'шабл.':>7} "
+            f"{'Python':>7} {'макс.':>8} {'SQL':>6} {'повт.':>6} {'медл.':>6} {'5xx':>5}")
+        for row in rows:
+            self.stdout.write(
+                f"{row['method'] + ' ' + row['view']:<40} {row['requests']:>9} {row['avg_time']:>8.1f} "
+                f"{row['avg_db_time']:>7.1f} {row['avg_template_time']:>7.1f} "
+                f"{row['avg_python_time']:>7.1f} {row['max_time']:>8.1f} {row['avg_queries']:>6.1f} "
+                f"{row['duplicate_queries']:>6} {row['slow']:>6} {row['errors']:>5}")
+            if options['duplicates'] and row['duplicate_sql']:
+                self.stdout.write(f"    повтор: {row['duplicate_sql']}")
+        self.stdout.write('Время — среднее на запрос; SQL — среднее число запросов к БД; '
+                          'повт. — всего повторных выполнений одинаковых запросов.')
+
+    def _print_profiles(self):
+        profiles = RequestProfile.objects.order_by('-created_at')[:50]
+        for profile in profiles:
+            self.stdout.write(
+                f'{profile.pk:>6}  {profile.created_at:%d.%m.%Y %H:%M:%S}  {profile.method:<6} '
+                f'{profile.path[:60]:<60} {profile.status_code}  {profile.total_time:>8.1f} мс  '
+                f'SQL: {profile.queries}')
+
+    def _print_profile(self, pk):
+        profile = RequestProfile.objects.filter(pk=pk).first()
+        if profile is None:
+            raise CommandError(f'Профиль {pk} не найден.')
+        self.stdout.write(
+            f'{profile.method} {profile.path} -> {profile.status_code}, '
+            f'{profile.total_time:.1f} мс, запросов к БД: {profile.queries}')
+        self.stdout.write(profile.stats)
@@ -0,0 +1,94 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from orders.export_jobs import (
+    claim_next_job, delete_expired_jobs, requeue_stale_jobs, run_export_job,
+)
+from orders.models import ExportJob
+
+
+# Как часто удалять устаревшие задачи экспорта, сек.
+CLEANUP_INTERVAL = 3600
+
+
+class Command(BaseCommand):
+    help = ('Обрабатывает очередь фоновых задач экспорта (ExportJob) и удаляет '
+            'завершенные задачи с файлами по истечении срока хранения.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Количество задач, выполняемых одновременно (потоки)')
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help='Пауза между проверками пустой очереди, сек.')
+        parser.add_argument('--stale-after', type=int, default=60,
+                            help='Через сколько минут зависшая задача возвращается в очередь')
+        parser.add_argument('--keep-hours', type=float, default=24,
+                            help='Сколько часов хранить файлы завершенных задач (по умолчанию 24)')
+        parser.add_argument('--once', action='store_true',
+                            help='Обработать текущую очередь и завершиться')
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(minutes=options['stale_after']))
+        if requeued:
+            self.stdout.write(self.style.WARNING(f'Возвращено в очередь зависших задач: {requeued}'))
+
+        self.keep = timedelta(hours=options['keep_hours'])
+        self.cleanup_lock = threading.Lock()
+        self.next_cleanup = 0.0
+        self._cleanup()
+
+        workers = max(options['workers'], 1)
+        self.stdout.write(self.style.SUCCESS(f'Воркер экспорта запущен, потоков: {workers}.'))
+
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(self._work, stop, options['poll_interval'], options['once'])
+                for _ in range(workers)
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except KeyboardInterrupt:
+                self.stdout.write('Остановка: дожидаемся завершения текущих задач...')
+                stop.set()
+
+    def _work(self, stop, poll_interval, once):
+        try:
+            while not stop.is_set():
+                job = claim_next_job()
+                if job is None:
+                    if once:
+                        return
+                    self._cleanup()
+                    stop.wait(poll_interval)
+                    continue
+
+                started = time.perf_counter()
+                job = run_export_job(job)
+                elapsed = time.perf_counter() - started
+                if job.status == ExportJob.STATUS_DONE:
+                    self.stdout.write(self.style.SUCCESS(
+                        f'Задача #{job.pk}: выгружено {job.row_count} строк за {elapsed:.1f} с.'))
+                else:
+                    self.stderr.write(self.style.ERROR(f'Задача #{job.pk}: ошибка: {job.error}'))
+        finally:
+            # У каждого потока свое соединение с БД
+            connection.close()
+
+    def _cleanup(self):
+        # Один поток из простаивающих, не чаще раза в CLEANUP_INTERVAL
+        if time.monotonic() < self.next_cleanup or not self.cleanup_lock.acquire(blocking=False):
+            return
+        try:
+            self.next_cleanup = time.monotonic() + CLEANUP_INTERVAL
+            deleted = delete_expired_jobs(self.keep)
+            if deleted:
+                self.stdout.write(f'Удалено устаревших задач экспорта: {deleted}')
+        finally:
+            self.cleanup_lock.release()
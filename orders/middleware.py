@@ -0,0 +1,17 @@
+from django.contrib.auth import middleware as auth_middleware
+
+
+class AuthenticationMiddleware(auth_middleware.AuthenticationMiddleware):
+    """
+    AuthenticationMiddleware без перехода в поток под ASGI.
+
+    Стандартный слой (MiddlewareMixin) вызывает process_request через
+    sync_to_async, хотя тот только подставляет ленивые request.user и
+    request.auser, не обращаясь к БД. Здесь process_request вызывается прямо
+    в цикле событий; пользователь загружается позже: асинхронными
+    представлениями через await request.auser(), синхронными — как обычно.
+    """
+
+    async def __acall__(self, request):
+        self.process_request(request)
+        return await self.get_response(request)
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:10
+
+import django.contrib.postgres.indexes
+import django.db.models.functions.text
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_search_vector_order_order_search_vector_gin'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='order',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('document_number'), name='gin_trgm_ops'), name='order_doc_number_trgm'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exportjob',
+            name='export_format',
+            field=models.CharField(choices=[('xlsx', 'Excel (XLSX)'), ('csv', 'CSV'), ('parquet', 'Parquet')], default='xlsx', max_length=10, verbose_name='Формат'),
+        ),
+    ]
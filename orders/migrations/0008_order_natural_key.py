@@ -0,0 +1,46 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:26
+
+import django.db.models.functions.comparison
+import django.db.models.functions.datetime
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def check_duplicates(apps, schema_editor):
+    """Уникальный ключ нельзя создать, пока в реестре есть дубликаты: перечисляем их."""
+    Order = apps.get_model('orders', 'Order')
+    duplicates = list(
+        Order.objects
+        .values('doc_type', 'document_number', 'issue_year')
+        .annotate(count=Count('id'))
+        .filter(count__gt=1)
+        .order_by('issue_year', 'document_number')[:50]
+    )
+    if duplicates:
+        listing = '\n'.join(
+            f"  {row['doc_type']} №{row['document_number']} за {row['issue_year'] or 'неизвестный'} год: "
+            f"{row['count']} записей"
+            for row in duplicates)
+        raise RuntimeError(
+            'В реестре есть приказы с одинаковыми видом, номером и годом. '
+            'Объедините или исправьте их и повторите миграцию:\n' + listing)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='issue_year',
+            field=models.GeneratedField(db_persist=True, expression=django.db.models.functions.comparison.Coalesce(django.db.models.functions.datetime.ExtractYear('issue_date'), 0), output_field=models.PositiveSmallIntegerField(), verbose_name='Год издания'),
+        ),
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(fields=('doc_type', 'document_number', 'issue_year'), name='order_unique_natural_key', violation_error_message='Документ этого вида с таким номером в этом году уже существует.'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:29
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def fill_facets(apps, schema_editor):
+    Order = apps.get_model('orders', 'Order')
+    OrderFacet = apps.get_model('orders', 'OrderFacet')
+    OrderFacet.objects.bulk_create(
+        OrderFacet(issue_year=row['issue_year'], doc_type=row['doc_type'], count=row['count'])
+        for row in Order.objects.values('issue_year', 'doc_type').annotate(count=Count('id'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_order_natural_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OrderFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('issue_year', models.PositiveSmallIntegerField(verbose_name='Год издания')),
+                ('doc_type', models.CharField(choices=[('order', 'Приказ'), ('decree', 'Распоряжение')], max_length=10, verbose_name='Вид документа')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='Количество приказов')),
+            ],
+            options={
+                'verbose_name': 'Счетчик реестра',
+                'verbose_name_plural': 'Счетчики реестра',
+                'constraints': [models.UniqueConstraint(fields=('issue_year', 'doc_type'), name='order_facet_unique')],
+            },
+        ),
+        migrations.RunPython(fill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:36
+
+import django.contrib.postgres.indexes
+import django.core.serializers.json
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0009_orderfacet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Время')),
+                ('username', models.CharField(blank=True, max_length=150, verbose_name='Пользователь')),
+                ('action', models.CharField(choices=[('view_registry', 'Просмотр реестра'), ('view_order', 'Просмотр приказа'), ('create', 'Создание приказа'), ('update', 'Изменение приказа'), ('delete', 'Удаление приказа'), ('export', 'Экспорт'), ('export_job', 'Фоновый экспорт'), ('export_download', 'Скачивание фонового экспорта'), ('cancel', 'Отмена в форме'), ('ui', 'Действие в интерфейсе')], max_length=32, verbose_name='Действие')),
+                ('order_id', models.BigIntegerField(blank=True, null=True, verbose_name='ID приказа')),
+                ('params', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, verbose_name='Параметры')),
+            ],
+            options={
+                'verbose_name': 'Событие журнала',
+                'verbose_name_plural': 'События журнала',
+                'indexes': [models.Index(fields=['username', 'created_at'], name='audit_user_time_idx'), models.Index(fields=['order_id', 'created_at'], name='audit_order_time_idx'), django.contrib.postgres.indexes.BrinIndex(fields=['created_at'], name='audit_time_brin')],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_auditevent'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Время')),
+                ('view', models.CharField(max_length=200, verbose_name='Представление')),
+                ('method', models.CharField(max_length=10, verbose_name='HTTP-метод')),
+                ('path', models.CharField(max_length=2000, verbose_name='Адрес')),
+                ('status_code', models.PositiveSmallIntegerField(verbose_name='Код ответа')),
+                ('total_time', models.FloatField(verbose_name='Время ответа, мс')),
+                ('queries', models.PositiveIntegerField(verbose_name='Запросов к БД')),
+                ('stats', models.TextField(verbose_name='Статистика pstats')),
+            ],
+            options={
+                'verbose_name': 'Профиль запроса',
+                'verbose_name_plural': 'Профили запросов',
+            },
+        ),
+        migrations.CreateModel(
+            name='RequestStat',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('view', models.CharField(max_length=200, verbose_name='Представление')),
+                ('method', models.CharField(max_length=10, verbose_name='HTTP-метод')),
+                ('requests', models.PositiveBigIntegerField(default=0, verbose_name='Запросов')),
+                ('errors', models.PositiveBigIntegerField(default=0, verbose_name='Ответов 5xx')),
+                ('slow', models.PositiveBigIntegerField(default=0, verbose_name='Медленных запросов')),
+                ('total_time', models.FloatField(default=0, verbose_name='Время ответа, мс')),
+                ('db_time', models.FloatField(default=0, verbose_name='Время БД, мс')),
+                ('template_time', models.FloatField(default=0, verbose_name='Время шаблонов, мс')),
+                ('python_time', models.FloatField(default=0, verbose_name='Время Python, мс')),
+                ('max_time', models.FloatField(default=0, verbose_name='Максимальное время ответа, мс')),
+                ('queries', models.PositiveBigIntegerField(default=0, verbose_name='Запросов к БД')),
+                ('duplicate_queries', models.PositiveBigIntegerField(default=0, verbose_name='Повторных запросов к БД')),
+                ('requests_with_duplicates', models.PositiveBigIntegerField(default=0, verbose_name='Запросов с повторами')),
+                ('duplicate_sql', models.TextField(blank=True, verbose_name='Пример повторного запроса')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Показатели представления',
+                'verbose_name_plural': 'Показатели представлений',
+                'constraints': [models.UniqueConstraint(fields=('view', 'method'), name='request_stat_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0011_requeststat_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='auditevent',
+            name='action',
+            field=models.CharField(choices=[('view_registry', 'Просмотр реестра'), ('view_order', 'Просмотр приказа'), ('create', 'Создание приказа'), ('update', 'Изменение приказа'), ('delete', 'Удаление приказа'), ('export', 'Экспорт'), ('export_job', 'Фоновый экспорт'), ('export_download', 'Скачивание фонового экспорта'), ('cancel', 'Отмена в форме'), ('ui', 'Действие в интерфейсе'), ('view_scan', 'Просмотр скана')], max_length=32, verbose_name='Действие'),
+        ),
+    ]
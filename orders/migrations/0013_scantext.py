@@ -0,0 +1,34 @@
+# Generated by Django 5.2.8 on 2026-10-18 00:53
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_auditevent_view_scan'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanText',
+            fields=[
+                ('order', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='scan_text', serialize=False, to='orders.order', verbose_name='Приказ')),
+                ('scan', models.CharField(max_length=255, verbose_name='Скан')),
+                ('status', models.CharField(choices=[('pending', 'В очереди'), ('done', 'Извлечен'), ('failed', 'Ошибка')], db_index=True, default='pending', max_length=10, verbose_name='Статус')),
+                ('method', models.CharField(blank=True, choices=[('text', 'Текстовый слой PDF'), ('ocr', 'Распознавание (OCR)')], max_length=10, verbose_name='Способ извлечения')),
+                ('text', models.TextField(blank=True, verbose_name='Текст')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('extracted_at', models.DateTimeField(blank=True, null=True, verbose_name='Извлечен')),
+                ('search_vector', models.GeneratedField(db_persist=True, expression=django.contrib.postgres.search.SearchVector('text', config='russian'), output_field=django.contrib.postgres.search.SearchVectorField())),
+            ],
+            options={
+                'verbose_name': 'Текст скана',
+                'verbose_name_plural': 'Тексты сканов',
+                'indexes': [django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='scan_text_search_vector_gin')],
+            },
+        ),
+    ]
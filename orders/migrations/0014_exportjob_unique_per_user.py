@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:04
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0013_scantext'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='exportjob',
+            name='export_job_unique_in_flight',
+        ),
+        migrations.AddConstraint(
+            model_name='exportjob',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['pending', 'running'])), fields=('fingerprint', 'created_by'), name='export_job_unique_in_flight', nulls_distinct=False),
+        ),
+    ]
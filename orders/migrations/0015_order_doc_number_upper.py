@@ -0,0 +1,18 @@
+# Generated by Django 5.2.8 on 2026-10-18 01:15
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0014_exportjob_unique_per_user'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(django.db.models.functions.text.Upper('document_number'), name='order_doc_number_upper'),
+        ),
+    ]
@@ -1,9 +1,20 @@
 import os
 from datetime import datetime
 
-from django.db import models
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.contrib.postgres.indexes import BrinIndex, GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.db import models, transaction
+from django.db.models.functions import Coalesce, ExtractYear, Upper
 from django.utils import timezone
 
+from orders.scan_previews import scan_version
+from orders.scan_store import is_blob_name
+
+# Конфигурация полнотекстового поиска PostgreSQL для названий документов
+SEARCH_CONFIG = 'russian'
+
 
 # Create your models here.
 def order_scan_upload_to(instance, filename):
@@ -88,9 +99,470 @@ class Order(models.Model):
         blank=True,
         null=True)
 
+    # Хранимый tsvector по названию документа. Генерируется самой БД
+    # (GENERATED ALWAYS ... STORED), поэтому всегда актуален и не требует
+    # триггеров; при добавлении столбца PostgreSQL заполняет его для всех
+    # существующих строк.
+    search_vector = models.GeneratedField(
+        expression=SearchVector('document_title', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True)
+
+    # Год издания для естественного ключа (вид, номер, год): номера приказов
+    # начинаются заново каждый год. Без даты — 0, чтобы NULL не обходил
+    # уникальность и мог служить целью ON CONFLICT при импорте.
+    issue_year = models.GeneratedField(
+        expression=Coalesce(ExtractYear('issue_date'), 0),
+        output_field=models.PositiveSmallIntegerField(),
+        db_persist=True,
+        verbose_name='Год издания')
+
+    # Поля естественного ключа приказа (см. UniqueConstraint ниже)
+    NATURAL_KEY_FIELDS = ['doc_type', 'document_number', 'issue_year']
+
     class Meta:
         verbose_name = 'Приказ'
         verbose_name_plural = 'Приказы'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['doc_type', 'document_number', 'issue_year'],
+                name='order_unique_natural_key',
+                violation_error_message='Документ этого вида с таким номером в этом году уже существует.'),
+        ]
+        indexes = [
+            GinIndex(fields=['search_vector'], name='order_search_vector_gin'),
+            # Триграммный индекс для поиска подстроки в номере: icontains
+            # превращается в UPPER("document_number"::text) LIKE UPPER('%...%'),
+            # поэтому индексируется именно выражение UPPER(document_number).
+            GinIndex(
+                OpClass(Upper('document_number'), name='gin_trgm_ops'),
+                name='order_doc_number_trgm'),
+            # Точное совпадение полного номера без учета регистра (orders.filters)
+            models.Index(Upper('document_number'), name='order_doc_number_upper'),
+        ]
 
     def __str__(self):
         return f'{self.document_number}'
+
+    def save(self, *args, **kwargs):
+        # Сигналы счетчиков реестра (orders.signals) блокируют строку приказа
+        # при чтении прежних значений: блокировка держится до конца транзакции
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    @property
+    def scan_version(self):
+        """Версия скана для адреса превью (orders.scan_previews)."""
+        return scan_version(self.scan.name) if self.scan else ''
+
+    @property
+    def scan_display_name(self):
+        """Имя файла скана для интерфейса (у файлов хранилища сканов имя — хеш содержимого)."""
+        if is_blob_name(self.scan.name):
+            return os.path.basename(order_scan_upload_to(self, self.scan.name))
+        return self.scan.name.replace('orders_scan/', '')
+
+
+class ScanText(models.Model):
+    """
+    Текст скана приказа для полнотекстового поиска по содержимому.
+
+    Заполняется командой manage.py extract_scan_text (orders.scan_text):
+    текстовый слой PDF, для сканов без него — распознавание (OCR), если
+    оно настроено. При сохранении приказа с новым сканом строка
+    возвращается в очередь (status=pending), текст старого скана стирается.
+    Свой хранимый tsvector с GIN-индексом: поиск по тексту не замедляет
+    поиск по названию (orders.filters.filter_orders).
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_DONE, 'Извлечен'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+
+    METHOD_TEXT_LAYER = 'text'
+    METHOD_OCR = 'ocr'
+
+    METHOD_CHOICES = [
+        (METHOD_TEXT_LAYER, 'Текстовый слой PDF'),
+        (METHOD_OCR, 'Распознавание (OCR)'),
+    ]
+
+    order = models.OneToOneField(
+        Order,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='scan_text',
+        verbose_name='Приказ')
+    # Скан, для которого извлекается текст (значение Order.scan)
+    scan = models.CharField(
+        max_length=255,
+        verbose_name='Скан')
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Статус',
+        db_index=True)
+    method = models.CharField(
+        max_length=10,
+        choices=METHOD_CHOICES,
+        verbose_name='Способ извлечения',
+        blank=True)
+    text = models.TextField(
+        verbose_name='Текст',
+        blank=True)
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True)
+    extracted_at = models.DateTimeField(
+        verbose_name='Извлечен',
+        null=True,
+        blank=True)
+
+    search_vector = models.GeneratedField(
+        expression=SearchVector('text', config=SEARCH_CONFIG),
+        output_field=SearchVectorField(),
+        db_persist=True)
+
+    class Meta:
+        verbose_name = 'Текст скана'
+        verbose_name_plural = 'Тексты сканов'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='scan_text_search_vector_gin'),
+        ]
+
+    def __str__(self):
+        return f'{self.order_id}: {self.get_status_display()}'
+
+
+EXPORT_FORMAT_CHOICES = [
+    ('xlsx', 'Excel (XLSX)'),
+    ('csv', 'CSV'),
+    ('parquet', 'Parquet'),
+]
+
+
+class ExportJob(models.Model):
+    """
+    Фоновая задача экспорта реестра.
+
+    Хранит параметры фильтра и выбранные поля; файл формирует отдельный
+    процесс (manage.py run_export_worker) в MEDIA_ROOT/exports/.
+    """
+    STATUS_PENDING = 'pending'
+    STATUS_RUNNING = 'running'
+    STATUS_DONE = 'done'
+    STATUS_FAILED = 'failed'
+
+    STATUS_CHOICES = [
+        (STATUS_PENDING, 'В очереди'),
+        (STATUS_RUNNING, 'Выполняется'),
+        (STATUS_DONE, 'Готово'),
+        (STATUS_FAILED, 'Ошибка'),
+    ]
+    # Задачи, которые еще не завершены: одинаковые среди них не дублируются
+    IN_FLIGHT_STATUSES = [STATUS_PENDING, STATUS_RUNNING]
+
+    params = models.JSONField(
+        default=dict,
+        verbose_name='Параметры фильтра')
+    fields = models.JSONField(
+        default=list,
+        verbose_name='Поля экспорта')
+    export_format = models.CharField(
+        max_length=10,
+        choices=EXPORT_FORMAT_CHOICES,
+        default='xlsx',
+        verbose_name='Формат')
+    fingerprint = models.CharField(
+        max_length=64,
+        verbose_name='Отпечаток параметров',
+        db_index=True)
+    status = models.CharField(
+        max_length=10,
+        choices=STATUS_CHOICES,
+        default=STATUS_PENDING,
+        verbose_name='Статус',
+        db_index=True)
+    file = models.FileField(
+        upload_to='exports/',
+        verbose_name='Файл экспорта',
+        blank=True,
+        null=True)
+    row_count = models.PositiveIntegerField(
+        verbose_name='Выгружено строк',
+        null=True,
+        blank=True)
+    error = models.TextField(
+        verbose_name='Ошибка',
+        blank=True)
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        verbose_name='Пользователь',
+        null=True,
+        blank=True)
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Создана')
+    started_at = models.DateTimeField(
+        verbose_name='Начата',
+        null=True,
+        blank=True)
+    finished_at = models.DateTimeField(
+        verbose_name='Завершена',
+        null=True,
+        blank=True)
+
+    class Meta:
+        verbose_name = 'Задача экспорта'
+        verbose_name_plural = 'Задачи экспорта'
+        constraints = [
+            # Не больше одной незавершенной задачи с одинаковыми параметрами у
+            # пользователя (NULL в created_by тоже считаются равными)
+            models.UniqueConstraint(
+                fields=['fingerprint', 'created_by'],
+                condition=models.Q(status__in=['pending', 'running']),
+                nulls_distinct=False,
+                name='export_job_unique_in_flight'),
+        ]
+
+    def __str__(self):
+        return f'Экспорт #{self.pk} ({self.get_status_display()})'
+
+
+class ImportCheckpoint(models.Model):
+    """
+    Контрольная точка прерванного импорта из Excel (manage.py load_orders).
+
+    Файл определяется по SHA-256 содержимого; last_row — номер последней
+    строки данных, пакет которой уже зафиксирован в БД. Запись обновляется в
+    той же транзакции, что и пакет, и удаляется после успешного завершения.
+    """
+    file_hash = models.CharField(
+        max_length=64,
+        unique=True,
+        verbose_name='SHA-256 файла')
+    file_name = models.CharField(
+        max_length=255,
+        verbose_name='Имя файла')
+    last_row = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Последняя загруженная строка')
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Обновлена')
+
+    class Meta:
+        verbose_name = 'Контрольная точка импорта'
+        verbose_name_plural = 'Контрольные точки импорта'
+
+    def __str__(self):
+        return f'{self.file_name}: строка {self.last_row}'
+
+
+class OrderFacet(models.Model):
+    """
+    Предрасчитанное число приказов по году издания и виду документа.
+
+    Таблица крошечная (годы × виды), поэтому счетчики фильтров берутся из нее
+    без агрегации по реестру. Поддерживается инкрементально: сигналы Order
+    и пакетный импорт вызывают orders.facets.adjust_facets.
+    """
+    issue_year = models.PositiveSmallIntegerField(
+        verbose_name='Год издания')  # 0 — приказы без даты, как в Order.issue_year
+    doc_type = models.CharField(
+        max_length=10,
+        choices=Order.DOC_TYPE_CHOICES,
+        verbose_name='Вид документа')
+    count = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Количество приказов')
+
+    class Meta:
+        verbose_name = 'Счетчик реестра'
+        verbose_name_plural = 'Счетчики реестра'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['issue_year', 'doc_type'],
+                name='order_facet_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.issue_year or "без даты"} / {self.get_doc_type_display()}: {self.count}'
+
+
+class AuditEvent(models.Model):
+    """
+    Событие журнала действий пользователей (только добавление).
+
+    Пишется пачками из потока журнала (orders.audit.audit_event), без
+    внешних ключей: событие остается и после удаления приказа или
+    пользователя. Запросы по пользователю и по приказу за период
+    обслуживают составные индексы, запросы только по периоду — BRIN-индекс
+    по времени (строки добавляются в порядке времени).
+    """
+    ACTION_VIEW_REGISTRY = 'view_registry'
+    ACTION_VIEW_ORDER = 'view_order'
+    ACTION_CREATE = 'create'
+    ACTION_UPDATE = 'update'
+    ACTION_DELETE = 'delete'
+    ACTION_EXPORT = 'export'
+    ACTION_EXPORT_JOB = 'export_job'
+    ACTION_EXPORT_DOWNLOAD = 'export_download'
+    ACTION_CANCEL = 'cancel'
+    ACTION_UI = 'ui'
+    ACTION_VIEW_SCAN = 'view_scan'
+
+    ACTION_CHOICES = [
+        (ACTION_VIEW_REGISTRY, 'Просмотр реестра'),
+        (ACTION_VIEW_ORDER, 'Просмотр приказа'),
+        (ACTION_CREATE, 'Создание приказа'),
+        (ACTION_UPDATE, 'Изменение приказа'),
+        (ACTION_DELETE, 'Удаление приказа'),
+        (ACTION_EXPORT, 'Экспорт'),
+        (ACTION_EXPORT_JOB, 'Фоновый экспорт'),
+        (ACTION_EXPORT_DOWNLOAD, 'Скачивание фонового экспорта'),
+        (ACTION_CANCEL, 'Отмена в форме'),
+        (ACTION_UI, 'Действие в интерфейсе'),
+        (ACTION_VIEW_SCAN, 'Просмотр скана'),
+    ]
+
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Время')
+    username = models.CharField(
+        max_length=150,
+        blank=True,
+        verbose_name='Пользователь')
+    action = models.CharField(
+        max_length=32,
+        choices=ACTION_CHOICES,
+        verbose_name='Действие')
+    order_id = models.BigIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='ID приказа')
+    params = models.JSONField(
+        default=dict,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name='Параметры')
+
+    class Meta:
+        verbose_name = 'Событие журнала'
+        verbose_name_plural = 'События журнала'
+        indexes = [
+            models.Index(fields=['username', 'created_at'], name='audit_user_time_idx'),
+            models.Index(fields=['order_id', 'created_at'], name='audit_order_time_idx'),
+            BrinIndex(fields=['created_at'], name='audit_time_brin'),
+        ]
+
+    def __str__(self):
+        return f'{self.created_at:%d.%m.%Y %H:%M:%S} {self.username or "Anonymous"}: {self.get_action_display()}'
+
+
+class RequestStat(models.Model):
+    """
+    Накопленные показатели запросов по представлению и HTTP-методу
+    (orders.instrumentation): время ответа с разбивкой на БД, шаблоны и
+    Python, число запросов к БД и повторяющихся запросов.
+
+    Процессы копят показатели в памяти и добавляют их к строке таблицы
+    раз в INSTRUMENTATION_FLUSH_INTERVAL секунд одним INSERT ... ON CONFLICT.
+    Время — суммы в миллисекундах; среднее считается при выводе.
+    """
+    view = models.CharField(
+        max_length=200,
+        verbose_name='Представление')
+    method = models.CharField(
+        max_length=10,
+        verbose_name='HTTP-метод')
+    requests = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Запросов')
+    errors = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Ответов 5xx')
+    slow = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Медленных запросов')
+    total_time = models.FloatField(
+        default=0,
+        verbose_name='Время ответа, мс')
+    db_time = models.FloatField(
+        default=0,
+        verbose_name='Время БД, мс')
+    template_time = models.FloatField(
+        default=0,
+        verbose_name='Время шаблонов, мс')
+    python_time = models.FloatField(
+        default=0,
+        verbose_name='Время Python, мс')
+    max_time = models.FloatField(
+        default=0,
+        verbose_name='Максимальное время ответа, мс')
+    queries = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Запросов к БД')
+    duplicate_queries = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Повторных запросов к БД')
+    requests_with_duplicates = models.PositiveBigIntegerField(
+        default=0,
+        verbose_name='Запросов с повторами')
+    duplicate_sql = models.TextField(
+        blank=True,
+        verbose_name='Пример повторного запроса')
+    updated_at = models.DateTimeField(
+        default=timezone.now,
+        verbose_name='Обновлено')
+
+    class Meta:
+        verbose_name = 'Показатели представления'
+        verbose_name_plural = 'Показатели представлений'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['view', 'method'],
+                name='request_stat_unique'),
+        ]
+
+    def __str__(self):
+        return f'{self.method} {self.view}: {self.requests}'
+
+
+class RequestProfile(models.Model):
+    """Профиль cProfile одного запроса (доля запросов задается INSTRUMENTATION_PROFILE_RATE)."""
+    created_at = models.DateTimeField(
+        default=timezone.now,
+        db_index=True,
+        verbose_name='Время')
+    view = models.CharField(
+        max_length=200,
+        verbose_name='Представление')
+    method = models.CharField(
+        max_length=10,
+        verbose_name='HTTP-метод')
+    path = models.CharField(
+        max_length=2000,
+        verbose_name='Адрес')
+    status_code = models.PositiveSmallIntegerField(
+        verbose_name='Код ответа')
+    total_time = models.FloatField(
+        verbose_name='Время ответа, мс')
+    queries = models.PositiveIntegerField(
+        verbose_name='Запросов к БД')
+    stats = models.TextField(
+        verbose_name='Статистика pstats')
+
+    class Meta:
+        verbose_name = 'Профиль запроса'
+        verbose_name_plural = 'Профили запросов'
+
+    def __str__(self):
+        return f'{self.created_at:%d.%m.%Y %H:%M:%S} {self.method} {self.path}'
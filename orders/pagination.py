@@ -0,0 +1,232 @@
+from datetime import date, datetime
+
+from django.core import signing
+from django.db.models import F, Q
+from django.db.models.expressions import OrderBy, RawSQL
+
+
+class KeysetPage:
+    """
+    Страница keyset-пагинации.
+
+    Повторяет ту часть интерфейса django.core.paginator.Page, которой
+    пользуется шаблон (has_next, has_previous, start_index), но не знает
+    общего числа записей: COUNT(*) по реестру не выполняется.
+    """
+
+    def __init__(self, object_list, paginator, position, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.position = position
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def start_index(self):
+        # Порядковый номер первой записи страницы (нумерация с 1)
+        return self.position + 1
+
+    def end_index(self):
+        return self.position + len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Keyset (cursor) пагинация по уже отсортированному queryset'у.
+
+    Ключи сортировки берутся из queryset.query.order_by и дополняются
+    первичным ключом, чтобы порядок был строгим. Следующая страница
+    выбирается условием "строго после последней строки" (WHERE по ключам),
+    поэтому стоимость запроса не зависит от номера страницы.
+
+    Курсор — подписанный токен (django.core.signing) со значениями ключей
+    граничной строки. Подделанный или устаревший курсор молча сбрасывает
+    пагинацию на первую страницу.
+    """
+
+    SIGNING_SALT = 'orders.pagination.cursor'
+
+    def __init__(self, queryset, per_page, key_casts=None):
+        self.per_page = per_page
+        # key_casts: {'поле': 'тип'} — приведение значения курсора к типу
+        # выражения в БД. Нужно для real-аннотаций вроде ts_rank: сравнение
+        # float4 с float8-параметром на равенство никогда не выполняется.
+        self.key_casts = key_casts or {}
+        self.keys = self._get_keys(queryset)
+        self.queryset = queryset.order_by(*self._ordering(reverse=False))
+
+    @staticmethod
+    def _get_keys(queryset):
+        """Возвращает список (имя, по_убыванию, допускает_null)."""
+        opts = queryset.model._meta
+        keys = []
+        for item in queryset.query.order_by:
+            name = item.lstrip('-')
+            if name == 'pk':
+                name = opts.pk.name
+            nullable = False
+            if name not in queryset.query.annotations:
+                nullable = opts.get_field(name).null
+            keys.append((name, item.startswith('-'), nullable))
+
+        if opts.pk.name not in [name for name, _, _ in keys]:
+            keys.append((opts.pk.name, True, False))
+        return keys
+
+    def _ordering(self, reverse):
+        # В прямом порядке NULL всегда стоят в конце, в обратном — в начале
+        nulls = {'nulls_first': True} if reverse else {'nulls_last': True}
+        return [
+            OrderBy(F(name), descending=descending != reverse, **nulls)
+            for name, descending, _ in self.keys
+        ]
+
+    def _value(self, name, value):
+        cast = self.key_casts.get(name)
+        if cast:
+            return RawSQL(f'%s::{cast}', (value,))
+        return value
+
+    def _after(self, values):
+        """Условие "строго после строки с ключами values" в прямом порядке."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(self.keys, values):
+            if value is None:
+                # NULL стоят в конце, после них есть только равные по этому ключу
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            lookup = 'lt' if descending else 'gt'
+            step = Q(**{f'{name}__{lookup}': self._value(name, value)})
+            if nullable:
+                step |= Q(**{f'{name}__isnull': True})
+            condition |= equal & step
+            equal &= Q(**{name: self._value(name, value)})
+        return condition
+
+    def _before(self, values):
+        """Условие "строго до строки с ключами values" в прямом порядке."""
+        condition = Q(pk__in=[])
+        equal = Q()
+        for (name, descending, nullable), value in zip(self.keys, values):
+            if value is None:
+                condition |= equal & Q(**{f'{name}__isnull': False})
+                equal &= Q(**{f'{name}__isnull': True})
+                continue
+            lookup = 'gt' if descending else 'lt'
+            condition |= equal & Q(**{f'{name}__{lookup}': self._value(name, value)})
+            equal &= Q(**{name: self._value(name, value)})
+        return condition
+
+    def _row_values(self, obj):
+        return [getattr(obj, name) for name, _, _ in self.keys]
+
+    def _signature(self):
+        return [f"{'-' if descending else ''}{name}" for name, descending, _ in self.keys]
+
+    def encode_cursor(self, direction, values, position):
+        payload = {
+            'o': self._signature(),
+            'd': direction,
+            'v': [_encode_value(value) for value in values],
+            'p': position,
+        }
+        return signing.dumps(payload, salt=self.SIGNING_SALT, compress=True)
+
+    def decode_cursor(self, token):
+        """Возвращает (направление, значения, позиция) или None."""
+        if not token:
+            return None
+        try:
+            payload = signing.loads(token, salt=self.SIGNING_SALT)
+        except signing.BadSignature:
+            return None
+        if payload.get('o') != self._signature() or payload.get('d') not in ('next', 'prev'):
+            return None
+        try:
+            values = [_decode_value(value) for value in payload['v']]
+            position = max(int(payload['p']), 0)
+        except (KeyError, TypeError, ValueError):
+            return None
+        if len(values) != len(self.keys):
+            return None
+        return payload['d'], values, position
+
+    def _page_queryset(self, cursor):
+        """Запрос строк страницы (на одну больше, чтобы узнать, есть ли продолжение)."""
+        if cursor is None:
+            return self.queryset[:self.per_page + 1]
+        direction, values, _ = cursor
+        if direction == 'next':
+            return self.queryset.filter(self._after(values))[:self.per_page + 1]
+        backwards = self.queryset.filter(self._before(values)).order_by(
+            *self._ordering(reverse=True))
+        return backwards[:self.per_page + 1]
+
+    def _make_page(self, cursor, rows):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if cursor is None:
+            position = 0
+            has_next, has_previous = has_more, False
+
+        elif cursor[0] == 'next':
+            position = cursor[2]
+            has_next, has_previous = has_more, True
+
+        else:
+            rows = rows[::-1]
+            position = max(cursor[2] - len(rows), 0) if has_more else 0
+            has_next, has_previous = True, has_more
+
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode_cursor(
+                'next', self._row_values(rows[-1]), position + len(rows))
+        if rows and has_previous:
+            previous_cursor = self.encode_cursor(
+                'prev', self._row_values(rows[0]), position)
+
+        return KeysetPage(rows, self, position, next_cursor, previous_cursor)
+
+    def page(self, token=None):
+        cursor = self.decode_cursor(token)
+        return self._make_page(cursor, list(self._page_queryset(cursor)))
+
+    async def apage(self, token=None):
+        """Асинхронный вариант page(): строки страницы читаются одним обращением к БД."""
+        cursor = self.decode_cursor(token)
+        return self._make_page(cursor, [row async for row in self._page_queryset(cursor)])
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return datetime.fromisoformat(value['dt'])
+        if 'd' in value:
+            return date.fromisoformat(value['d'])
+        raise ValueError('Неизвестный формат значения курсора')
+    return value
@@ -0,0 +1,114 @@
+"""
+Кеш результатов фильтра реестра.
+
+Для страницы реестра кешируется не HTML, а список id приказов страницы и
+курсоры соседних страниц. Ключ — нормализованные параметры фильтра, курсор
+и размер страницы. На попадании выполняется только выборка этих строк по
+первичному ключу вместо поиска/фильтрации по всему реестру.
+
+Записи хранятся в отдельном кеше REGISTRY_CACHE_ALIAS (по умолчанию
+LocMemCache процесса с ограничением числа записей и LRU-вытеснением).
+Все записи инвалидирует версия реестра: она хранится в общем кеше и
+увеличивается после фиксации каждой транзакции, изменившей приказы
+(сигналы Order и пакетный импорт load_orders).
+"""
+import hashlib
+import json
+
+from django.core.cache import caches
+from django.db import transaction
+
+from orders.cache import anamespace_version, bump_namespace, namespace_version
+from orders.pagination import KeysetPage
+
+REGISTRY_CACHE_ALIAS = 'registry'
+REGISTRY_NAMESPACE = 'registry'
+
+
+def normalize_filter_params(params):
+    """
+    Приводит параметры фильтра к виду, в котором одинаковые по смыслу
+    запросы совпадают: синонимы параметров, пробелы, неверный год.
+    """
+    year = params.get('filter_year') or params.get('year')
+    try:
+        year = int(year) if year else None
+    except (TypeError, ValueError):
+        # filter_orders игнорирует нечисловой год
+        year = None
+    return {
+        'year': year,
+        'doc_type': params.get('filter_doc_type') or params.get('doc_type') or '',
+        'doc_num': (params.get('filter_doc_num') or '').strip(),
+        'search': ' '.join((params.get('search') or '').split()),
+    }
+
+
+def page_cache_key(params, cursor, per_page):
+    payload = json.dumps(
+        [normalize_filter_params(params), cursor or '', per_page],
+        sort_keys=True, ensure_ascii=False)
+    return f"registry-page:{hashlib.sha256(payload.encode()).hexdigest()}"
+
+
+def registry_version():
+    return namespace_version(REGISTRY_NAMESPACE)
+
+
+async def aregistry_version():
+    return await anamespace_version(REGISTRY_NAMESPACE)
+
+
+def invalidate_registry():
+    """Сбрасывает кеш результатов после фиксации текущей транзакции."""
+    transaction.on_commit(lambda: bump_namespace(REGISTRY_NAMESPACE))
+
+
+def get_page(paginator, params, cursor):
+    """
+    Страница keyset-пагинации из кеша или из БД (с сохранением в кеш).
+
+    Версия читается до выполнения запроса: если приказы изменятся во время
+    запроса, результат сохранится под старой версией и больше не найдется.
+    """
+    cache = caches[REGISTRY_CACHE_ALIAS]
+    version = registry_version()
+    key = page_cache_key(params, cursor, paginator.per_page)
+
+    entry = cache.get(key, version=version)
+    if entry is not None:
+        ids = entry[0]
+        return _cached_page(paginator, entry, paginator.queryset.filter(pk__in=ids))
+
+    page = paginator.page(cursor)
+    cache.set(key, _cache_entry(page), version=version)
+    return page
+
+
+async def aget_page(paginator, params, cursor):
+    """Асинхронный вариант get_page для асинхронного представления реестра."""
+    cache = caches[REGISTRY_CACHE_ALIAS]
+    version = await aregistry_version()
+    key = page_cache_key(params, cursor, paginator.per_page)
+
+    entry = await cache.aget(key, version=version)
+    if entry is not None:
+        ids = entry[0]
+        rows = [order async for order in paginator.queryset.filter(pk__in=ids)]
+        return _cached_page(paginator, entry, rows)
+
+    page = await paginator.apage(cursor)
+    await cache.aset(key, _cache_entry(page), version=version)
+    return page
+
+
+def _cache_entry(page):
+    return ([order.pk for order in page.object_list], page.position,
+            page.next_cursor, page.previous_cursor)
+
+
+def _cached_page(paginator, entry, orders):
+    ids, position, next_cursor, previous_cursor = entry
+    orders = {order.pk: order for order in orders}
+    rows = [orders[pk] for pk in ids if pk in orders]
+    return KeysetPage(rows, paginator, position, next_cursor, previous_cursor)
@@ -0,0 +1,133 @@
+"""
+Превью сканов: первая страница PDF в низком разрешении (JPEG).
+
+Превью лежит рядом с файлом скана: для blob-а хранилища
+scan_blobs/ab/<sha256>.pdf — scan_blobs/ab/<sha256>.preview.jpg. Имя
+blob-а — хеш содержимого, поэтому при замене скана у приказа меняется и
+превью, а ссылка на него (с версией скана в адресе) — тоже, и браузер не
+покажет старую картинку. Превью удаляется вместе с blob-ом (gc_scan_blobs).
+
+Превью создается при первом просмотре карточки приказа или заранее
+командой manage.py make_scan_previews. Для отрисовки нужен PyMuPDF
+(необязательная зависимость) или утилита pdftoppm из poppler-utils; без
+них карточка показывает только ссылку на PDF.
+"""
+import os
+import shutil
+import subprocess
+import uuid
+
+from django.conf import settings
+
+from orders.scan_store import is_blob_name
+
+PREVIEW_SUFFIX = '.preview.jpg'
+# Ширина превью в пикселях и качество JPEG
+PREVIEW_WIDTH = 600
+PREVIEW_QUALITY = 70
+# Сколько ждать pdftoppm, сек.
+RENDER_TIMEOUT = 30
+
+
+class PreviewError(Exception):
+    """Превью не удалось создать (нет средства отрисовки или PDF поврежден)."""
+
+
+def preview_name(scan_name):
+    """Путь превью относительно MEDIA_ROOT для значения Order.scan."""
+    return os.path.splitext(scan_name)[0] + PREVIEW_SUFFIX
+
+
+def scan_version(scan_name):
+    """Версия скана для адреса превью: меняется при замене файла."""
+    if is_blob_name(scan_name):
+        return os.path.basename(scan_name)[:12]
+    try:
+        return f'{os.stat(os.path.join(settings.MEDIA_ROOT, scan_name)).st_mtime_ns:x}'
+    except OSError:
+        return ''
+
+
+def _render_pymupdf(pdf_path, target_path):
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as document:
+        if not document.page_count:
+            raise PreviewError('В PDF нет страниц')
+        page = document[0]
+        zoom = PREVIEW_WIDTH / page.rect.width
+        pixmap = page.get_pixmap(matrix=pymupdf.Matrix(zoom, zoom), alpha=False)
+        pixmap.save(target_path, output='jpeg', jpg_quality=PREVIEW_QUALITY)
+
+
+def _render_pdftoppm(pdf_path, target_path):
+    # pdftoppm сам добавляет расширение к имени файла
+    output_base = os.path.splitext(target_path)[0]
+    subprocess.run(
+        ['pdftoppm', '-f', '1', '-l', '1', '-singlefile', '-jpeg',
+         '-jpegopt', f'quality={PREVIEW_QUALITY}', '-scale-to-x', str(PREVIEW_WIDTH),
+         '-scale-to-y', '-1', pdf_path, output_base],
+        check=True, capture_output=True, timeout=RENDER_TIMEOUT)
+    os.replace(output_base + '.jpg', target_path)
+
+
+def get_renderer():
+    """Доступное средство отрисовки или None."""
+    try:
+        import pymupdf  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        return _render_pymupdf
+    if shutil.which('pdftoppm'):
+        return _render_pdftoppm
+    return None
+
+
+def is_available():
+    return get_renderer() is not None
+
+
+def _is_fresh(scan_name, pdf_path, target_path):
+    try:
+        preview_mtime = os.stat(target_path).st_mtime
+    except OSError:
+        return False
+    if is_blob_name(scan_name):
+        # Содержимое blob-а не меняется
+        return True
+    # Скан вне хранилища мог быть перезаписан под тем же именем
+    try:
+        return preview_mtime >= os.stat(pdf_path).st_mtime
+    except OSError:
+        return False
+
+
+def ensure_preview(scan_name, force=False):
+    """
+    Создает превью скана, если его еще нет (или force). Возвращает путь превью
+    относительно MEDIA_ROOT. Файл пишется под временным именем и атомарно
+    переименовывается, поэтому одновременные запросы не увидят его недописанным.
+    """
+    name = preview_name(scan_name)
+    target_path = os.path.join(settings.MEDIA_ROOT, name)
+    pdf_path = os.path.join(settings.MEDIA_ROOT, scan_name)
+    if not force and _is_fresh(scan_name, pdf_path, target_path):
+        return name
+
+    renderer = get_renderer()
+    if renderer is None:
+        raise PreviewError('Нет средства отрисовки PDF (PyMuPDF или pdftoppm)')
+    if not os.path.isfile(pdf_path):
+        raise PreviewError(f'Файл скана не найден: {scan_name}')
+
+    temp_path = f'{target_path}.{uuid.uuid4().hex}.tmp.jpg'
+    try:
+        renderer(pdf_path, temp_path)
+        os.replace(temp_path, target_path)
+    except (OSError, RuntimeError, ValueError, subprocess.SubprocessError) as e:
+        raise PreviewError(f'Не удалось отрисовать {scan_name}: {e}') from e
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return name
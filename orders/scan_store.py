@@ -0,0 +1,172 @@
+"""
+Контентно-адресуемое хранилище сканов.
+
+Файл скана хранится один раз под именем из SHA-256 содержимого
+(MEDIA_ROOT/scan_blobs/ab/<sha256>.pdf), а Order.scan ссылается на этот
+blob. Повторный импорт того же PDF не копирует его заново. Если исходная
+папка и MEDIA_ROOT на одной файловой системе с поддержкой reflink
+(Btrfs, XFS), вместо копирования делается copy-on-write клон. Жесткие
+ссылки не используются: правка исходного файла на месте изменила бы blob,
+и он перестал бы совпадать со своим хешем. Blob-ы доступны только для чтения.
+
+Файлы в хранилище никогда не перезаписываются и не удаляются при
+изменении приказа: blob-ы, на которые не ссылается ни один приказ,
+удаляет (вместе с превью) команда manage.py gc_scan_blobs. Повторно
+используемый blob получает свежее время изменения, поэтому сборщик мусора
+не удалит его, пока импорт, сославшийся на него, не зафиксирован.
+"""
+import glob
+import hashlib
+import os
+import shutil
+import stat
+import time
+import uuid
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+SCAN_BLOBS_DIR = 'scan_blobs'
+
+# ioctl FICLONE (Linux): клон файла на Btrfs/XFS без копирования данных
+FICLONE = 0x40049409
+# Права blob-а: содержимое не меняется после сохранения
+BLOB_MODE = 0o444
+
+# Способы размещения файла в хранилище
+STORED_EXISTING = 'existing'
+STORED_REFLINK = 'reflink'
+STORED_COPY = 'copy'
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def blob_name(digest):
+    """Путь blob-а относительно MEDIA_ROOT (значение для Order.scan)."""
+    return f'{SCAN_BLOBS_DIR}/{digest[:2]}/{digest}.pdf'
+
+
+def is_blob_name(name):
+    return bool(name) and name.startswith(f'{SCAN_BLOBS_DIR}/')
+
+
+def remove_file(path):
+    """
+    Удаляет файл хранилища. В Windows файл только для чтения (BLOB_MODE)
+    удалить нельзя: после отказа снимается атрибут и удаление повторяется.
+    """
+    try:
+        os.remove(path)
+    except PermissionError:
+        os.chmod(path, stat.S_IREAD | stat.S_IWRITE)
+        os.remove(path)
+
+
+def _reflink(source_path, target_path):
+    if fcntl is None:
+        return False
+    try:
+        with open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+            fcntl.ioctl(target.fileno(), FICLONE, source.fileno())
+    except OSError:
+        if os.path.exists(target_path):
+            remove_file(target_path)
+        return False
+    return True
+
+
+def locate_scan(source_path):
+    """Имя blob-а для файла и признак, что он уже есть в хранилище (без записи)."""
+    name = blob_name(file_sha256(source_path))
+    return name, os.path.isfile(os.path.join(settings.MEDIA_ROOT, name))
+
+
+def store_scan(source_path):
+    """
+    Помещает файл в хранилище. Возвращает (имя для Order.scan, способ):
+    способ — STORED_EXISTING, если такое содержимое уже было в хранилище.
+    """
+    name = blob_name(file_sha256(source_path))
+    full_path = os.path.join(settings.MEDIA_ROOT, name)
+    try:
+        # Свежее время изменения защищает blob от gc_scan_blobs (см. collect_garbage)
+        os.utime(full_path)
+        return name, STORED_EXISTING
+    except FileNotFoundError:
+        pass
+
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    # Временное имя уникально: один и тот же blob могут сохранять несколько потоков
+    temp_path = f'{full_path}.{uuid.uuid4().hex}.tmp'
+    try:
+        if _reflink(source_path, temp_path):
+            method = STORED_REFLINK
+        else:
+            shutil.copyfile(source_path, temp_path)
+            method = STORED_COPY
+        os.chmod(temp_path, BLOB_MODE)
+        try:
+            os.replace(temp_path, full_path)
+        except PermissionError:
+            # Windows не заменяет файл только для чтения: такой же blob уже
+            # сохранил другой поток, содержимое совпадает по хешу
+            if not os.path.isfile(full_path):
+                raise
+    finally:
+        if os.path.exists(temp_path):
+            remove_file(temp_path)
+    return name, method
+
+
+def iter_blobs():
+    """Отдает (имя относительно MEDIA_ROOT, os.stat_result) всех blob-ов хранилища."""
+    root = os.path.join(settings.MEDIA_ROOT, SCAN_BLOBS_DIR)
+    if not os.path.isdir(root):
+        return
+    with os.scandir(root) as buckets:
+        for bucket in buckets:
+            if not bucket.is_dir():
+                continue
+            with os.scandir(bucket.path) as entries:
+                for entry in entries:
+                    if entry.is_file() and entry.name.endswith('.pdf'):
+                        yield f'{SCAN_BLOBS_DIR}/{bucket.name}/{entry.name}', entry.stat()
+
+
+def collect_garbage(referenced, min_age, dry_run=False):
+    """
+    Удаляет blob-ы, которых нет в referenced (множество значений Order.scan)
+    и которые старше min_age секунд: свежие blob-ы может использовать импорт,
+    транзакция которого еще не зафиксирована (store_scan обновляет время
+    изменения и у уже существующего blob-а). Возвращает (число файлов, байт).
+    """
+    threshold = time.time() - min_age
+    removed = freed = 0
+    for name, stat in iter_blobs():
+        if name in referenced or stat.st_mtime > threshold:
+            continue
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        try:
+            # Импорт мог взять blob после обхода каталога
+            if os.stat(path).st_mtime > threshold:
+                continue
+        except FileNotFoundError:
+            continue
+        if not dry_run:
+            remove_file(path)
+            # Производные файлы blob-а (превью, см. orders.scan_previews)
+            for derived in glob.glob(f'{glob.escape(os.path.splitext(path)[0])}.preview.*'):
+                os.remove(derived)
+        removed += 1
+        freed += stat.st_size
+    return removed, freed
@@ -0,0 +1,244 @@
+"""
+Текст сканов для полнотекстового поиска по содержимому приказов.
+
+Из PDF извлекается текстовый слой (PyMuPDF — необязательная зависимость —
+или утилита pdftotext из poppler-utils). Если текста почти нет (скан —
+картинка), вызывается распознавание SCAN_OCR_BACKEND, когда оно настроено:
+любая функция "путь к PDF -> текст", например встроенная tesseract_ocr.
+
+Текст хранится в таблице ScanText. Сохранение приказа с новым сканом
+ставит его в очередь (orders.signals), приказы из пакетного импорта
+ставятся в очередь командой manage.py extract_scan_text, которая и
+извлекает текст в пуле процессов: разбор PDF и OCR нагружают процессор и
+в потоках упирались бы в GIL.
+"""
+import multiprocessing
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from orders.models import Order, ScanText
+
+# Текст длиннее обрезается: tsvector в PostgreSQL ограничен 1 МБ
+MAX_TEXT_LENGTH = 500_000
+# Если в текстовом слое меньше букв, скан считается картинкой и распознается
+MIN_TEXT_LETTERS = 20
+# Сколько ждать pdftotext, pdftoppm и tesseract, сек.
+EXTRACT_TIMEOUT = 120
+# Разрешение страниц для распознавания
+OCR_DPI = 300
+
+SPACES_RE = re.compile(r'[^\S\n]+')
+
+
+class ScanTextError(Exception):
+    """Текст скана не удалось извлечь (нет средства извлечения или PDF поврежден)."""
+
+
+# --- Извлечение ---
+
+def _text_pymupdf(pdf_path):
+    import pymupdf
+
+    with pymupdf.open(pdf_path) as document:
+        return '\n'.join(page.get_text() for page in document)
+
+
+def _text_pdftotext(pdf_path):
+    result = subprocess.run(
+        ['pdftotext', '-enc', 'UTF-8', pdf_path, '-'],
+        check=True, capture_output=True, timeout=EXTRACT_TIMEOUT)
+    return result.stdout.decode('utf-8', errors='replace')
+
+
+def get_extractor():
+    """Доступное средство извлечения текстового слоя или None."""
+    try:
+        import pymupdf  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        return _text_pymupdf
+    if shutil.which('pdftotext'):
+        return _text_pdftotext
+    return None
+
+
+def is_available():
+    return get_extractor() is not None
+
+
+def _render_pages(pdf_path, work_dir):
+    """Страницы PDF в PNG для распознавания; возвращает пути файлов по порядку."""
+    try:
+        import pymupdf
+    except ImportError:
+        subprocess.run(
+            ['pdftoppm', '-r', str(OCR_DPI), '-gray', '-png', pdf_path,
+             os.path.join(work_dir, 'page')],
+            check=True, capture_output=True, timeout=EXTRACT_TIMEOUT)
+        return sorted(os.path.join(work_dir, name) for name in os.listdir(work_dir))
+
+    paths = []
+    with pymupdf.open(pdf_path) as document:
+        for number, page in enumerate(document):
+            path = os.path.join(work_dir, f'page-{number:05}.png')
+            page.get_pixmap(dpi=OCR_DPI, colorspace=pymupdf.csGRAY).save(path)
+            paths.append(path)
+    return paths
+
+
+def tesseract_ocr(pdf_path):
+    """
+    Распознавание через tesseract (пакеты tesseract-ocr и tesseract-ocr-rus)
+    с языками SCAN_OCR_LANGUAGES. Подключается настройкой
+    SCAN_OCR_BACKEND=orders.scan_text.tesseract_ocr.
+    """
+    if shutil.which('tesseract') is None:
+        raise ScanTextError('tesseract не установлен')
+    with tempfile.TemporaryDirectory() as work_dir:
+        pages = []
+        for image_path in _render_pages(pdf_path, work_dir):
+            result = subprocess.run(
+                ['tesseract', image_path, 'stdout', '-l', settings.SCAN_OCR_LANGUAGES],
+                check=True, capture_output=True, timeout=EXTRACT_TIMEOUT)
+            pages.append(result.stdout.decode('utf-8', errors='replace'))
+    return '\n'.join(pages)
+
+
+def get_ocr_backend():
+    """Функция распознавания из SCAN_OCR_BACKEND или None."""
+    if not settings.SCAN_OCR_BACKEND:
+        return None
+    return import_string(settings.SCAN_OCR_BACKEND)
+
+
+def clean_text(text):
+    # Пробелы схлопываются, пустые строки убираются; NUL недопустим в тексте PostgreSQL
+    lines = (SPACES_RE.sub(' ', line).strip() for line in text.replace('\x00', '').splitlines())
+    return '\n'.join(line for line in lines if line)[:MAX_TEXT_LENGTH]
+
+
+def extract_text(scan_name):
+    """
+    Текст скана (значение Order.scan): (текст, способ ScanText.METHOD_*).
+    Выполняется в процессах пула, поэтому не обращается к БД.
+    """
+    pdf_path = os.path.join(settings.MEDIA_ROOT, scan_name)
+    extractor = get_extractor()
+    if extractor is None:
+        raise ScanTextError('Нет средства извлечения текста PDF (PyMuPDF или pdftotext)')
+    if not os.path.isfile(pdf_path):
+        raise ScanTextError(f'Файл скана не найден: {scan_name}')
+
+    try:
+        text = clean_text(extractor(pdf_path))
+        method = ScanText.METHOD_TEXT_LAYER
+        if sum(char.isalpha() for char in text) < MIN_TEXT_LETTERS:
+            ocr = get_ocr_backend()
+            if ocr is not None:
+                text = clean_text(ocr(pdf_path))
+                method = ScanText.METHOD_OCR
+    except (OSError, RuntimeError, ValueError, subprocess.SubprocessError) as e:
+        raise ScanTextError(f'Не удалось извлечь текст {scan_name}: {e}') from e
+    return text, method
+
+
+def extraction_pool(workers):
+    """
+    Пул процессов для extract_text. Процессы запускаются заново (spawn), а не
+    копией текущего (fork): унаследованное соединение с БД дочерний процесс
+    закрыл бы при завершении вместе с соединением родителя.
+    """
+    return ProcessPoolExecutor(
+        max_workers=workers,
+        mp_context=multiprocessing.get_context('spawn'),
+        initializer=django.setup)
+
+
+# --- Очередь ---
+
+def queue_order(order):
+    """Ставит текст скана приказа в очередь, если скан изменился (вызывается при сохранении)."""
+    scan_name = order.scan.name if order.scan else ''
+    if not scan_name:
+        ScanText.objects.filter(order_id=order.pk).delete()
+        return
+    if ScanText.objects.filter(order_id=order.pk, scan=scan_name).exists():
+        return
+    ScanText.objects.update_or_create(order_id=order.pk, defaults={
+        'scan': scan_name,
+        'status': ScanText.STATUS_PENDING,
+        'method': '',
+        'text': '',
+        'error': '',
+        'extracted_at': None,
+    })
+
+
+def queue_scan_texts(force=False, retry_failed=False):
+    """
+    Ставит в очередь приказы, для скана которых текст еще не извлекался или
+    скан с тех пор сменился (в том числе загруженные load_orders, который
+    не вызывает сигналы). force — извлечь заново все тексты, retry_failed —
+    повторить неудачные. Старый текст при force остается в поиске до
+    замены. Возвращает число поставленных в очередь.
+    """
+    ScanText.objects.filter(Q(order__scan='') | Q(order__scan__isnull=True)).delete()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {ScanText._meta.db_table} AS t '
+            f'(order_id, scan, status, method, text, error, extracted_at) '
+            f"SELECT id, scan, %s, '', '', '', NULL FROM {Order._meta.db_table} "
+            f"WHERE scan <> '' "
+            f'ON CONFLICT (order_id) DO UPDATE SET '
+            f"scan = EXCLUDED.scan, status = EXCLUDED.status, method = '', text = '', "
+            f"error = '', extracted_at = NULL "
+            f'WHERE t.scan <> EXCLUDED.scan',
+            [ScanText.STATUS_PENDING])
+        queued = cursor.rowcount
+
+    statuses = []
+    if force:
+        statuses.append(ScanText.STATUS_DONE)
+    if force or retry_failed:
+        statuses.append(ScanText.STATUS_FAILED)
+    if statuses:
+        queued += ScanText.objects.filter(status__in=statuses).update(status=ScanText.STATUS_PENDING)
+    return queued
+
+
+def pending_scans(limit):
+    """Следующие сканы из очереди: {имя скана: [id приказов]} (один blob — у нескольких приказов)."""
+    scans = {}
+    rows = (ScanText.objects
+            .filter(status=ScanText.STATUS_PENDING)
+            .order_by('order_id')
+            .values_list('order_id', 'scan')[:limit])
+    for order_id, scan_name in rows:
+        scans.setdefault(scan_name, []).append(order_id)
+    return scans
+
+
+def save_text(scan_name, order_ids, text='', method='', error=''):
+    """
+    Сохраняет результат извлечения. Строки, скан которых сменился, пока
+    текст извлекался, остаются в очереди с новым сканом.
+    """
+    rows = ScanText.objects.filter(
+        order_id__in=order_ids, scan=scan_name, status=ScanText.STATUS_PENDING)
+    if error:
+        return rows.update(status=ScanText.STATUS_FAILED, error=error,
+                           extracted_at=timezone.now())
+    return rows.update(status=ScanText.STATUS_DONE, text=text, method=method, error='',
+                       extracted_at=timezone.now())
@@ -0,0 +1,70 @@
+"""
+Обработчики сигналов Order: счетчики реестра (orders.facets), кеш результатов
+фильтра и очередь извлечения текста сканов (orders.scan_text).
+"""
+from collections import Counter
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from orders.facets import adjust_facets, facet_key
+from orders.models import Order
+from orders.result_cache import invalidate_registry
+from orders.scan_text import queue_order
+
+
+def _locked_facet_key(pk):
+    """
+    Ключ счетчика приказа в БД с блокировкой строки до конца транзакции:
+    параллельное сохранение того же приказа дождется ее и прочитает уже
+    новый ключ, поэтому счетчики не изменятся дважды. None — строки нет.
+    """
+    previous = (Order.objects
+                .select_for_update()
+                .filter(pk=pk)
+                .values_list('issue_date', 'doc_type')
+                .first())
+    return facet_key(*previous) if previous is not None else None
+
+
+@receiver(pre_save, sender=Order)
+def remember_facet_key(sender, instance, raw=False, **kwargs):
+    # Для изменения счетчиков нужно знать, каким приказ был до сохранения
+    # (Order.save выполняется в транзакции, см. модель)
+    instance._facet_key_before = None
+    if instance.pk and not raw:
+        instance._facet_key_before = _locked_facet_key(instance.pk)
+
+
+@receiver(post_save, sender=Order)
+def update_facets_on_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    deltas = Counter()
+    before = getattr(instance, '_facet_key_before', None)
+    if before is not None:
+        deltas[before] -= 1
+    deltas[facet_key(instance.issue_date, instance.doc_type)] += 1
+    adjust_facets(deltas)
+    invalidate_registry()
+
+
+@receiver(post_save, sender=Order)
+def queue_scan_text_on_save(sender, instance, raw=False, **kwargs):
+    # Текст нового скана извлекает manage.py extract_scan_text
+    if not raw:
+        queue_order(instance)
+
+
+@receiver(pre_delete, sender=Order)
+def remember_facet_key_on_delete(sender, instance, **kwargs):
+    # Удаление идет в транзакции; приказ мог изменить или уже удалить другой запрос
+    instance._facet_key_before = _locked_facet_key(instance.pk)
+
+
+@receiver(post_delete, sender=Order)
+def update_facets_on_delete(sender, instance, **kwargs):
+    before = getattr(instance, '_facet_key_before', None)
+    if before is not None:
+        adjust_facets({before: -1})
+    invalidate_registry()
@@ -1,3 +1,1478 @@
-from django.test import TestCase
+import csv
+import json
+import logging
+import os
+import pickle
+import shutil
+import stat
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import openpyxl
+from asgiref.sync import async_to_sync
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.core.signals import request_finished
+from django.db import close_old_connections, connection, connections, transaction
+from django.template.response import TemplateResponse
+from django.test import (
+    AsyncRequestFactory, Client, RequestFactory, TestCase, TransactionTestCase, override_settings,
+)
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from orders import scan_previews, scan_text
+from orders.audit import audit_event
+from orders.audit_logging import AuditEventHandler, AuditQueueHandler
+from orders.benchmarks import percentile, synthetic_pdf
+from orders.cache import TieredCache
+from orders.downloads import STREAM_BLOCK_SIZE, is_range_start, protected_file_response
+from orders.export import ParquetExportWriter, iter_export_rows, stream_xlsx
+from orders.export_jobs import (
+    EXPORT_JOBS_DIR, claim_next_job, delete_expired_jobs, run_export_job, submit_export_job,
+)
+from orders.facets import adjust_facets
+from orders.filters import filter_orders
+from orders.instrumentation import InstrumentationMiddleware, RequestMetrics, StatBuffer
+from orders.management.commands.load_orders import EXCEL_TO_MODEL_MAP, Command as LoadOrdersCommand
+from orders.models import (
+    AuditEvent, ExportJob, ImportCheckpoint, Order, OrderFacet, RequestStat, ScanText,
+)
+from orders.pagination import KeysetPaginator
+from orders.result_cache import (
+    REGISTRY_CACHE_ALIAS, get_page, invalidate_registry, normalize_filter_params, page_cache_key,
+    registry_version,
+)
+from orders.scan_store import STORED_EXISTING, blob_name, collect_garbage, file_sha256, store_scan
+
+
+def close_response(response):
+    """Закрывает ответ, как тестовый клиент: request_finished не закрывает соединение теста."""
+    request_finished.disconnect(close_old_connections)
+    try:
+        response.close()
+    finally:
+        request_finished.connect(close_old_connections)
+
+
+def create_order(number, issue_date=None, **fields):
+    fields.setdefault('document_title', f'Приказ {number}')
+    fields.setdefault('signed_by', 'Иванов И. И.')
+    return Order.objects.create(document_number=number, issue_date=issue_date, **fields)
+
+
+class KeysetPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        # Одинаковые даты и приказы без даты: порядок держится на втором ключе (id)
+        dates = [date(2024, 3, 1), date(2024, 3, 1), None, date(2023, 5, 2),
+                 None, date(2024, 3, 1), date(2022, 1, 9)]
+        for number, issue_date in enumerate(dates, 1):
+            create_order(f'{number:03}-к', issue_date)
+
+    def setUp(self):
+        self.queryset = Order.objects.order_by('-issue_date')
+        self.expected = list(
+            Order.objects.order_by('-issue_date', '-id').values_list('pk', flat=True))
+        # В прямом порядке NULL стоят в конце
+        dated = [pk for pk in self.expected if Order.objects.get(pk=pk).issue_date]
+        self.expected = dated + [pk for pk in self.expected if pk not in dated]
+
+    def walk_forward(self, paginator):
+        page = paginator.page()
+        pages = [page]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            pages.append(page)
+        return pages
+
+    def test_forward_pages_cover_all_rows_including_nulls(self):
+        paginator = KeysetPaginator(self.queryset, 2)
+        pages = self.walk_forward(paginator)
+
+        self.assertEqual([obj.pk for page in pages for obj in page], self.expected)
+        self.assertEqual([page.start_index() for page in pages], [1, 3, 5, 7])
+        self.assertFalse(pages[0].has_previous())
+        self.assertFalse(pages[-1].has_next())
+
+    def test_backward_pages_mirror_forward_pages(self):
+        paginator = KeysetPaginator(self.queryset, 2)
+        forward = self.walk_forward(paginator)
+
+        page = forward[-1]
+        backward = [page]
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            backward.append(page)
+
+        self.assertEqual([[obj.pk for obj in page] for page in reversed(backward)],
+                         [[obj.pk for obj in page] for page in forward])
+        self.assertEqual(backward[-1].start_index(), 1)
+
+    def test_after_and_before_null_key(self):
+        paginator = KeysetPaginator(self.queryset, 2)
+        null_orders = [pk for pk in self.expected
+                       if Order.objects.get(pk=pk).issue_date is None]
+        first_null = null_orders[0]
+
+        after = paginator.queryset.filter(paginator._after([None, first_null]))
+        before = paginator.queryset.filter(paginator._before([None, first_null]))
+
+        self.assertEqual([obj.pk for obj in after], null_orders[1:])
+        self.assertEqual([obj.pk for obj in before],
+                         self.expected[:self.expected.index(first_null)])
+
+    def test_cursor_round_trip(self):
+        paginator = KeysetPaginator(self.queryset, 2)
+        token = paginator.encode_cursor('next', [date(2024, 3, 1), 5], 4)
+
+        self.assertEqual(paginator.decode_cursor(token), ('next', [date(2024, 3, 1), 5], 4))
+
+    def test_tampered_cursor_resets_to_first_page(self):
+        paginator = KeysetPaginator(self.queryset, 2)
+        token = paginator.page().next_cursor
+        tampered = token[:-1] + ('A' if token[-1] != 'A' else 'B')
+
+        self.assertIsNone(paginator.decode_cursor(tampered))
+        self.assertIsNone(paginator.decode_cursor('garbage'))
+        self.assertEqual(paginator.page(tampered).start_index(), 1)
+
+    def test_cursor_of_other_ordering_or_malformed_payload_is_rejected(self):
+        token = KeysetPaginator(Order.objects.order_by('-id'), 2).page().next_cursor
+        paginator = KeysetPaginator(self.queryset, 2)
+        self.assertIsNone(paginator.decode_cursor(token))
+
+        signature = paginator._signature()
+        for payload in (
+            {'o': signature, 'd': 'sideways', 'v': [None, 1], 'p': 0},
+            {'o': signature, 'd': 'next', 'v': [None], 'p': 0},
+            {'o': signature, 'd': 'next', 'v': [{'x': 1}, 1], 'p': 0},
+            {'o': signature, 'd': 'next', 'v': [None, 1], 'p': 'abc'},
+        ):
+            forged = signing.dumps(payload, salt=KeysetPaginator.SIGNING_SALT, compress=True)
+            self.assertIsNone(paginator.decode_cursor(forged), payload)
+
+
+class DocumentNumberFilterTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = create_order('12-Пр', date(2024, 2, 1))
+        create_order('120-к', date(2024, 2, 2))
+
+    def found(self, value):
+        return list(filter_orders({'filter_doc_num': value}).values_list('pk', flat=True))
+
+    def test_full_number_ignores_case(self):
+        for value in ('12-Пр', '12-пр', '12-ПР', ' 12-пР '):
+            self.assertEqual(self.found(value), [self.order.pk], value)
+
+    def test_full_number_is_exact_and_substring_ignores_case(self):
+        self.assertEqual(self.found('2-пр'), [])
+        self.assertEqual(self.found('-пр'), [self.order.pk])
+        self.assertEqual(len(self.found('12')), 2)
+
+
+class ExportTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        create_order('1-к', date(2024, 1, 9), note='первый')
+        create_order('2-р', None, doc_type=Order.DOC_TYPE_DECREE, responsible_executor=None)
+
+    def setUp(self):
+        # Поток журнала пишет AuditEvent в своем соединении, мимо транзакции теста
+        patcher = mock.patch('orders.views.audit_event')
+        self.audit_event = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def export(self, export_format, fields, **params):
+        response = self.client.get(reverse('orders:export_to_excel'),
+                                   {'format': export_format, 'fields': fields, **params})
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_streamed_xlsx_opens_with_openpyxl(self):
+        response, content = self.export(
+            'xlsx', ['document_number', 'issue_date', 'doc_type', 'responsible_executor', 'note'])
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(self.audit_event.call_args.kwargs['row_count'], 2)
+        sheet = openpyxl.load_workbook(BytesIO(content)).active
+        self.assertEqual(list(sheet.iter_rows(values_only=True)), [
+            ('Вид документа', 'Номер документа', 'Дата издания', 'Ответственный исполнитель',
+             'Примечание'),
+            ('Распоряжение', '2-р', None, None, None),
+            ('Приказ', '1-к', '09.01.2024', None, 'первый'),
+        ])
+
+    def test_csv_round_trip(self):
+        response, content = self.export('csv', ['document_number', 'issue_date', 'doc_type', 'note'])
+
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(StringIO(content.decode('utf-8-sig')), delimiter=';'))
+        self.assertEqual(rows, [
+            ['Вид документа', 'Номер документа', 'Дата издания', 'Примечание'],
+            ['Распоряжение', '2-р', '', ''],
+            ['Приказ', '1-к', '09.01.2024', 'первый'],
+        ])
+
+    @skipUnless(ParquetExportWriter.is_available(), 'pyarrow не установлен')
+    def test_parquet_round_trip_keeps_types(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        _, content = self.export('parquet', ['document_number', 'issue_date', 'doc_type'])
+
+        table = pq.read_table(BytesIO(content))
+        self.assertEqual(table.schema.field('issue_date').type, pa.date32())
+        self.assertEqual(table.schema.field('doc_type').type,
+                         pa.dictionary(pa.int8(), pa.string()))
+        self.assertEqual(table.to_pylist(), [
+            {'document_number': '2-р', 'issue_date': None, 'doc_type': 'Распоряжение'},
+            {'document_number': '1-к', 'issue_date': date(2024, 1, 9), 'doc_type': 'Приказ'},
+        ])
+
+    @skipUnless(ParquetExportWriter.is_available(), 'pyarrow не установлен')
+    def test_parquet_splits_rows_into_groups_and_handles_empty_export(self):
+        import pyarrow.parquet as pq
+
+        writer = ParquetExportWriter(Order.objects.order_by('pk'), ['issue_date'], chunk_size=1)
+        metadata = pq.read_metadata(BytesIO(b''.join(writer)))
+        self.assertEqual((metadata.num_rows, metadata.num_row_groups), (2, 2))
+        self.assertEqual(writer.row_count, 2)
+
+        writer = ParquetExportWriter(Order.objects.none(), ['issue_date', 'doc_type'])
+        self.assertEqual(pq.read_table(BytesIO(b''.join(writer))).num_rows, 0)
+
+    def test_rows_are_formatted_by_the_database(self):
+        # Вид документа вне DOC_TYPE_CHOICES выгружается как есть
+        Order.objects.filter(document_number='1-к').update(doc_type='memo')
+        fields = ['doc_type', 'document_number', 'issue_date', 'responsible_executor', 'note']
+
+        rows = list(iter_export_rows(Order.objects.order_by('document_number'), fields, chunk_size=1))
+
+        self.assertEqual(rows, [
+            ('memo', '1-к', '09.01.2024', '', 'первый'),
+            ('Распоряжение', '2-р', '', '', ''),
+        ])
+
+    def test_xlsx_is_yielded_in_parts_and_drops_illegal_characters(self):
+        # Несжимаемые значения: порции архива выходят, не дожидаясь конца листа
+        rows = [(f'{number}-к', os.urandom(32).hex()) for number in range(2000)]
+        rows.append(('2000-к', 'текст\x0b <&>'))
+
+        parts = list(stream_xlsx(['Номер', 'Примечание'], iter(rows), flush_every=100))
+
+        self.assertGreater(len(parts), 5)
+        sheet = openpyxl.load_workbook(BytesIO(b''.join(parts))).active
+        values = list(sheet.iter_rows(values_only=True))
+        self.assertEqual(len(values), 2002)
+        self.assertEqual(values[1], rows[0])
+        self.assertEqual(values[-1], ('2000-к', 'текст <&>'))
+
+
+    async def test_export_is_streamed_asynchronously_under_asgi(self):
+        response = await self.async_client.get(
+            reverse('orders:export_to_excel'), {'format': 'csv', 'fields': ['document_number']})
+
+        self.assertEqual(response.status_code, 200)
+        # Синхронный итератор Django под ASGI собрал бы в память целиком
+        self.assertTrue(response.is_async)
+        content = b''.join([part async for part in response.streaming_content])
+        rows = list(csv.reader(content.decode('utf-8-sig').splitlines(), delimiter=';'))
+        self.assertEqual(sorted(row[0] for row in rows[1:]), ['1-к', '2-р'])
+        self.assertEqual(self.audit_event.call_args.kwargs['row_count'], 2)
+
+
+class AsyncViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.order = create_order('7-к', date(2024, 2, 1), document_title='О графике отпусков')
+        create_order('8-к', date(2024, 2, 2))
+
+    def setUp(self):
+        patcher = mock.patch('orders.views.audit_event')
+        self.audit_event = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_index(self):
+        with self.assertLogs('user_actions_logger', 'INFO'):
+            response = await self.async_client.get(reverse('orders:index'), {'filter_doc_num': '7-к'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([order.pk for order in response.context['orders']], [self.order.pk])
+        self.assertContains(response, 'О графике отпусков')
+
+    async def test_order_detail(self):
+        with self.assertLogs('user_actions_logger', 'INFO'):
+            response = await self.async_client.get(reverse('orders:detail_order', args=[self.order.pk]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['order'], self.order)
+        self.assertEqual(self.audit_event.call_args.args[2], self.order.pk)
+
+    async def test_missing_order_detail(self):
+        with self.assertLogs('user_actions_logger', 'WARNING'), self.assertLogs('django.request', 'WARNING'):
+            response = await self.async_client.get(reverse('orders:detail_order', args=[0]))
+
+        self.assertEqual(response.status_code, 404)
+        self.audit_event.assert_not_called()
+
+
+class ProtectedFileResponseTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, SCAN_SERVE_MODE='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.content = os.urandom(STREAM_BLOCK_SIZE * 2 + 100)
+        with open(os.path.join(self.media_root, 'scan.pdf'), 'wb') as f:
+            f.write(self.content)
+
+    def test_file_is_streamed_in_blocks_under_asgi(self):
+        request = AsyncRequestFactory().get('/', headers={'Range': f'bytes=10-{STREAM_BLOCK_SIZE + 9}'})
+        response = protected_file_response(request, 'scan.pdf', 'scan.pdf')
+
+        self.assertEqual(response.status_code, 206)
+        self.assertTrue(response.is_async)
+
+        async def read():
+            return [part async for part in response.streaming_content]
+        parts = async_to_sync(read)()
+        close_response(response)
+        self.assertEqual(len(parts), 1)
+        self.assertEqual(parts[0], self.content[10:STREAM_BLOCK_SIZE + 10])
+
+        request = AsyncRequestFactory().get('/')
+        response = protected_file_response(request, 'scan.pdf', 'scan.pdf')
+        parts = async_to_sync(read)()
+        close_response(response)
+        self.assertEqual([len(part) for part in parts], [STREAM_BLOCK_SIZE, STREAM_BLOCK_SIZE, 100])
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+
+
+    def get(self, name='scan.pdf', **headers):
+        response = protected_file_response(RequestFactory().get('/', headers=headers), name, 'Приказ 1.pdf')
+        self.addCleanup(close_response, response)
+        return response
+
+    def body(self, response):
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_whole_file(self):
+        response = self.get()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+        self.assertEqual(response['Content-Length'], str(len(self.content)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Disposition'],
+                         "inline; filename*=UTF-8''%D0%9F%D1%80%D0%B8%D0%BA%D0%B0%D0%B7%201.pdf")
+
+    def test_ranges(self):
+        size = len(self.content)
+        for header, start, end in [('bytes=0-99', 0, 99), ('bytes=100-', 100, size - 1),
+                                   ('bytes=-50', size - 50, size - 1), (f'bytes=10-{size * 2}', 10, size - 1)]:
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 206)
+                self.assertEqual(response['Content-Range'], f'bytes {start}-{end}/{size}')
+                self.assertEqual(response['Content-Length'], str(end - start + 1))
+                self.assertEqual(self.body(response), self.content[start:end + 1])
+
+        # Несколько диапазонов и другие единицы не поддерживаются — файл целиком
+        for header in ['bytes=0-1,5-9', 'items=0-1']:
+            with self.subTest(header):
+                self.assertEqual(self.get(Range=header).status_code, 200)
+
+    def test_unsatisfiable_range(self):
+        for header in [f'bytes={len(self.content)}-', 'bytes=-0', 'bytes=9-5']:
+            with self.subTest(header):
+                response = self.get(Range=header)
+                self.assertEqual(response.status_code, 416)
+                self.assertEqual(response['Content-Range'], f'bytes */{len(self.content)}')
+
+    def test_if_range(self):
+        etag = self.get()['ETag']
+
+        response = self.get(Range='bytes=0-9', If_Range=etag)
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.body(response), self.content[:10])
+        # Файл изменился — докачка начинается заново с полного ответа
+        response = self.get(Range='bytes=0-9', If_Range='"old-version"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.body(response), self.content)
+
+    def test_not_modified(self):
+        full = self.get()
+
+        response = self.get(If_None_Match=full['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], full['ETag'])
+        self.assertEqual(response.content, b'')
+        self.assertEqual(self.get(If_Modified_Since=full['Last-Modified']).status_code, 304)
+        self.assertEqual(self.get(If_None_Match='"other"').status_code, 200)
+
+    def test_blob_etag_is_content_hash(self):
+        digest = file_sha256(os.path.join(self.media_root, 'scan.pdf'))
+        name = blob_name(digest)
+        os.makedirs(os.path.dirname(os.path.join(self.media_root, name)))
+        shutil.copy(os.path.join(self.media_root, 'scan.pdf'), os.path.join(self.media_root, name))
+
+        self.assertEqual(self.get(name)['ETag'], f'"{digest}"')
+        self.assertNotEqual(self.get()['ETag'], f'"{digest}"')
+
+    def test_only_reading_from_start_is_logged_as_opening(self):
+        factory = RequestFactory()
+        self.assertTrue(is_range_start(factory.get('/')))
+        self.assertTrue(is_range_start(factory.get('/', headers={'Range': 'bytes=0-65535'})))
+        self.assertFalse(is_range_start(factory.get('/', headers={'Range': 'bytes=65536-131071'})))
+
+    @override_settings(SCAN_SERVE_MODE='nginx', SCAN_ACCEL_PREFIX='/protected/')
+    def test_nginx_mode_does_not_open_file(self):
+        response = self.get('scans/нет такого.pdf')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected/scans/%D0%BD%D0%B5%D1%82%20%D1%82%D0%B0%D0%BA%D0%BE%D0%B3%D0%BE.pdf')
+        self.assertEqual(response.content, b'')
+
+
+class ExportJobTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        User = get_user_model()
+        cls.author = User.objects.create_user('author', password='secret')
+        cls.other = User.objects.create_user('other', password='secret')
+
+    def submit(self, user):
+        return submit_export_job({'filter_year': '2024'}, ['document_number'], 'csv', user)
+
+    def test_same_user_gets_in_flight_job(self):
+        job, created = self.submit(self.author)
+        again, created_again = self.submit(self.author)
+
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, job.pk)
+
+    def test_jobs_of_different_users_are_not_shared(self):
+        job, _ = self.submit(self.author)
+        other_job, created = self.submit(self.other)
+
+        self.assertTrue(created)
+        self.assertNotEqual(other_job.pk, job.pk)
+
+        self.client.force_login(self.other)
+        url = reverse('orders:export_job_status', args=[job.pk])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        own_url = reverse('orders:export_job_status', args=[other_job.pk])
+        self.assertEqual(self.client.get(own_url).status_code, 200)
+
+    def test_ownerless_job_is_hidden_from_users(self):
+        job = ExportJob.objects.create(params={}, fields=['document_number'], fingerprint='x')
+        url = reverse('orders:export_job_status', args=[job.pk])
+
+        self.assertEqual(self.client.get(url).status_code, 403)
+        self.client.force_login(self.author)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+    def test_expired_jobs_are_deleted_with_files(self):
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            os.makedirs(os.path.join(media_root, EXPORT_JOBS_DIR))
+            old, _ = self.submit(self.author)
+            fresh, _ = self.submit(self.other)
+            for job, finished_at in ((old, timezone.now() - timedelta(days=2)),
+                                     (fresh, timezone.now())):
+                job.file.name = f'{EXPORT_JOBS_DIR}/orders_export_{job.pk}.csv'
+                with open(job.file.path, 'w') as output:
+                    output.write('1')
+                job.status = ExportJob.STATUS_DONE
+                job.finished_at = finished_at
+                job.save()
+            old_path = old.file.path
+            orphan_path = os.path.join(media_root, EXPORT_JOBS_DIR, 'orders_export_0.csv.part')
+            with open(orphan_path, 'w'):
+                pass
+            os.utime(orphan_path, (0, 0))
+
+            self.assertEqual(delete_expired_jobs(timedelta(hours=24)), 1)
+
+            self.assertFalse(ExportJob.objects.filter(pk=old.pk).exists())
+            self.assertFalse(os.path.exists(old_path))
+            self.assertFalse(os.path.exists(orphan_path))
+            self.assertTrue(os.path.exists(fresh.file.path))
+
+    def test_claimed_job_is_run_into_a_file(self):
+        create_order('1-к', date(2024, 1, 9))
+        job, _ = self.submit(self.author)
+
+        with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+            claimed = claim_next_job()
+            self.assertEqual((claimed.pk, claimed.status), (job.pk, ExportJob.STATUS_RUNNING))
+            self.assertIsNone(claim_next_job())
+
+            job = run_export_job(claimed)
+
+            self.assertEqual((job.status, job.row_count), (ExportJob.STATUS_DONE, 1))
+            with open(job.file.path, encoding='utf-8-sig') as exported:
+                self.assertEqual(exported.read().split(), ['Номер', 'документа', '1-к'])
+
+
+class ExportJobClaimTests(TransactionTestCase):
+    """Два воркера: задачу, заблокированную одним, другой пропускает (SKIP LOCKED)."""
+
+    def test_locked_job_is_skipped_by_another_worker(self):
+        first = ExportJob.objects.create(params={}, fields=['document_number'], fingerprint='1')
+        second = ExportJob.objects.create(params={}, fields=['document_number'], fingerprint='2')
+        locked = threading.Event()
+        release = threading.Event()
+
+        def other_worker():
+            # Соединение этого потока — отдельная сессия PostgreSQL
+            try:
+                with transaction.atomic():
+                    ExportJob.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(10)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        self.addCleanup(thread.join)
+        self.addCleanup(release.set)
+        self.assertTrue(locked.wait(10))
+
+        self.assertEqual(claim_next_job().pk, second.pk)
+        self.assertIsNone(claim_next_job())
+
+        release.set()
+        thread.join()
+        self.assertEqual(claim_next_job().pk, first.pk)
+        self.assertIsNone(claim_next_job())
+
+
+class AuditQueueHandlerTests(TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.log_path = os.path.join(self.work_dir, 'orders_logs.log')
+
+    def make_handler(self, **options):
+        handler = AuditQueueHandler(filename=self.log_path, console=False, **options)
+        handler.setFormatter(logging.Formatter('%(levelname)s %(message)s'))
+        self.addCleanup(handler.close)
+        return handler
+
+    @staticmethod
+    def record(message, *args, level=logging.INFO):
+        return logging.LogRecord('user_actions_logger', level, __file__, 0, message, args, None)
+
+    def read_log(self):
+        with open(self.log_path, encoding='utf-8') as log:
+            return log.read().splitlines()
+
+    def test_records_are_formatted_and_written_by_listener(self):
+        handler = self.make_handler()
+        records = [self.record("Пользователь '%s' открыл приказ %s", 'author', number)
+                   for number in range(5)]
+
+        with mock.patch.object(handler.targets[0], 'emit_batch',
+                               wraps=handler.targets[0].emit_batch) as emit_batch:
+            for record in records:
+                handler.handle(record)
+            handler.flush()
+
+        # Сообщение собирается в потоке слушателя, а не при постановке в очередь
+        self.assertEqual(records[0].msg, "Пользователь '%s' открыл приказ %s")
+        self.assertEqual(self.read_log(),
+                         [f"INFO Пользователь 'author' открыл приказ {number}" for number in range(5)])
+        self.assertLessEqual(emit_batch.call_count, 5)
+
+    def test_overflow_drops_info_and_reports_the_loss(self):
+        handler = self.make_handler(queue_size=2, block_timeout=0.01)
+        # Слушатель не запущен: очередь заполняется и не разбирается
+        for number in range(4):
+            handler.enqueue(self.record('событие %s', number))
+        handler.enqueue(self.record('ошибка', level=logging.ERROR))
+        self.assertEqual([handler.queue.get_nowait().getMessage() for _ in range(2)],
+                         ['событие 0', 'событие 1'])
+
+        handler.enqueue(self.record('событие после'))
+
+        self.assertEqual(handler.queue.get_nowait().getMessage(), 'событие после')
+        warning = handler.queue.get_nowait()
+        self.assertEqual(warning.levelno, logging.WARNING)
+        self.assertEqual(warning.getMessage(), 'Очередь журнала переполнена: потеряно записей: 3')
+
+    def test_unknown_overflow_policy_is_rejected(self):
+        with self.assertRaises(ValueError):
+            AuditQueueHandler(console=False, overflow='wait')
+
+
+class AuditEventTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('author', password='secret')
+
+    @staticmethod
+    def record_without_audit():
+        return logging.LogRecord('audit_events', logging.INFO, __file__, 0, 'текст', (), None)
+
+    def test_events_are_saved_in_one_insert(self):
+        # audit_event только передает событие логгеру; в таблицу его пишет обработчик
+        with self.assertLogs('audit_events', 'INFO') as logs:
+            audit_event(self.user, AuditEvent.ACTION_VIEW_ORDER, order_id=7)
+            audit_event('', AuditEvent.ACTION_EXPORT, filter={'filter_year': '2024'}, row_count=3)
+        plain = self.record_without_audit()
+
+        with self.assertNumQueries(1):
+            AuditEventHandler().emit_batch(logs.records + [plain])
+
+        self.assertEqual(list(AuditEvent.objects.order_by('pk').values_list(
+            'username', 'action', 'order_id', 'params')), [
+            ('author', AuditEvent.ACTION_VIEW_ORDER, 7, {}),
+            ('', AuditEvent.ACTION_EXPORT, None, {'filter': {'filter_year': '2024'}, 'row_count': 3}),
+        ])
+
+    def test_command_filters_by_user_order_action_and_period(self):
+        now = timezone.now()
+        AuditEvent.objects.bulk_create([
+            AuditEvent(username='author', action=AuditEvent.ACTION_VIEW_SCAN, order_id=1),
+            AuditEvent(username='author', action=AuditEvent.ACTION_VIEW_ORDER, order_id=1),
+            AuditEvent(username='other', action=AuditEvent.ACTION_VIEW_SCAN, order_id=1),
+            AuditEvent(username='author', action=AuditEvent.ACTION_VIEW_SCAN, order_id=2),
+            AuditEvent(username='author', action=AuditEvent.ACTION_VIEW_SCAN, order_id=1,
+                       created_at=now - timedelta(days=40)),
+        ])
+
+        def count(*args):
+            stdout = StringIO()
+            call_command('audit_events', '--count', *args, stdout=stdout)
+            return int(stdout.getvalue())
+
+        self.assertEqual(count(), 4)
+        self.assertEqual(count('--user', 'author', '--order', '1', '--action', 'view_scan'), 1)
+        self.assertEqual(count('--order', '1', '--action', 'view_scan', '--action', 'view_order'), 3)
+        self.assertEqual(count('--since', (now - timedelta(days=60)).date().isoformat()), 5)
+        self.assertEqual(count('--until', (now - timedelta(days=35)).date().isoformat(),
+                               '--since', (now - timedelta(days=60)).date().isoformat()), 1)
+
+        stdout = StringIO()
+        call_command('audit_events', '--jsonl', '--user', 'other', stdout=stdout)
+        event = json.loads(stdout.getvalue())
+        self.assertEqual((event['user'], event['action'], event['order_id']),
+                         ('other', AuditEvent.ACTION_VIEW_SCAN, 1))
+
+        with self.assertRaises(CommandError):
+            call_command('audit_events', '--since', 'вчера', stdout=StringIO())
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'ui-events-tests'},
+})
+class UiEventsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user('author', password='secret')
+
+    def setUp(self):
+        caches['default'].clear()
+
+    def post(self, count):
+        events = [{'type': 'ui', 'action_type': f'Окно {n}', 'age': 100} for n in range(count)]
+        return self.client.post(reverse('orders:log_events'), json.dumps({'events': events}),
+                                content_type='text/plain')
+
+    def test_anonymous_events_are_rejected(self):
+        self.assertEqual(self.post(3).status_code, 403)
+        self.assertFalse(AuditEvent.objects.exists())
+
+    def test_events_of_logged_in_user_are_saved(self):
+        self.client.force_login(self.user)
+
+        self.assertEqual(self.post(3).status_code, 204)
+
+        self.assertEqual(
+            list(AuditEvent.objects.values_list('username', 'action').distinct()),
+            [('author', AuditEvent.ACTION_UI)])
+        self.assertEqual(AuditEvent.objects.count(), 3)
+
+    def test_batch_limits(self):
+        self.client.force_login(self.user)
+        url = reverse('orders:log_events')
+
+        too_large = json.dumps({'events': [{'type': 'ui', 'action_type': 'x' * 70000}]})
+        self.assertEqual(self.client.post(url, too_large, content_type='text/plain').status_code, 413)
+        for payload in ('не json', '{"events": {}}', '{}'):
+            self.assertEqual(self.client.post(url, payload, content_type='text/plain').status_code, 400)
+        self.assertFalse(AuditEvent.objects.exists())
+
+        # Больше UI_EVENTS_MAX_COUNT событий в пакете — лишние отбрасываются
+        self.assertEqual(self.post(250).status_code, 204)
+        self.assertEqual(AuditEvent.objects.count(), 200)
+
+    def test_event_time_comes_from_clamped_age(self):
+        self.client.force_login(self.user)
+        events = [{'type': 'cancel', 'form_type': 'Добавление', 'age': 5000},
+                  {'type': 'ui', 'age': 10 ** 12}, {'type': 'ui', 'age': 'вчера'}, 'мусор']
+
+        before = timezone.now()
+        self.client.post(reverse('orders:log_events'), json.dumps({'events': events}),
+                         content_type='text/plain')
+
+        cancel, oldest, unknown_age = AuditEvent.objects.order_by('pk')
+        self.assertEqual(cancel.action, AuditEvent.ACTION_CANCEL)
+        self.assertEqual(cancel.params['form_type'], 'Добавление')
+        self.assertLess(cancel.created_at, before - timedelta(seconds=4))
+        self.assertGreater(oldest.created_at, before - timedelta(hours=1, seconds=5))
+        self.assertGreaterEqual(unknown_age.created_at, before)
+
+    @mock.patch('orders.views.UI_EVENTS_MAX_PER_MINUTE', 5)
+    def test_events_over_rate_limit_are_dropped(self):
+        self.client.force_login(self.user)
+
+        # Все пакеты — в одну минуту
+        with mock.patch('orders.views.timezone.now', return_value=timezone.now()):
+            self.assertEqual(self.post(3).status_code, 204)
+            self.assertEqual(self.post(3).status_code, 204)
+            with self.assertLogs('orders', 'WARNING'):
+                self.assertEqual(self.post(3).status_code, 429)
+
+        self.assertEqual(AuditEvent.objects.count(), 5)
+
+
+@override_settings(INSTRUMENTATION_ENABLED=True, INSTRUMENTATION_SERVER_TIMING=True,
+                   INSTRUMENTATION_FLUSH_INTERVAL=0)
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        # Поток записи показателей в этих тестах не запускается
+        patcher = mock.patch.object(StatBuffer, '_ensure_thread')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_template_is_rendered_by_django_not_by_middleware(self):
+        request = RequestFactory().get('/')
+        metrics = request._instrumentation = RequestMetrics()
+        response = TemplateResponse(request, 'orders/index.html', {})
+        middleware = InstrumentationMiddleware(lambda request: response)
+
+        self.assertIs(middleware.process_template_response(request, response), response)
+        self.assertFalse(response.is_rendered)
+        self.assertEqual(metrics.template_time, 0)
+
+        response.render()
+        self.assertTrue(response.is_rendered)
+        self.assertGreater(metrics.template_time, 0)
+        # Обертка снята, ответ можно закешировать
+        self.assertNotIn('render', vars(response))
+        pickle.dumps(response)
+
+    def test_request_is_measured_without_writing_stats(self):
+        create_order('001-к', date(2024, 1, 10))
+        with mock.patch('orders.instrumentation.save_stats') as save_stats, \
+                mock.patch('orders.views.audit_event'), self.assertLogs('user_actions_logger', 'INFO'):
+            response = Client().get(reverse('orders:index'))
+
+        self.assertEqual(response.status_code, 200)
+        timing = dict(part.split(';')[:2] for part in response['Server-Timing'].split(', '))
+        self.assertGreater(float(timing['tpl'].removeprefix('dur=')), 0)
+        self.assertIn('desc=', response['Server-Timing'])
+        save_stats.assert_not_called()
+
+
+class StatBufferThreadTests(TransactionTestCase):
+    def test_thread_flushes_stats_and_saves_the_rest_on_stop(self):
+        buffer = StatBuffer(flush_interval=0.05)
+        values = {'requests': 1, 'total_time': 12.0, 'queries': 3}
+        buffer.add('orders:index', 'GET', values, 12.0, '')
+
+        deadline = time.monotonic() + 5
+        while not RequestStat.objects.exists() and time.monotonic() < deadline:
+            time.sleep(0.02)
+        stat = RequestStat.objects.get()
+        self.assertEqual((stat.view, stat.requests, stat.queries), ('orders:index', 1, 3))
+
+        buffer.add('orders:index', 'GET', values, 30.0, '')
+        buffer.stop()
+        self.assertFalse(buffer._thread.is_alive())
+        stat.refresh_from_db()
+        self.assertEqual((stat.requests, stat.queries, stat.max_time), (2, 6, 30.0))
+
+
+class ScanStoreTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.source_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        self.addCleanup(shutil.rmtree, self.source_dir)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def write_source(self, content):
+        path = os.path.join(self.source_dir, 'scan.pdf')
+        with open(path, 'wb') as output:
+            output.write(content)
+        return path
+
+    def test_blob_is_independent_read_only_copy(self):
+        source = self.write_source(b'%PDF-1.4 original')
+        name, _ = store_scan(source)
+        blob_path = os.path.join(self.media_root, name)
+
+        # Правка исходного файла на месте не меняет blob
+        with open(source, 'r+b') as output:
+            output.write(b'%PDF-1.4 edited!')
+
+        self.assertEqual(file_sha256(blob_path), os.path.splitext(os.path.basename(name))[0])
+        self.assertEqual(stat.S_IMODE(os.stat(blob_path).st_mode), 0o444)
+        self.assertNotEqual(os.stat(blob_path).st_ino, os.stat(source).st_ino)
+
+    def test_reused_blob_is_protected_from_garbage_collection(self):
+        source = self.write_source(b'%PDF-1.4 reused')
+        name, _ = store_scan(source)
+        blob_path = os.path.join(self.media_root, name)
+        old = time.time() - 7 * 24 * 3600
+        os.utime(blob_path, (old, old))
+
+        self.assertEqual(store_scan(source), (name, STORED_EXISTING))
+        self.assertEqual(collect_garbage(set(), min_age=24 * 3600), (0, 0))
+        self.assertTrue(os.path.exists(blob_path))
+
+        os.utime(blob_path, (old, old))
+        removed, _ = collect_garbage(set(), min_age=24 * 3600)
+        self.assertEqual(removed, 1)
+        self.assertFalse(os.path.exists(blob_path))
+
+    def windows_file_rules(self):
+        """Как в Windows: файл только для чтения нельзя удалить или заменить."""
+        remove, replace = os.remove, os.replace
+
+        def check_writable(path):
+            if os.path.exists(path) and not os.stat(path).st_mode & stat.S_IWRITE:
+                raise PermissionError(13, 'Отказано в доступе', path)
+
+        def windows_remove(path):
+            check_writable(path)
+            remove(path)
+
+        def windows_replace(source, target):
+            check_writable(target)
+            replace(source, target)
+
+        for name, function in (('remove', windows_remove), ('replace', windows_replace)):
+            patcher = mock.patch(f'orders.scan_store.os.{name}', function)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_read_only_blob_is_collected_on_windows(self):
+        name, _ = store_scan(self.write_source(b'%PDF-1.4 windows'))
+        blob_path = os.path.join(self.media_root, name)
+        old = time.time() - 7 * 24 * 3600
+        os.utime(blob_path, (old, old))
+        self.windows_file_rules()
+
+        self.assertEqual(collect_garbage(set(), min_age=24 * 3600)[0], 1)
+        self.assertFalse(os.path.exists(blob_path))
+
+    def test_concurrently_stored_blob_is_kept_on_windows(self):
+        source = self.write_source(b'%PDF-1.4 race')
+        name, _ = store_scan(source)
+        self.windows_file_rules()
+
+        # Другой поток сохранил blob между проверкой и переименованием
+        with mock.patch('orders.scan_store.os.utime', side_effect=FileNotFoundError):
+            self.assertEqual(store_scan(source)[0], name)
+
+        self.assertEqual(os.listdir(os.path.dirname(os.path.join(self.media_root, name))),
+                         [os.path.basename(name)])
+
+
+@skipUnless(scan_previews.is_available(), 'нет PyMuPDF или pdftoppm')
+class ScanPreviewTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root, SCAN_SERVE_MODE='django')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch('orders.views.audit_event')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, text):
+        path = os.path.join(self.media_root, f'{text}.pdf')
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf(text))
+        name, _ = store_scan(path)
+        os.remove(path)
+        return name
+
+    def read_media(self, name):
+        with open(os.path.join(self.media_root, name), 'rb') as f:
+            return f.read()
+
+    def test_new_scan_gets_new_preview_address(self):
+        order = create_order('3-к', date(2024, 3, 1), scan=self.store('first scan'))
+        self.client.force_login(get_user_model().objects.create_user('reader'))
+        with self.assertLogs('user_actions_logger', 'INFO'):
+            detail = self.client.get(reverse('orders:detail_order', args=[order.pk]))
+        old_version = order.scan_version
+        self.assertContains(detail, f'?v={old_version}')
+
+        response = self.client.get(reverse('orders:order_scan_preview', args=[order.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        old_preview = b''.join(response.streaming_content)
+
+        order.scan = self.store('second scan')
+        order.save()
+        with self.assertLogs('user_actions_logger', 'INFO'):
+            detail = self.client.get(reverse('orders:detail_order', args=[order.pk]))
+        self.assertNotEqual(order.scan_version, old_version)
+        self.assertContains(detail, f'?v={order.scan_version}')
+
+        response = self.client.get(reverse('orders:order_scan_preview', args=[order.pk]))
+        new_preview = b''.join(response.streaming_content)
+        self.assertNotEqual(new_preview, old_preview)
+        self.assertEqual(new_preview, self.read_media(scan_previews.preview_name(order.scan.name)))
+
+    def test_scan_overwritten_in_place_is_rendered_again(self):
+        name = 'scans/1.pdf'
+        os.makedirs(os.path.join(self.media_root, 'scans'))
+        path = os.path.join(self.media_root, name)
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf('first scan'))
+        old_version = scan_previews.scan_version(name)
+        old_preview = self.read_media(scan_previews.ensure_preview(name))
+        # Повторный запрос не отрисовывает превью заново
+        with mock.patch('orders.scan_previews.get_renderer') as get_renderer:
+            scan_previews.ensure_preview(name)
+        get_renderer.assert_not_called()
+
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf('second scan'))
+        later = time.time() + 10
+        os.utime(path, (later, later))
+
+        self.assertNotEqual(scan_previews.scan_version(name), old_version)
+        self.assertNotEqual(self.read_media(scan_previews.ensure_preview(name)), old_preview)
+
+    def test_without_renderer(self):
+        order = create_order('4-к', date(2024, 3, 2), scan=self.store('scan'))
+        self.client.force_login(get_user_model().objects.create_user('reader'))
+
+        with mock.patch('orders.scan_previews.get_renderer', return_value=None), \
+                self.assertLogs('orders', 'WARNING'), self.assertLogs('django.request', 'WARNING'):
+            response = self.client.get(reverse('orders:order_scan_preview', args=[order.pk]))
+        self.assertEqual(response.status_code, 404)
+
+
+class StopWatch(Exception):
+    pass
+
+
+class BrokenPool:
+    """Пул, процесс которого завершился аварийно: все задачи падают с BrokenProcessPool."""
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_exception(BrokenProcessPool())
+        return future
+
+    def shutdown(self, wait=True, cancel_futures=False):
+        pass
+
+
+@skipUnless(scan_text.is_available(), 'нет PyMuPDF или pdftotext')
+class ExtractScanTextTests(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root)
+        settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        # Процессы пула (spawn) не видят MEDIA_ROOT теста
+        patcher = mock.patch('orders.management.commands.extract_scan_text.extraction_pool',
+                             side_effect=lambda workers: ThreadPoolExecutor(workers))
+        self.extraction_pool = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, text):
+        path = os.path.join(self.media_root, 'upload.pdf')
+        with open(path, 'wb') as f:
+            f.write(synthetic_pdf(text))
+        name, _ = store_scan(path)
+        os.remove(path)
+        return name
+
+    def extract(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('extract_scan_text', '--workers', '2', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def texts(self):
+        return {row.order.document_number: row for row in ScanText.objects.select_related('order')}
+
+    def test_watch_picks_up_orders_imported_later(self):
+        create_order('1-к', date(2024, 1, 1), scan=self.store('Vacation schedule for the year'))
+        imported = Order(document_number='2-к', issue_date=date(2024, 1, 2), document_title='Приказ 2-к',
+                         signed_by='Иванов И. И.', scan=self.store('Business trip of the department'))
+
+        def sleep(seconds):
+            if not Order.objects.filter(pk=imported.pk).exists():
+                # Как load_orders: bulk_create без сигналов
+                Order.objects.bulk_create([imported])
+                return
+            raise StopWatch
+
+        with mock.patch('orders.management.commands.extract_scan_text.time.sleep', side_effect=sleep), \
+                self.assertRaises(StopWatch):
+            self.extract('--watch', '--poll-interval', '0')
+
+        texts = self.texts()
+        self.assertEqual({number: row.status for number, row in texts.items()},
+                         {'1-к': ScanText.STATUS_DONE, '2-к': ScanText.STATUS_DONE})
+        self.assertIn('Business trip', texts['2-к'].text)
+
+    def test_failures_are_marked_and_do_not_stop_extraction(self):
+        broken = self.store('Damaged scan text layer here')
+        create_order('1-к', date(2024, 1, 1), scan=self.store('Vacation schedule for the year'))
+        create_order('2-к', date(2024, 1, 2), scan=broken)
+        real_extract = scan_text.extract_text
+
+        def extract_text(scan):
+            if scan == broken:
+                raise MemoryError('bad xref')
+            return real_extract(scan)
+
+        with mock.patch('orders.management.commands.extract_scan_text.extract_text', extract_text):
+            stdout, stderr = self.extract()
+
+        texts = self.texts()
+        self.assertEqual(texts['1-к'].status, ScanText.STATUS_DONE)
+        self.assertEqual(texts['2-к'].status, ScanText.STATUS_FAILED)
+        self.assertIn("MemoryError('bad xref')", texts['2-к'].error)
+        self.assertIn('не удалось: 1', stdout)
+
+    def test_broken_pool_is_recreated(self):
+        create_order('1-к', date(2024, 1, 1), scan=self.store('Vacation schedule for the year'))
+        create_order('2-к', date(2024, 1, 2), scan=self.store('Business trip of the department'))
+        self.extraction_pool.side_effect = [BrokenPool(), ThreadPoolExecutor(1)]
+
+        stdout, stderr = self.extract('--batch-size', '1')
+
+        self.assertEqual(self.extraction_pool.call_count, 2)
+        texts = self.texts()
+        self.assertEqual(texts['1-к'].status, ScanText.STATUS_FAILED)
+        self.assertEqual(texts['2-к'].status, ScanText.STATUS_DONE)
+        self.assertIn('завершился аварийно', stderr)
+
+        # Упавшие сканы повторяет --retry-failed
+        self.extraction_pool.side_effect = lambda workers: ThreadPoolExecutor(workers)
+        self.extract('--retry-failed')
+        self.assertEqual(self.texts()['1-к'].status, ScanText.STATUS_DONE)
+
+
+class ScanTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.by_title = create_order('1-к', date(2024, 1, 1), document_title='Об утверждении графика отпусков')
+        cls.by_scan = create_order('2-к', date(2024, 1, 2), document_title='О кадровых вопросах')
+        cls.by_both = create_order('3-к', date(2024, 1, 3), document_title='О переносе отпусков')
+        cls.pending = create_order('4-к', date(2024, 1, 4), document_title='О командировке')
+        create_order('5-к', date(2024, 1, 5), document_title='О премировании')
+        ScanText.objects.bulk_create([
+            ScanText(order=cls.by_scan, scan='a.pdf', status=ScanText.STATUS_DONE,
+                     text='Перенести часть ежегодного отпуска на декабрь'),
+            ScanText(order=cls.by_both, scan='b.pdf', status=ScanText.STATUS_DONE,
+                     text='Перенос отпусков сотрудникам отдела'),
+            ScanText(order=cls.pending, scan='c.pdf', status=ScanText.STATUS_PENDING),
+        ])
+
+    def test_title_and_scan_text_matches_are_ranked_together(self):
+        orders = list(filter_orders({'search': 'отпуск'}))
+
+        self.assertEqual(orders[0], self.by_both)
+        self.assertEqual(set(orders), {self.by_title, self.by_scan, self.by_both})
+        rank = {order.pk: order.rank for order in orders}
+        # Совпадение в названии весит больше совпадения в тексте скана
+        self.assertGreater(rank[self.by_title.pk], rank[self.by_scan.pk])
+
+    def test_match_in_scan_text_only(self):
+        self.assertEqual(list(filter_orders({'search': 'декабрь'})), [self.by_scan])
+        self.assertEqual(list(filter_orders({'search': 'командировка'})), [self.pending])
+
+
+class LoadOrdersTests(TestCase):
+    ROWS = [
+        {'Номер документа': '001-к', 'Дата издания': date(2024, 2, 1), 'Вид документа': 'Приказ',
+         'Наименование документа': 'Об отпуске', 'Подписант': 'Иванов И. И.'},
+        {'Номер документа': '002-р', 'Дата издания': date(2024, 2, 5), 'Вид документа': 'Распоряжение',
+         'Наименование документа': 'О дежурстве', 'Подписант': 'Петров П. П.'},
+    ]
+
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work_dir)
+        self.pdf_dir = os.path.join(self.work_dir, 'scans')
+        os.makedirs(self.pdf_dir)
+        self.excel_path = os.path.join(self.work_dir, 'orders.xlsx')
+
+    def write_excel(self, rows):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        columns = list(EXCEL_TO_MODEL_MAP)
+        sheet.append(columns)
+        for row in rows:
+            sheet.append([row.get(column) for column in columns])
+        workbook.save(self.excel_path)
+
+    def load(self, *args):
+        stdout = StringIO()
+        call_command('load_orders', self.excel_path, self.pdf_dir, *args,
+                     stdout=stdout, stderr=StringIO())
+        return stdout.getvalue()
+
+    def test_new_rows_are_inserted(self):
+        self.write_excel(self.ROWS)
+        output = self.load()
+
+        self.assertIn('Успешно создано 2 новых приказов.', output)
+        order = Order.objects.get(document_number='002-р')
+        self.assertEqual(order.doc_type, Order.DOC_TYPE_DECREE)
+        self.assertEqual(order.issue_date, date(2024, 2, 5))
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_unchanged_rows_are_skipped(self):
+        self.write_excel(self.ROWS)
+        self.load()
+
+        with CaptureQueriesContext(connection) as queries:
+            output = self.load()
+
+        self.assertIn('Без изменений: 2 приказов.', output)
+        self.assertIn('Успешно обновлено 0 существующих приказов.', output)
+        self.assertFalse([query for query in queries.captured_queries
+                          if query['sql'].startswith('INSERT INTO "orders_order"')])
+
+    def test_changed_row_is_updated_in_place(self):
+        self.write_excel(self.ROWS)
+        self.load()
+        order = Order.objects.get(document_number='001-к')
+
+        rows = [dict(self.ROWS[0], **{'Наименование документа': 'Об отпуске (изм.)'}), self.ROWS[1]]
+        self.write_excel(rows)
+        output = self.load()
+
+        self.assertIn('Успешно обновлено 1 существующих приказов (поля — document_title: 1).', output)
+        self.assertIn('Без изменений: 1 приказов.', output)
+        order.refresh_from_db()
+        self.assertEqual(order.document_title, 'Об отпуске (изм.)')
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_import_resumes_from_checkpoint(self):
+        self.write_excel(self.ROWS)
+        ImportCheckpoint.objects.create(
+            file_hash=file_sha256(self.excel_path), file_name='orders.xlsx', last_row=1)
+
+        output = self.load('--batch-size', '1')
+
+        self.assertIn('импорт продолжится со строки 2', output)
+        self.assertEqual(list(Order.objects.values_list('document_number', flat=True)), ['002-р'])
+        self.assertFalse(ImportCheckpoint.objects.exists())
+
+    def test_restart_ignores_checkpoint(self):
+        self.write_excel(self.ROWS)
+        ImportCheckpoint.objects.create(
+            file_hash=file_sha256(self.excel_path), file_name='orders.xlsx', last_row=2)
+
+        self.load('--restart')
+
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_readers_number_rows_alike(self):
+        # Пустая строка в середине листа и пробелы в конце
+        self.write_excel([self.ROWS[0], {}, {'Примечание': '  '}, self.ROWS[1], {}])
+
+        for read_rows in (LoadOrdersCommand._read_openpyxl, LoadOrdersCommand._read_pandas):
+            _, rows = read_rows(self.excel_path)
+            self.assertEqual([row['Номер документа'] for row in rows], ['001-к', '002-р'],
+                             read_rows.__name__)
+
+    def test_checkpoint_means_the_same_row_for_both_readers(self):
+        third = dict(self.ROWS[0], **{'Номер документа': '003-к'})
+        self.write_excel([self.ROWS[0], {}, self.ROWS[1], third])
+        # Строки 1–2 (001-к и 002-р) загружены при чтении openpyxl
+        ImportCheckpoint.objects.create(
+            file_hash=file_sha256(self.excel_path), file_name='orders.xlsx', last_row=2)
+
+        self.load('--reader', 'pandas')
+
+        self.assertEqual(list(Order.objects.values_list('document_number', flat=True)), ['003-к'])
+
+    def test_failed_chunk_stops_import_with_error(self):
+        self.write_excel(self.ROWS)
+
+        with mock.patch('orders.management.commands.load_orders.adjust_facets',
+                        side_effect=[None, RuntimeError('сбой БД')]):
+            with self.assertRaisesMessage(CommandError, 'повторный запуск продолжит импорт со строки 2'):
+                self.load('--batch-size', '1')
+
+        self.assertEqual(list(Order.objects.values_list('document_number', flat=True)), ['001-к'])
+        self.assertEqual(ImportCheckpoint.objects.get().last_row, 1)
+
+
+class BenchmarkCommandTests(TestCase):
+    def test_generated_orders_continue_numbering_and_are_reproducible(self):
+        create_order('005-к', date(2001, 3, 1))
+        generate = ['generate_orders', '40', '--start-year', '2001', '--years', '1', '--seed', '7']
+
+        call_command(*generate, stdout=StringIO())
+        first = list(Order.objects.exclude(document_number='005-к').order_by('pk').values_list(
+            'doc_type', 'issue_date', 'document_title'))
+        numbers = set(Order.objects.filter(issue_year=2001, doc_type=Order.DOC_TYPE_ORDER)
+                      .values_list('document_number', flat=True))
+        Order.objects.exclude(document_number='005-к').delete()
+        call_command(*generate, stdout=StringIO())
+
+        self.assertEqual(Order.objects.count(), 41)
+        self.assertIn('006-к', numbers)
+        self.assertNotIn('001-к', numbers)
+        self.assertEqual(first, list(Order.objects.exclude(document_number='005-к').order_by('pk')
+                                     .values_list('doc_type', 'issue_date', 'document_title')))
+        self.assertEqual(sum(OrderFacet.objects.values_list('count', flat=True)), 41)
+
+    def test_suite_rolls_back_data_and_reports_regressions(self):
+        work_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, work_dir)
+        output = os.path.join(work_dir, 'results.json')
+        baseline = os.path.join(work_dir, 'baseline.json')
+        with open(baseline, 'w', encoding='utf-8') as f:
+            json.dump({'meta': {'commit': 'abc1234'}, 'scenarios': {
+                'index': {'median': 0.001, 'p95': 0.001, 'queries': 1}}}, f)
+
+        stdout = StringIO()
+        call_command('benchmark_suite', '--orders', '30', '--repeat', '2', '--scenario', 'index',
+                     '--scenario', 'detail', '--output', output, '--compare', baseline,
+                     stdout=stdout)
+
+        self.assertEqual(Order.objects.count(), 0)
+        with open(output, encoding='utf-8') as f:
+            results = json.load(f)
+        self.assertEqual(set(results['scenarios']), {'index', 'detail'})
+        self.assertEqual(results['meta']['orders'], 30)
+        self.assertGreater(results['scenarios']['index']['queries'], 0)
+        self.assertIn('Регрессии: index median', stdout.getvalue())
+        self.assertIn('detail           нет в прошлых результатах', stdout.getvalue())
+
+    def test_percentile_uses_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 95), 95)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile([5], 99), 5)
+
+
+class FacetSignalTests(TestCase):
+    def counts(self):
+        return {(facet.issue_year, facet.doc_type): facet.count
+                for facet in OrderFacet.objects.filter(count__gt=0)}
+
+    def test_counters_follow_save_and_delete(self):
+        order = create_order('1', date(2023, 5, 1))
+        create_order('2', date(2023, 6, 1))
+        self.assertEqual(self.counts(), {(2023, 'order'): 2})
+
+        order.issue_date = date(2024, 1, 10)
+        order.doc_type = Order.DOC_TYPE_DECREE
+        order.save()
+        self.assertEqual(self.counts(), {(2023, 'order'): 1, (2024, 'decree'): 1})
+
+        order.save()
+        self.assertEqual(self.counts(), {(2023, 'order'): 1, (2024, 'decree'): 1})
+
+        order.delete()
+        self.assertEqual(self.counts(), {(2023, 'order'): 1})
+
+    def test_delete_uses_stored_values_not_stale_instance(self):
+        order = create_order('1', date(2023, 5, 1))
+        stale = Order.objects.get(pk=order.pk)
+        order.issue_date = date(2024, 1, 10)
+        order.save()
+
+        stale.delete()
+
+        self.assertEqual(self.counts(), {})
+
+    def test_clamped_decrement_is_logged(self):
+        create_order('1', date(2024, 1, 10))
+
+        with self.assertLogs('orders', 'WARNING') as logs:
+            adjust_facets({(2024, 'order'): -5})
+
+        self.assertEqual(self.counts(), {})
+        self.assertIn('rebuild_facets', logs.output[0])
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'orders.cache.TieredCache',
+                'OPTIONS': {'SHARED_CACHE': 'shared'}},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+               'LOCATION': 'result-cache-tests-shared'},
+    'registry': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                 'LOCATION': 'result-cache-tests'},
+})
+class ResultCacheTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches[REGISTRY_CACHE_ALIAS].clear()
+        for number, day in enumerate([1, 2, 3], 1):
+            create_order(str(number), date(2024, 3, day))
+        self.paginator = KeysetPaginator(Order.objects.order_by('-issue_date'), 2)
+
+    def test_equivalent_params_are_normalized_to_one_key(self):
+        self.assertEqual(
+            normalize_filter_params({'year': '2024', 'doc_type': 'order', 'search': '  о   приеме '}),
+            normalize_filter_params({'filter_year': '2024', 'filter_doc_type': 'order',
+                                     'search': 'о приеме'}))
+        self.assertEqual(normalize_filter_params({'filter_year': '20x4'}),
+                         normalize_filter_params({}))
+        self.assertEqual(normalize_filter_params({'filter_doc_num': ' 12-к '})['doc_num'], '12-к')
+
+        self.assertEqual(page_cache_key({'year': '2024', 'search': ' приказ '}, None, 20),
+                         page_cache_key({'filter_year': '2024', 'search': 'приказ'}, '', 20))
+        self.assertNotEqual(page_cache_key({}, None, 20), page_cache_key({}, None, 50))
+        self.assertNotEqual(page_cache_key({}, None, 20), page_cache_key({}, 'cursor', 20))
+
+    def test_cached_page_keeps_ids_and_cursors(self):
+        page = get_page(self.paginator, {}, None)
+
+        with self.assertNumQueries(1):
+            cached = get_page(self.paginator, {}, None)
+
+        self.assertEqual([order.pk for order in cached], [order.pk for order in page])
+        self.assertEqual(cached.next_cursor, page.next_cursor)
+        self.assertEqual(cached.previous_cursor, page.previous_cursor)
+        self.assertEqual(cached.start_index(), 1)
+
+    def test_invalidate_registry_drops_cached_pages(self):
+        page = get_page(self.paginator, {}, None)
+        key = page_cache_key({}, None, self.paginator.per_page)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            newest = create_order('4', date(2024, 3, 4))
+
+        self.assertIsNone(caches[REGISTRY_CACHE_ALIAS].get(key, version=registry_version()))
+        fresh = get_page(self.paginator, {}, None)
+        self.assertEqual(fresh.object_list[0].pk, newest.pk)
+        self.assertNotEqual(fresh.next_cursor, page.next_cursor)
+
+    def test_invalidation_waits_for_commit(self):
+        version = registry_version()
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            invalidate_registry()
+        self.assertEqual(registry_version(), version)
+
+        callbacks[0]()
+        self.assertEqual(registry_version(), version + 1)
+
+
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+               'LOCATION': 'tiered-cache-tests'},
+})
+class TieredCacheTests(TestCase):
+    """Два экземпляра TieredCache над общим кешем — как два процесса Gunicorn."""
+
+    def setUp(self):
+        caches['shared'].clear()
+        self.now = 1000.0
+        patcher = mock.patch('orders.cache.time.monotonic', side_effect=lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.first = self.make_cache()
+        self.second = self.make_cache()
+
+    @staticmethod
+    def make_cache():
+        return TieredCache('', {'OPTIONS': {
+            'SHARED_CACHE': 'shared', 'LOCAL_TIMEOUT': 30, 'NAMESPACE_TIMEOUT': 1}})
+
+    def test_versioned_value_is_shared_and_then_served_locally(self):
+        self.first.set('key', 'value', version=1)
+
+        self.assertEqual(self.second.get('key', version=1), 'value')
+        self.assertEqual(self.second.get('key', version=1), 'value')
+        self.assertEqual(self.second.stats()['shared_hits'], 1)
+        self.assertEqual(self.second.stats()['local_hits'], 1)
+
+    def test_local_copy_expires_after_local_timeout(self):
+        self.first.set('key', 'old', version=1)
+        self.second.get('key', version=1)
+        self.first.set('key', 'new', version=1)
+
+        self.assertEqual(self.second.get('key', version=1), 'old')
+        self.now += 31
+        self.assertEqual(self.second.get('key', version=1), 'new')
+
+    def test_unversioned_keys_are_not_cached_locally(self):
+        self.first.set('session', 'data')
+        self.assertEqual(self.second.get('session'), 'data')
+
+        # Удаление и incr в одном процессе сразу видны в другом
+        self.first.delete('session')
+        self.assertIsNone(self.second.get('session'))
+
+        self.second.add('quota', 0)
+        self.assertEqual(self.second.get('quota'), 0)
+        self.first.incr('quota', 5)
+        self.assertEqual(self.second.get('quota'), 5)
+        self.assertEqual(self.second.stats()['local_hits'], 0)
+
+    def test_delete_removes_both_tiers(self):
+        self.first.set('key', 'value', version=1)
+        self.first.delete('key', version=1)
+
+        self.assertIsNone(self.first.get('key', version=1))
+        self.assertIsNone(caches['shared'].get('key', version=1))
+
+    def test_bump_is_seen_at_once_locally_and_after_timeout_elsewhere(self):
+        self.assertEqual(self.first.namespace_version('registry'), 1)
+        self.assertEqual(self.second.namespace_version('registry'), 1)
+
+        self.assertEqual(self.first.bump_namespace('registry'), 2)
+
+        self.assertEqual(self.first.namespace_version('registry'), 2)
+        self.assertEqual(self.second.namespace_version('registry'), 1)
+        self.now += 2
+        self.assertEqual(self.second.namespace_version('registry'), 2)
+
+    def test_namespace_version_is_read_from_local_tier(self):
+        self.first.namespace_version('registry')
+
+        with mock.patch.object(caches['shared'], 'get') as shared_get:
+            self.first.namespace_version('registry')
+            self.first.namespace_version('registry')
+        shared_get.assert_not_called()
+
+    def test_versioned_entries_are_dropped_after_bump(self):
+        version = self.first.namespace_version('registry')
+        self.first.set('page', 'ids', version=version)
+
+        version = self.first.bump_namespace('registry')
+
+        self.assertIsNone(self.first.get('page', version=version))
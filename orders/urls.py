@@ -1,7 +1,8 @@
 from django.urls import path
 
 from orders.views import IndexView, AddOrderView, ExportToExcelView, OrderDetailView, OrderEditView, DeleteOrderView, \
-    log_cancel_action, log_ui_click
+    log_ui_events, ExportJobCreateView, ExportJobStatusView, ExportJobDownloadView, InstrumentationStatsView, \
+    InstrumentationProfileView, OrderScanView, OrderScanPreviewView
 
 app_name='orders'
 
@@ -11,7 +12,14 @@ urlpatterns = [
     path('<int:pk>/detail_order/', OrderDetailView.as_view(), name='detail_order'),
     path('<int:pk>/edit_order/', OrderEditView.as_view(), name='edit_order'),
     path('<int:pk>/delete_order/', DeleteOrderView.as_view(), name='delete_order'),
+    path('<int:pk>/scan/', OrderScanView.as_view(), name='order_scan'),
+    path('<int:pk>/scan/preview/', OrderScanPreviewView.as_view(), name='order_scan_preview'),
     path('export_to_excel/', ExportToExcelView.as_view(), name='export_to_excel'),
-    path('log_action/cancel/', log_cancel_action, name='log_cancel'),
-    path('log_action/ui_click/', log_ui_click, name='log_ui_click'),
+    path('export_jobs/', ExportJobCreateView.as_view(), name='export_job_create'),
+    path('export_jobs/<int:pk>/', ExportJobStatusView.as_view(), name='export_job_status'),
+    path('export_jobs/<int:pk>/download/', ExportJobDownloadView.as_view(), name='export_job_download'),
+    path('log_action/events/', log_ui_events, name='log_events'),
+    path('instrumentation/', InstrumentationStatsView.as_view(), name='instrumentation'),
+    path('instrumentation/profiles/<int:pk>/', InstrumentationProfileView.as_view(),
+         name='instrumentation_profile'),
 ]
\ No newline at end of file
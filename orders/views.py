@@ -1,24 +1,37 @@
+import json
 import logging
-from datetime import date
+from datetime import date, timedelta
 
-import openpyxl
 from django.conf import settings
 from django.contrib.auth.forms import AuthenticationForm
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.messages.views import SuccessMessageMixin
-from django.contrib.postgres.search import SearchVector, SearchQuery, SearchRank
 from django.core.cache import cache
 from django.db import IntegrityError
-from django.http import HttpResponse, JsonResponse, HttpResponseRedirect
-from django.shortcuts import render
-from django.urls import reverse_lazy
+from django.http import (FileResponse, Http404, HttpResponse, HttpResponseRedirect, JsonResponse,
+                         StreamingHttpResponse)
+from django.shortcuts import get_object_or_404, render
+from django.template.response import TemplateResponse
+from django.urls import reverse, reverse_lazy
+from django.utils import timezone
 from django.views import View
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_GET
-from django.views.generic import DetailView
-from django.views.generic import ListView, CreateView, UpdateView, DeleteView
-
+from django.views.decorators.http import require_POST
+from django.views.generic import CreateView, UpdateView, DeleteView
+
+from orders.audit import asave_events, audit_event
+from orders.downloads import is_range_start, protected_file_response, response_stream
+from orders.export import (DEFAULT_EXPORT_FORMAT, EXPORT_FIELD_MAP, EXPORT_WRITERS, get_export_columns,
+                           get_export_writer)
+from orders.export_jobs import submit_export_job
+from orders.facets import aget_facets
+from orders.filters import filter_orders, get_filter_params
 from orders.forms import OrderForm
-from orders.models import Order
+from orders.instrumentation import collect_stats
+from orders.models import AuditEvent, ExportJob, Order, RequestProfile
+from orders.pagination import KeysetPaginator
+from orders.result_cache import aget_page
+from orders.scan_previews import PreviewError, ensure_preview
 
 # Create your views here.
 # --- Настройка логгеров ---
@@ -27,52 +40,12 @@ action_logger = logging.getLogger('user_actions_logger')
 # Используем логгер для критических ошибок (Ошибки сервера)
 error_logger = logging.getLogger('orders')
 
-EXPORT_FIELD_MAP = {
-    'doc_type': 'Вид документа',
-    'document_number': 'Номер документа',
-    'issue_date': 'Дата издания',
-    'document_title': 'Наименование документа',
-    'signed_by': 'Подписант',
-    'responsible_executor': 'Ответственный исполнитель',
-    'transferred_to_execution': 'Передан на исполнение',
-    'transferred_for_storage': 'Передан на хранение',
-    'heraldic_blank_number': 'Номер геральдического бланка',
-    'note': 'Примечание'
-}
-
-
-@csrf_exempt
-def log_cancel_action(request):
-    """Принимает AJAX-запрос, логирует отмену и возвращает пустой ответ."""
-
-    if request.headers.get('x-requested-with') != 'XMLHttpRequest':
-        return JsonResponse({'status': 'not an ajax request'}, status=400)
-
-    user = request.user.username if request.user.is_authenticated else 'Anonymous'
-
-    # НОВАЯ ЛОГИКА: Сначала проверяем POST с данными формы
-    if request.method == 'POST':
-        form_type = request.POST.get('form_type', 'Неизвестная')
-        form_data = request.POST.get('form_data', 'Нет данных')
-
-        action_logger.info(
-            f"ОТМЕНА (POST): Пользователь '{user}' нажал 'Отмена' "
-            f"в модальном окне: {form_type}. "
-            f"Введенные данные: {form_data}"
-        )
-        return JsonResponse({'status': 'logged'})
-
-    # СТАРАЯ ЛОГИКА (оставлена для обратной совместимости, если JS не отправит
-    # POST)
-    if request.method == 'GET':
-        form_type = request.GET.get('form_type', 'Неизвестная')
-        action_logger.info(
-            f"ОТМЕНА (GET): Пользователь '{user}' нажал 'Отмена' "
-            f"в модальном окне: {form_type} (без данных)."
-        )
-        return JsonResponse({'status': 'logged'})
-
-    return JsonResponse({'status': 'not logged, invalid method'}, status=400)
+# Ограничения пакета событий интерфейса (log_ui_events)
+UI_EVENTS_MAX_BYTES = 64 * 1024
+UI_EVENTS_MAX_COUNT = 200
+UI_EVENTS_MAX_AGE_MS = 60 * 60 * 1000
+# Сколько событий интерфейса один пользователь может записать за минуту
+UI_EVENTS_MAX_PER_MINUTE = 600
 
 
 class OrderQuerysetMixin:
@@ -80,81 +53,84 @@ class OrderQuerysetMixin:
     Этот Mixin содержит логику для фильтрации и поиска queryset'а.
     Мы будем использовать его в IndexView и ExportToExcelView,
     чтобы экспорт соответствовал тому, что видит пользователь.
+    Сама фильтрация — в orders.filters.filter_orders (ее же используют
+    фоновые задачи экспорта).
     """
 
     def get_filtered_queryset(self, request):
-        queryset = Order.objects.all()
-        search = request.GET.get("search")
-        year = request.GET.get('filter_year') or request.GET.get('year')
-        filter_doc_num = request.GET.get("filter_doc_num")
-        doc_type = request.GET.get(
-            "filter_doc_type") or request.GET.get("doc_type")
+        return filter_orders(request.GET, request.user.username)
 
-        search_query_param = request.GET.get('q')
 
-        if search_query_param:
-            # --- ЛОГИРОВАНИЕ: Поиск/Фильтрация ---
-            action_logger.info(
-                f"Пользователь '{
-                    request.user.username}' выполнил поиск по запросу: '{search_query_param}'. ")
-
-        if year:
-            try:
-                year_int = int(year)
-                queryset = queryset.filter(issue_date__year=year_int)
-            except (ValueError, TypeError):
-                action_logger.warning(
-                    f"Неверный формат года '{year}' в фильтре от пользователя '{
-                        request.user.username}'.")
-                pass
-
-        if search:
-            query = SearchQuery(search, search_type='websearch')
-            vector = SearchVector('document_title')
-            queryset = queryset.annotate(
-                rank=SearchRank(vector, query)
-            ).filter(rank__gte=0.01).order_by('-rank', '-issue_date')
-
-        if filter_doc_num:
-            queryset = queryset.filter(
-                document_number__icontains=filter_doc_num)
-
-        if doc_type:
-            queryset = queryset.filter(doc_type=doc_type)
-
-        if not search:
-            queryset = queryset.order_by('-id')
+async def resolve_user(request):
+    """
+    Пользователь запроса для асинхронных представлений.
 
-        return queryset
+    request.auser() читает сессию и пользователя асинхронным ORM. Результат
+    подставляется в request.user, чтобы шаблоны и контекстный процессор auth
+    не вычисляли ленивый request.user еще раз синхронными запросами.
+    """
+    user = await request.auser()
+    request.user = user
+    return user
 
 
-class IndexView(OrderQuerysetMixin, ListView):
-    model = Order
+class IndexView(OrderQuerysetMixin, View):
+    """
+    Реестр приказов (асинхронное представление).
+
+    Под ASGI страница собирается без переходов в поток на каждое обращение:
+    пользователь — request.auser(), строки страницы и счетчики фильтров —
+    асинхронным ORM, кеши — их a-методами. Шаблон отрисовывается из уже
+    загруженных данных.
+    """
     template_name = 'orders/index.html'
     context_object_name = 'orders'
-
-    def get_year_choices(self):
-        years_cache_key = 'order_years_list'
-        years_list = cache.get(years_cache_key)
-
-        if years_list is None:
-            years = Order.objects.dates('issue_date', 'year', order='ASC')
-            years_list = [(year.year, year.year) for year in years]
-
-            cache.set(years_cache_key, years_list, timeout=3600)
-
-        return years_list
+    paginate_by = 50
+    # Имя GET-параметра с курсором keyset-пагинации
+    cursor_kwarg = 'cursor'
+
+    async def get(self, request, *args, **kwargs):
+        await resolve_user(request)
+        queryset = self.get_queryset()
+        paginator, page, object_list, is_paginated = await self.paginate_queryset(
+            queryset, self.paginate_by)
+        facets = await aget_facets()
+        context = self.get_context_data(
+            paginator=paginator, page_obj=page, is_paginated=is_paginated,
+            object_list=object_list, facets=facets)
+        return TemplateResponse(request, self.template_name, context)
+
+    def get_year_choices(self, facets):
+        # Годы и количество приказов берутся из счетчиков реестра (orders.facets),
+        # а не из агрегации по таблице приказов
+        return [(year, f'{year} ({count})') for year, count in facets['years']]
 
     def get_queryset(self):
         user = self.request.user if self.request.user.is_authenticated else 'Anonymous'
         queryset = self.get_filtered_queryset(self.request)
         action_logger.info(
-            f"ПРОСМОТР: Пользователь '{user}' просмотрел реестр. Параметры фильтрации: {
-                self.request.GET.urlencode()}")
+            "ПРОСМОТР: Пользователь '%s' просмотрел реестр. Параметры фильтрации: %s",
+            user, self.request.GET.urlencode())
+        audit_event(self.request.user, AuditEvent.ACTION_VIEW_REGISTRY,
+                    filter=get_filter_params(self.request.GET),
+                    cursor=bool(self.request.GET.get(self.cursor_kwarg)))
         return queryset
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
+    async def paginate_queryset(self, queryset, page_size):
+        """
+        Keyset-пагинация вместо стандартной OFFSET/LIMIT.
+
+        Страница выбирается по курсору (значения ключей сортировки граничной
+        строки), без COUNT(*) по всему реестру, поэтому время ответа не растет
+        с размером таблицы и номером страницы.
+        """
+        paginator = KeysetPaginator(queryset, page_size, key_casts={'rank': 'double precision'})
+        # Повторяющиеся комбинации фильтров отдаются из кеша результатов
+        page = await aget_page(paginator, self.request.GET, self.request.GET.get(self.cursor_kwarg))
+        return paginator, page, page.object_list, page.has_other_pages()
+
+    def get_context_data(self, facets, **kwargs):
+        context = {'view': self, self.context_object_name: kwargs['object_list'], **kwargs}
         context['page_title'] = 'Приказы'
         context["search"] = self.request.GET.get("search", "")
         context["filter_doc_num"] = self.request.GET.get("filter_doc_num", "")
@@ -162,7 +138,8 @@ class IndexView(OrderQuerysetMixin, ListView):
             "filter_year", date.today().year)
         context["selected_doc_type"] = self.request.GET.get(
             "filter_doc_type", "")
-        context["years"] = self.get_year_choices()
+        context["years"] = self.get_year_choices(facets)
+        context["doc_type_counts"] = facets['doc_types']
         context['order_form'] = OrderForm()
         context['login_form'] = AuthenticationForm()
         context['export_field_map'] = EXPORT_FIELD_MAP
@@ -171,39 +148,83 @@ class IndexView(OrderQuerysetMixin, ListView):
         return context
 
 
-class OrderDetailView(DetailView):
-    model = Order
+class OrderDetailView(View):
+    """Карточка приказа (асинхронное представление)."""
     template_name = 'orders/includes/inc__modal_order_detail.html'
     context_object_name = 'order'
 
-    def get(self, request, *args, **kwargs):
+    async def get(self, request, *args, **kwargs):
+        user = await resolve_user(request)
         try:
-            self.object = self.get_object()
+            order = await Order.objects.aget(pk=kwargs['pk'])
 
             # --- ЛОГИРОВАНИЕ: Просмотр деталей ---
             action_logger.info(
-                f"ПРОСМОТР: Пользователь '{
-                    request.user.username}' просмотрел приказ " f"ID: {
-                    self.object.pk}, Номер: {
-                    self.object.document_number}.")
-            context = self.get_context_data(object=self.object)
-            return self.render_to_response(context)
+                "ПРОСМОТР: Пользователь '%s' просмотрел приказ ID: %s, Номер: %s.",
+                user.username, order.pk, order.document_number)
+            audit_event(user, AuditEvent.ACTION_VIEW_ORDER, order.pk,
+                        document_number=order.document_number)
+            context = {'view': self, 'object': order, self.context_object_name: order}
+            return TemplateResponse(request, self.template_name, context)
         except Order.DoesNotExist:
             # --- ЛОГИРОВАНИЕ: Провал просмотра (объект не найден) ---
             action_logger.warning(
-                f"ПРОВАЛ: Попытка просмотра несуществующего приказа с PK={
-                    kwargs.get('pk')} " f"пользователем '{
-                    request.user.username}'.")
+                "ПРОВАЛ: Попытка просмотра несуществующего приказа с PK=%s пользователем '%s'.",
+                kwargs.get('pk'), user.username)
             return HttpResponse('Приказ не найден.', status=404)
         except Exception as e:
             # --- ЛОГИРОВАНИЕ: Критическая ошибка сервера ---
             error_logger.error(
-                f"КРИТИЧЕСКАЯ ОШИБКА: при просмотре деталей приказа PK={
-                    kwargs.get('pk')} " f"пользователем '{
-                    request.user.username}': {e}", exc_info=True)
+                "КРИТИЧЕСКАЯ ОШИБКА: при просмотре деталей приказа PK=%s пользователем '%s': %s",
+                kwargs.get('pk'), user.username, e, exc_info=True)
             return HttpResponse('Внутренняя ошибка сервера.', status=500)
 
 
+class OrderScanView(LoginRequiredMixin, View):
+    """
+    Скан приказа только для вошедших пользователей. Сам файл отдает
+    фронт-сервер (X-Accel-Redirect/X-Sendfile) или Django с поддержкой Range
+    и ETag (orders.downloads, настройка SCAN_SERVE_MODE).
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        order = get_object_or_404(Order.objects.only('pk', 'doc_type', 'document_number',
+                                                     'issue_date', 'scan'), pk=pk)
+        if not order.scan or not order.scan.storage.exists(order.scan.name):
+            raise Http404('Скан не найден.')
+
+        # Просмотрщик PDF запрашивает файл частями: в журнал попадает только
+        # открытие файла, а не каждый диапазон
+        if is_range_start(request):
+            action_logger.info(
+                "ПРОСМОТР: Пользователь '%s' открыл скан приказа ID: %s, Номер: %s.",
+                request.user.username, order.pk, order.document_number)
+            audit_event(request.user, AuditEvent.ACTION_VIEW_SCAN, order.pk,
+                        document_number=order.document_number)
+        return protected_file_response(request, order.scan.name, order.scan_display_name)
+
+
+class OrderScanPreviewView(LoginRequiredMixin, View):
+    """
+    Превью первой страницы скана для карточки приказа (orders.scan_previews).
+    Создается при первом запросе; адрес содержит версию скана, поэтому
+    браузер может хранить картинку без перепроверки.
+    """
+
+    def get(self, request, pk, *args, **kwargs):
+        order = get_object_or_404(Order.objects.only('pk', 'scan'), pk=pk)
+        if not order.scan:
+            raise Http404('Скан не найден.')
+        try:
+            name = ensure_preview(order.scan.name)
+        except PreviewError as e:
+            error_logger.warning("Превью скана приказа ID: %s недоступно: %s", order.pk, e)
+            raise Http404('Превью недоступно.')
+        return protected_file_response(
+            request, name, f'preview_{order.pk}.jpg', content_type='image/jpeg',
+            cache_control='private, max-age=31536000, immutable')
+
+
 class AddOrderView(SuccessMessageMixin, CreateView):
     model = Order
     form_class = OrderForm
@@ -213,8 +234,8 @@ class AddOrderView(SuccessMessageMixin, CreateView):
     def get(self, request, *args, **kwargs):
         # --- ЛОГИРОВАНИЕ: Открытие формы создания ---
         action_logger.info(
-            f"ОТКРЫТИЕ: Пользователь '{
-                request.user.username}' открыл форму для СОЗДАНИЯ приказа.")
+            "ОТКРЫТИЕ: Пользователь '%s' открыл форму для СОЗДАНИЯ приказа.",
+            request.user.username)
         return super().get(request, *args, **kwargs)
 
     def form_valid(self, form):
@@ -224,13 +245,14 @@ class AddOrderView(SuccessMessageMixin, CreateView):
 
             # --- ЛОГИРОВАНИЕ: Успешное создание ---
             action_logger.info(
-                f"УСПЕХ: Приказ №{
-                    self.object.document_number} (ID: {
-                    self.object.pk}) "
-                f"успешно создан пользователем '{
-                    self.request.user.username}'. "
-                f"Данные: {form.cleaned_data}"  # <--- ДОБАВЛЕНО
+                "УСПЕХ: Приказ №%s (ID: %s) "
+                "успешно создан пользователем '%s'. "
+                "Данные: %s",
+                self.object.document_number, self.object.pk,
+                self.request.user.username, form.cleaned_data
             )
+            audit_event(self.request.user, AuditEvent.ACTION_CREATE, self.object.pk,
+                        document_number=self.object.document_number)
 
             if self.request.headers.get(
                     'x-requested-with') == 'XMLHttpRequest':
@@ -240,8 +262,9 @@ class AddOrderView(SuccessMessageMixin, CreateView):
         except IntegrityError as e:
             # --- ЛОГИРОВАНИЕ: Ошибка целостности БД (например, дубликат номера) ---
             error_logger.warning(
-                f"ПРОВАЛ (DB): Пользователь '{self.request.user.username}' "
-                f"пытался создать приказ с ошибкой целостности данных: {e}"
+                "ПРОВАЛ (DB): Пользователь '%s' "
+                "пытался создать приказ с ошибкой целостности данных: %s",
+                self.request.user.username, e
             )
             # Передаем ошибку в форму, чтобы показать пользователю
             form.add_error(
@@ -250,8 +273,8 @@ class AddOrderView(SuccessMessageMixin, CreateView):
         except Exception as e:
             # --- ЛОГИРОВАНИЕ: Критическая ошибка сервера ---
             error_logger.error(
-                f"КРИТИЧЕСКАЯ ОШИБКА: при создании приказа пользователем '{
-                    self.request.user.username}': {e}", exc_info=True)
+                "КРИТИЧЕСКАЯ ОШИБКА: при создании приказа пользователем '%s': %s",
+                self.request.user.username, e, exc_info=True)
             # Передаем общую ошибку
             form.add_error(
                 None, "Произошла внутренняя ошибка сервера при сохранении.")
@@ -260,9 +283,10 @@ class AddOrderView(SuccessMessageMixin, CreateView):
     def form_invalid(self, form):
         errors = form.errors.as_data()
         action_logger.warning(
-            f"ПРОВАЛ (Валидация): Пользователь '{self.request.user.username}' "
-            f"не смог создать приказ. Ошибки: {errors}. "
-            f"Отправленные данные: {form.data}"  # <--- ДОБАВЛЕНО
+            "ПРОВАЛ (Валидация): Пользователь '%s' "
+            "не смог создать приказ. Ошибки: %s. "
+            "Отправленные данные: %s",
+            self.request.user.username, errors, form.data
         )
         if self.request.headers.get('x-requested-with') == 'XMLHttpRequest':
             return JsonResponse(
@@ -283,9 +307,8 @@ class OrderEditView(UpdateView):
 
             # --- ЛОГИРОВАНИЕ: Открытие формы редактирования ---
             action_logger.info(
-                f"ОТКРЫТИЕ: Пользователь '{
-                    request.user.username}' открыл форму для РЕДАКТИРОВАНИЯ приказа ID: {
-                    self.object.pk}.")
+                "ОТКРЫТИЕ: Пользователь '%s' открыл форму для РЕДАКТИРОВАНИЯ приказа ID: %s.",
+                request.user.username, self.object.pk)
 
             form = self.get_form()
             return render(
@@ -295,9 +318,9 @@ class OrderEditView(UpdateView):
                     form=form))
         except Order.DoesNotExist:
             action_logger.warning(
-                f"ПРОВАЛ: Попытка открыть редактирование несуществующего приказа с PK={
-                    kwargs.get('pk')} " f"пользователем '{
-                    request.user.username}'.")
+                "ПРОВАЛ: Попытка открыть редактирование несуществующего приказа с PK=%s "
+                "пользователем '%s'.",
+                kwargs.get('pk'), request.user.username)
             return HttpResponse('Приказ не найден.', status=404)
 
     def form_valid(self, form):
@@ -306,25 +329,29 @@ class OrderEditView(UpdateView):
             form.save()
             # --- ЛОГИРОВАНИЕ: Успешное обновление ---
             action_logger.info(
-                f"УСПЕХ: Приказ №{self.object.document_number} (ID: {self.object.pk}) "
-                f"успешно ОБНОВЛЕН пользователем '{self.request.user.username}'. "
-                f"Измененные данные: {submitted_data}"
+                "УСПЕХ: Приказ №%s (ID: %s) "
+                "успешно ОБНОВЛЕН пользователем '%s'. "
+                "Измененные данные: %s",
+                self.object.document_number, self.object.pk,
+                self.request.user.username, submitted_data
             )
+            audit_event(self.request.user, AuditEvent.ACTION_UPDATE, self.object.pk,
+                        document_number=self.object.document_number,
+                        changed_fields=form.changed_data)
             # Предполагаем, что это AJAX-ответ после успешного сохранения
             return render(self.request, 'orders/empty.html')
         except IntegrityError as e:
             error_logger.warning(
-                f"ПРОВАЛ (DB): Пользователь '{
-                    self.request.user.username}' " f"пытался обновить приказ (ID: {
-                    self.object.pk}) с ошибкой целостности: {e}")
+                "ПРОВАЛ (DB): Пользователь '%s' пытался обновить приказ (ID: %s) "
+                "с ошибкой целостности: %s",
+                self.request.user.username, self.object.pk, e)
             form.add_error(
                 None, "Ошибка обновления: возможно, приказ с таким номером уже существует.")
             return self.form_invalid(form)
         except Exception as e:
             error_logger.error(
-                f"КРИТИЧЕСКАЯ ОШИБКА: при обновлении приказа ID={
-                    self.object.pk} " f"пользователем '{
-                    self.request.user.username}': {e}",
+                "КРИТИЧЕСКАЯ ОШИБКА: при обновлении приказа ID=%s пользователем '%s': %s",
+                self.object.pk, self.request.user.username, e,
                 exc_info=True)
             form.add_error(
                 None, "Произошла внутренняя ошибка сервера при сохранении.")
@@ -334,12 +361,13 @@ class OrderEditView(UpdateView):
         # --- ЛОГИРОВАНИЕ: Ошибка валидации ---
         errors = form.errors.as_data()
         action_logger.warning(
-            f"ПРОВАЛ (Валидация): Пользователь '{self.request.user.username}' "
-            f"не смог обновить приказ (ID: {
-                self.object.pk if hasattr(
-                    self, 'object') and self.object else 'N/A'}). "
-            f"Ошибки: {errors}. "
-            f"Отправленные данные: {form.data}"  # <--- ДОБАВЛЕНО
+            "ПРОВАЛ (Валидация): Пользователь '%s' "
+            "не смог обновить приказ (ID: %s). "
+            "Ошибки: %s. "
+            "Отправленные данные: %s",
+            self.request.user.username,
+            self.object.pk if getattr(self, 'object', None) else 'N/A',
+            errors, form.data
         )
         return render(
             self.request,
@@ -360,17 +388,16 @@ class DeleteOrderView(DeleteView):
 
             # --- ЛОГИРОВАНИЕ: Открытие формы удаления ---
             action_logger.info(
-                f"ОТКРЫТИЕ: Пользователь '{
-                    request.user.username}' открыл подтверждение УДАЛЕНИЯ приказа ID: {
-                    self.object.pk}.")
+                "ОТКРЫТИЕ: Пользователь '%s' открыл подтверждение УДАЛЕНИЯ приказа ID: %s.",
+                request.user.username, self.object.pk)
 
             context = self.get_context_data(object=self.object)
             return render(request, self.template_name, context)
         except Order.DoesNotExist:
             action_logger.warning(
-                f"ПРОВАЛ: Попытка открыть форму удаления несуществующего приказа с PK={
-                    kwargs.get('pk')} " f"пользователем '{
-                    request.user.username}'.")
+                "ПРОВАЛ: Попытка открыть форму удаления несуществующего приказа с PK=%s "
+                "пользователем '%s'.",
+                kwargs.get('pk'), request.user.username)
             return HttpResponse('Приказ не найден.', status=404)
 
     def post(self, request, *args, **kwargs):
@@ -383,9 +410,12 @@ class DeleteOrderView(DeleteView):
 
             # --- ЛОГИРОВАНИЕ: Успешное удаление ---
             action_logger.info(
-                f"УСПЕХ: Пользователь '{request.user.username}' подтвердил и выполнил УДАЛЕНИЕ "
-                f"приказа №{document_number} (ID: {pk_to_delete})."
+                "УСПЕХ: Пользователь '%s' подтвердил и выполнил УДАЛЕНИЕ "
+                "приказа №%s (ID: %s).",
+                request.user.username, document_number, pk_to_delete
             )
+            audit_event(request.user, AuditEvent.ACTION_DELETE, pk_to_delete,
+                        document_number=document_number)
 
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                 return JsonResponse(
@@ -395,8 +425,9 @@ class DeleteOrderView(DeleteView):
         except Order.DoesNotExist:
             # --- ЛОГИРОВАНИЕ: Провал удаления (объект не найден) ---
             action_logger.warning(
-                f"ПРОВАЛ: Попытка POST-удаления несуществующего приказа с PK={kwargs.get('pk')} "
-                f"пользователем '{request.user.username}'."
+                "ПРОВАЛ: Попытка POST-удаления несуществующего приказа с PK=%s "
+                "пользователем '%s'.",
+                kwargs.get('pk'), request.user.username
             )
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                 return JsonResponse(
@@ -406,9 +437,8 @@ class DeleteOrderView(DeleteView):
         except Exception as e:
             # --- ЛОГИРОВАНИЕ: Критическая ошибка сервера ---
             error_logger.error(
-                f"КРИТИЧЕСКАЯ ОШИБКА: при удалении приказа PK={
-                    kwargs.get('pk')} " f"пользователем '{
-                    request.user.username}': {e}",
+                "КРИТИЧЕСКАЯ ОШИБКА: при удалении приказа PK=%s пользователем '%s': %s",
+                kwargs.get('pk'), request.user.username, e,
                 exc_info=True)
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                 return JsonResponse(
@@ -418,100 +448,302 @@ class DeleteOrderView(DeleteView):
 
 
 class ExportToExcelView(OrderQuerysetMixin, View):
-    DOC_TYPE_CHOICES = dict(Order.DOC_TYPE_CHOICES)
-
     def get(self, request, *args, **kwargs):
         selected_fields = request.GET.getlist('fields')
         # --- ЛОГИРОВАНИЕ: Инициализация экспорта ---
         action_logger.info(
-            f"ЭКСПОРТ: Пользователь '{
-                request.user.username}' инициировал экспорт. Выбраны поля: {
-                ', '.join(selected_fields)}.")
+            "ЭКСПОРТ: Пользователь '%s' инициировал экспорт. Выбраны поля: %s.",
+            request.user.username, ', '.join(selected_fields))
         if not selected_fields:
             # --- ЛОГИРОВАНИЕ: Провал экспорта (нет полей) ---
             action_logger.warning(
-                f"ПРОВАЛ: Экспорт отменен. Пользователь '{
-                    request.user.username}' " f"не выбрал ни одного поля для экспорта.")
+                "ПРОВАЛ: Экспорт отменен. Пользователь '%s' "
+                "не выбрал ни одного поля для экспорта.",
+                request.user.username)
             return HttpResponse(
                 "Ошибка: не выбрано ни одного поля для экспорта.",
                 status=400)
 
+        writer_class = get_export_writer(request.GET.get('format'))
+        if writer_class is None:
+            action_logger.warning(
+                "ПРОВАЛ: Экспорт отменен. Пользователь '%s' "
+                "запросил неизвестный или недоступный формат '%s'.",
+                request.user.username, request.GET.get('format'))
+            return HttpResponse(
+                "Ошибка: формат экспорта не поддерживается.",
+                status=400)
+
         try:
             queryset = self.get_filtered_queryset(request)
+            _, field_names = get_export_columns(selected_fields)
+            writer = writer_class(queryset, field_names)
+
+            response = StreamingHttpResponse(
+                response_stream(request, self.stream_export(writer, request)),
+                content_type=writer.content_type)
+            response['Content-Disposition'] = (
+                f'attachment; filename=orders_export.{writer.extension}')
+            return response
 
-            headers = []
-            valid_field_names = []
+        except Exception as e:
+            # --- ЛОГИРОВАНИЕ: Критическая ошибка экспорта ---
+            error_logger.error(
+                "КРИТИЧЕСКАЯ ОШИБКА: при экспорте приказов "
+                "пользователем '%s': %s",
+                request.user.username, e,
+                exc_info=True
+            )
+            return HttpResponse(
+                "Внутренняя ошибка сервера при экспорте.",
+                status=500)
 
-            for field_name, field_label in EXPORT_FIELD_MAP.items():
-                if field_name in selected_fields:
-                    headers.append(field_label)
-                    valid_field_names.append(field_name)
+    def stream_export(self, writer, request):
+        """
+        Отдает файл по частям. Ответ уже начат, поэтому ошибка на середине
+        выгрузки только логируется — клиент получит оборванный файл.
+        """
+        try:
+            yield from writer
+        except Exception as e:
+            # --- ЛОГИРОВАНИЕ: Критическая ошибка экспорта ---
+            error_logger.error(
+                "КРИТИЧЕСКАЯ ОШИБКА: при потоковом экспорте приказов "
+                "пользователем '%s': %s",
+                request.user.username, e,
+                exc_info=True
+            )
+            raise
 
-            orders_data = queryset.values_list(*valid_field_names)
+        # --- ЛОГИРОВАНИЕ: Успешный экспорт ---
+        action_logger.info(
+            "УСПЕХ: Пользователь '%s' "
+            "успешно экспортировал %s приказов (%s).",
+            request.user.username, writer.row_count, writer.extension
+        )
+        audit_event(request.user, AuditEvent.ACTION_EXPORT,
+                    filter=get_filter_params(request.GET), fields=writer.field_names,
+                    format=writer.extension, row_count=writer.row_count)
 
-            workbook = openpyxl.Workbook()
-            sheet = workbook.active
-            sheet.append(headers)
 
-            doc_type_index = None
-            try:
-                doc_type_index = valid_field_names.index('doc_type')
-            except ValueError:
-                pass
+class ExportJobCreateView(LoginRequiredMixin, View):
+    """
+    Ставит фоновую задачу экспорта и сразу возвращает ее статус.
+    Повторное нажатие с теми же параметрами вернет уже идущую задачу.
+    """
+    # AJAX-запросу нужен код ответа, а не перенаправление на страницу входа
+    raise_exception = True
 
-            for order_tuple in orders_data:
-                row = list(order_tuple)
+    def post(self, request, *args, **kwargs):
+        selected_fields = [
+            field for field in request.POST.getlist('fields')
+            if field in EXPORT_FIELD_MAP
+        ]
+        if not selected_fields:
+            action_logger.warning(
+                "ПРОВАЛ: Фоновый экспорт отменен. Пользователь '%s' "
+                "не выбрал ни одного поля для экспорта.",
+                request.user.username)
+            return JsonResponse(
+                {'success': False, 'error': 'Не выбрано ни одного поля для экспорта.'},
+                status=400)
 
-                for i, value in enumerate(row):
-                    if isinstance(value, date):
-                        row[i] = value.strftime('%d.%m.%Y')
-                    elif i == doc_type_index and value:
-                        row[i] = self.DOC_TYPE_CHOICES.get(value, value)
-                    elif value is None:
-                        row[i] = ''
+        export_format = request.POST.get('format') or DEFAULT_EXPORT_FORMAT
+        if get_export_writer(export_format) is None:
+            return JsonResponse(
+                {'success': False, 'error': 'Формат экспорта не поддерживается.'},
+                status=400)
 
-                sheet.append(row)
+        params = get_filter_params(request.POST)
+        job, created = submit_export_job(params, selected_fields, export_format, request.user)
 
-            response = HttpResponse(
-                content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-            response['Content-Disposition'] = 'attachment; filename=orders_export.xlsx'
-            workbook.save(response)
+        # --- ЛОГИРОВАНИЕ: Постановка фонового экспорта ---
+        action_logger.info(
+            "ЭКСПОРТ: Пользователь '%s' %s фоновый экспорт #%s. "
+            "Фильтр: %s. Выбраны поля: %s.",
+            request.user.username, 'поставил в очередь' if created else 'повторно запросил',
+            job.pk, params, ', '.join(selected_fields))
+        audit_event(request.user, AuditEvent.ACTION_EXPORT_JOB, job_id=job.pk, created=created,
+                    filter=params, fields=selected_fields, format=export_format)
 
-            # --- ЛОГИРОВАНИЕ: Успешный экспорт ---
-            action_logger.info(
-                f"УСПЕХ: Пользователь '{request.user.username}' "
-                f"успешно экспортировал {len(orders_data)} приказов."
-            )
+        return JsonResponse(export_job_payload(job), status=202 if created else 200)
 
-            return response
 
-        except Exception as e:
-            # --- ЛОГИРОВАНИЕ: Критическая ошибка экспорта ---
-            error_logger.error(
-                f"КРИТИЧЕСКАЯ ОШИБКА: при экспорте приказов "
-                f"пользователем '{request.user.username}': {e}",
-                exc_info=True
-            )
-            return HttpResponse(
-                "Внутренняя ошибка сервера при экспорте.",
-                status=500)
+class ExportJobMixin(LoginRequiredMixin):
+    """
+    Доступ к задаче экспорта есть только у ее автора и персонала (задачи
+    удаленных пользователей — только у персонала).
+    """
+    raise_exception = True
+
+    def get_job(self, request, pk):
+        job = get_object_or_404(ExportJob, pk=pk)
+        if job.created_by_id != request.user.pk and not request.user.is_staff:
+            raise Http404('Задача экспорта не найдена.')
+        return job
+
+
+class ExportJobStatusView(ExportJobMixin, View):
+    def get(self, request, pk, *args, **kwargs):
+        return JsonResponse(export_job_payload(self.get_job(request, pk)))
+
+
+class ExportJobDownloadView(ExportJobMixin, View):
+    def get(self, request, pk, *args, **kwargs):
+        job = self.get_job(request, pk)
+        if job.status != ExportJob.STATUS_DONE or not job.file:
+            return HttpResponse('Файл экспорта еще не готов.', status=409)
+
+        # --- ЛОГИРОВАНИЕ: Скачивание результата экспорта ---
+        action_logger.info(
+            "УСПЕХ: Пользователь '%s' скачал результат "
+            "фонового экспорта #%s (%s приказов).",
+            request.user.username, job.pk, job.row_count)
+        audit_event(request.user, AuditEvent.ACTION_EXPORT_DOWNLOAD, job_id=job.pk,
+                    filter=job.params, row_count=job.row_count)
+        writer_class = EXPORT_WRITERS[job.export_format]
+        return FileResponse(
+            job.file.open('rb'), as_attachment=True,
+            filename=f'orders_export.{writer_class.extension}',
+            content_type=writer_class.content_type)
+
+
+class SuperuserRequiredMixin(UserPassesTestMixin):
+    raise_exception = True
+
+    def test_func(self):
+        return self.request.user.is_superuser
+
+
+class InstrumentationStatsView(SuperuserRequiredMixin, View):
+    """
+    Показатели запросов по представлениям (orders.instrumentation) и список
+    последних профилей cProfile. ?sort= — поле сортировки RequestStat
+    (по умолчанию -total_time), ?view= — подстрока имени представления.
+    """
+    sort_fields = {'total_time', 'requests', 'max_time', 'db_time', 'queries', 'duplicate_queries'}
+
+    def get(self, request, *args, **kwargs):
+        sort = request.GET.get('sort', '-total_time')
+        if sort.lstrip('-') not in self.sort_fields:
+            sort = '-total_time'
+        profiles = RequestProfile.objects.order_by('-created_at').values(
+            'pk', 'created_at', 'view', 'method', 'path', 'status_code', 'total_time', 'queries')[:50]
+        return JsonResponse({
+            'stats': collect_stats(sort, request.GET.get('view', '')),
+            'profiles': [
+                {**profile, 'url': reverse('orders:instrumentation_profile', args=[profile['pk']])}
+                for profile in profiles
+            ],
+        })
+
+
+class InstrumentationProfileView(SuperuserRequiredMixin, View):
+    """Текст pstats одного профиля (по накопленному времени)."""
+
+    def get(self, request, pk, *args, **kwargs):
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        header = (f'{profile.method} {profile.path} -> {profile.status_code}, '
+                  f'{profile.total_time:.1f} мс, запросов к БД: {profile.queries}\n\n')
+        return HttpResponse(header + profile.stats, content_type='text/plain; charset=utf-8')
+
+
+def export_job_payload(job):
+    payload = {
+        'success': job.status != ExportJob.STATUS_FAILED,
+        'job_id': job.pk,
+        'format': job.export_format,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'row_count': job.row_count,
+        'status_url': reverse('orders:export_job_status', args=[job.pk]),
+    }
+    if job.status == ExportJob.STATUS_DONE:
+        payload['download_url'] = reverse('orders:export_job_download', args=[job.pk])
+    if job.status == ExportJob.STATUS_FAILED:
+        payload['error'] = 'Не удалось сформировать файл экспорта.'
+    return payload
+
+
+async def take_ui_events_quota(user, now, count):
+    """
+    Сколько из count событий пользователь еще может записать в текущую
+    минуту. Счетчик — в общем кеше, поэтому лимит общий для всех процессов.
+    """
+    key = f'ui-events:{user.pk}:{int(now.timestamp()) // 60}'
+    await cache.aadd(key, 0, timeout=60)
+    used = await cache.aincr(key, count)
+    return max(min(count, UI_EVENTS_MAX_PER_MINUTE - (used - count)), 0)
 
 
-@require_GET
-def log_ui_click(request):
+@csrf_exempt
+@require_POST
+async def log_ui_events(request):
     """
-    Принимает AJAX-запрос для логирования простых UI-действий,
-    например, открытия модальных окон.
+    Принимает пакет событий интерфейса (открытия окон, отмены форм), который
+    браузер копит и отправляет через navigator.sendBeacon раз в 30 секунд
+    (см. index.html) или при уходе со страницы. Все события пакета
+    сохраняются одним INSERT.
+
+    Тело — JSON {"events": [{"type": "ui"|"cancel", "age": мс, ...}, ...]};
+    age — сколько миллисекунд назад произошло событие (часы клиента не нужны).
+    sendBeacon не умеет передавать заголовки, поэтому CSRF-проверки нет.
+    Взамен события принимаются только от вошедших пользователей (sendBeacon
+    отправляет cookie сессии) и не чаще UI_EVENTS_MAX_PER_MINUTE в минуту
+    на пользователя: остальные отбрасываются с ответом 429.
     """
-    if not request.headers.get('x-requested-with') == 'XMLHttpRequest':
-        return JsonResponse({'status': 'not an ajax request'}, status=400)
-
-    user = request.user.username if request.user.is_authenticated else 'Anonymous'
-    action_type = request.GET.get('action_type', 'Неизвестное UI-действие')
-
-    # Используем тот же логгер, что и для других действий
-    action_logger.info(
-        f"UI ДЕЙСТВИЕ: Пользователь '{user}' "
-        f"выполнил: {action_type}."
-    )
-    return JsonResponse({'status': 'logged'})
+    request_user = await resolve_user(request)
+    if not request_user.is_authenticated:
+        return JsonResponse({'status': 'forbidden'}, status=403)
+    if len(request.body) > UI_EVENTS_MAX_BYTES:
+        return JsonResponse({'status': 'too large'}, status=413)
+    try:
+        events = json.loads(request.body)['events']
+        if not isinstance(events, list):
+            raise TypeError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'status': 'bad payload'}, status=400)
+
+    now = timezone.now()
+    events = events[:UI_EVENTS_MAX_COUNT]
+    allowed = await take_ui_events_quota(request_user, now, len(events))
+    if events and not allowed:
+        error_logger.warning("Пользователь '%s' превысил лимит событий интерфейса: "
+                             "пакет из %s событий отброшен.", request_user.username, len(events))
+        return JsonResponse({'status': 'too many events'}, status=429)
+
+    user = request_user.username
+    records = []
+    for event in events[:allowed]:
+        if not isinstance(event, dict):
+            continue
+        try:
+            age = min(max(int(event.get('age', 0)), 0), UI_EVENTS_MAX_AGE_MS)
+        except (TypeError, ValueError):
+            age = 0
+        created_at = now - timedelta(milliseconds=age)
+
+        if event.get('type') == 'cancel':
+            form_type = str(event.get('form_type') or 'Неизвестная')[:100]
+            form_data = str(event.get('form_data') or 'Нет данных')[:2000]
+            action_logger.info(
+                "ОТМЕНА: Пользователь '%s' нажал 'Отмена' "
+                "в модальном окне: %s. "
+                "Введенные данные: %s",
+                user, form_type, form_data
+            )
+            records.append({'action': AuditEvent.ACTION_CANCEL, 'created_at': created_at,
+                            'params': {'form_type': form_type, 'form_data': form_data}})
+        elif event.get('type') == 'ui':
+            action_type = str(event.get('action_type') or 'Неизвестное UI-действие')[:200]
+            action_logger.info(
+                "UI ДЕЙСТВИЕ: Пользователь '%s' "
+                "выполнил: %s.",
+                user, action_type
+            )
+            records.append({'action': AuditEvent.ACTION_UI, 'created_at': created_at,
+                            'params': {'action_type': action_type}})
+
+    if records:
+        await asave_events(request_user, records)
+    return HttpResponse(status=204)